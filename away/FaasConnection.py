@@ -1,13 +1,59 @@
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import ConnectionError
 import subprocess
 import os
 import yaml
 import platform
 import warnings
-
+import threading
+import weakref
+import json
+from hashlib import sha256
+from time import monotonic
+
+from .__async_transport import AsyncTransport
+from .retry import RetryPolicy
+from .circuit_breaker import CircuitBreaker
+from .hedging import Hedger
+from .protocol import PROTOCOL_CODECS
 from .exceptions import FaasReturnedError, FaasServiceUnavailableException, EnsureException
 
+class KeepalivePool():
+    """
+    Mixin of urllib3 connection pools that closes each pooled connection idle for longer than `keepalive_timeout`
+    seconds when it is checked out. The connection is then re-established by its next request
+    """
+    keepalive_timeout = None
+
+    def _get_conn(self, timeout: float | None = None):
+        conn = super()._get_conn(timeout)
+        idle_since = getattr(conn, 'away_idle_since', None)
+        if idle_since is not None and monotonic() - idle_since > self.keepalive_timeout:
+            conn.close()
+        return conn
+
+    def _put_conn(self, conn):
+        if conn is not None: conn.away_idle_since = monotonic()
+        super()._put_conn(conn)
+
+class KeepaliveHTTPAdapter(HTTPAdapter):
+    """
+    An `HTTPAdapter` whose pooled connections expire one at a time, once idle for longer than `keepalive_timeout` seconds
+    """
+
+    def __init__(self, keepalive_timeout: float, **kwargs):
+        # set before `HTTPAdapter.__init__`, which creates the pool manager
+        self.keepalive_timeout = keepalive_timeout
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: type(f'Keepalive{pool_class.__name__}', (KeepalivePool, pool_class), {'keepalive_timeout': self.keepalive_timeout})
+            for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
 class FaasConnection():
 
     def __init__(self,
@@ -16,11 +62,36 @@ class FaasConnection():
         user: str = 'admin',
         password: str = None,
         ensure_available: bool = True,
-        server_architecture: str | None = None):
+        server_architecture: str | None = None,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        pool_block: bool = False,
+        keepalive_timeout: float | None = None,
+        async_pool_maxsize: int = 100,
+        retry: RetryPolicy | None = None):
 
         self.address = f'{provider}:{port}'
         self.auth_address = None
 
+        # Keep-alive connection pool shared by every proxy built from this connection
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keepalive_timeout = keepalive_timeout
+        self.__session = None
+        self.__session_lock = threading.Lock()
+        self.__async_transport = AsyncTransport(pool_maxsize=async_pool_maxsize, keepalive_timeout=keepalive_timeout)
+
+        # Default retry policy for the proxies built from this connection
+        self.retry_policy = retry
+
+        # Circuit breakers, shared by all the proxies of a function
+        self.__circuit_breakers = {}
+        self.__circuit_breakers_lock = threading.Lock()
+
+        # Hedgers of the proxies built from this connection, closed along with it
+        self.__hedgers = weakref.WeakSet()
+
         if ensure_available: self.ensure_available()
 
         has_user = user is not None
@@ -38,6 +109,84 @@ class FaasConnection():
         
         self.server_architecture = server_architecture
 
+    def get_session(self) -> requests.Session:
+        """
+        Returns the pooled, keep-alive `requests.Session` of this connection, creating it on first use.
+        Each connection idle for longer than `keepalive_timeout` seconds is dropped and re-established, see `KeepaliveHTTPAdapter`
+
+        The session is safe to share between threads: each request checks out its own connection from the pool
+        """
+        with self.__session_lock:
+            if self.__session is None:
+                pool_kwargs = dict(
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=self.pool_maxsize,
+                    pool_block=self.pool_block
+                )
+                adapter = HTTPAdapter(**pool_kwargs) if self.keepalive_timeout is None else KeepaliveHTTPAdapter(self.keepalive_timeout, **pool_kwargs)
+                self.__session = requests.Session()
+                self.__session.mount('http://', adapter)
+                self.__session.mount('https://', adapter)
+            return self.__session
+
+    def get_async_transport(self) -> AsyncTransport:
+        """
+        Returns the non-blocking transport used by async proxies. Its connections are pooled per event loop
+        """
+        return self.__async_transport
+
+    def get_circuit_breaker(self, fn_name: str, **kwargs) -> CircuitBreaker:
+        """
+        Returns the circuit breaker of a function, shared by every proxy of the function built from this connection.
+        The breaker is created with `kwargs` as settings the first time it is requested
+
+        arguments:
+            fn_name: The name of the function in the OpenFaaS provider
+        """
+        with self.__circuit_breakers_lock:
+            if fn_name not in self.__circuit_breakers:
+                self.__circuit_breakers[fn_name] = CircuitBreaker(**kwargs)
+
+            return self.__circuit_breakers[fn_name]
+
+    def add_hedger(self, hedger: Hedger):
+        """
+        Registers the hedger of a proxy built from this connection, so that `close` lets its threads go
+        """
+        self.__hedgers.add(hedger)
+
+    def close(self):
+        """
+        Closes the pooled connections of sync proxies. Proxies built from this FaasConnection remain usable.
+        Connections of async proxies are closed by `aclose`, or by using this FaasConnection as an `async with` block
+        """
+        with self.__session_lock:
+            if self.__session is not None:
+                self.__session.close()
+                self.__session = None
+
+        for hedger in list(self.__hedgers):
+            hedger.close()
+
+    async def aclose(self):
+        """
+        Closes the pooled connections that async proxies opened from the running event loop
+        """
+        await self.__async_transport.aclose()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+        await self.aclose()
+
     def __cli_login(self, user: str, password: str | int):
         """
         Authenticates with the OpenFaaS server via CLI
@@ -60,7 +209,7 @@ class FaasConnection():
         Attempts to check health of the OpenFaaS server, and raises an exception if it is unavailable
         """
         try:
-            r = requests.get(f'http://{self.address}/healthz')
+            r = self.get_session().get(f'http://{self.address}/healthz')
             if r.status_code != 200:
                 raise EnsureException(f'FaaS \'healthz\ check failed: status_code={r.status_code}, r={r.text}')
         except ConnectionError:
@@ -85,7 +234,7 @@ class FaasConnection():
         """
         self.ensure_auth()
 
-        res = requests.get(
+        res = self.get_session().get(
             f'http://{self.auth_address}/system/functions',
             headers={'Content-Type': 'application/json'}
             )
@@ -138,24 +287,25 @@ class FaasConnection():
         if not self.is_auth():
             raise EnsureException(f'OpenFaaS connection is not auth:\n{self}')
 
-    def create_from_template(self, registry_prefix: str, fn_name: str):
+    def create_from_template(self, registry_prefix: str, fn_name: str, template: str = 'python3'):
         """
         Creates the files for an OpenFaaS templated function 
 
         arguments:
             fn_name: The name of the function files to be created
             regsitry_prefix: The prefix of the registry where to store the function
+            template: The name of the template in the OpenFaaS template store
         """
-        if not os.path.isdir('template'):
+        if not os.path.isdir(os.path.join('template', template)):
             # Re-pull template if not present
             subprocess.run(
-                ['faas', 'template', 'store', 'pull', 'python3'],
+                ['faas', 'template', 'store', 'pull', template],
                 check=True
             )
 
         # Create templated function
         subprocess.run(
-            ['faas', 'new', '--lang', 'python3', '--prefix', registry_prefix, '--quiet', fn_name],
+            ['faas', 'new', '--lang', template, '--prefix', registry_prefix, '--quiet', fn_name],
             check=True
         )
 
@@ -208,7 +358,7 @@ class FaasConnection():
         self.ensure_auth()
         
         endpoint = f'http://{self.auth_address}/system/function/{fn_name}?usage=1'
-        res = requests.get(endpoint, headers={'Content-Type' : 'application/json'})
+        res = self.get_session().get(endpoint, headers={'Content-Type' : 'application/json'})
 
         if res.status_code != 200:
             raise FaasReturnedError(res)
@@ -216,6 +366,46 @@ class FaasConnection():
         description = yaml.load(res.text, Loader=yaml.Loader)
         return description.get('annotations', {})
 
+    def get_function_fingerprint(self, fn_name: str) -> str:
+        """
+        Returns a fingerprint of the current deployment of a function, which changes when the function is redeployed
+
+        arguments:
+            fn_name: The name of the function in the OpenFaaS provider
+        """
+        self.ensure_auth()
+
+        endpoint = f'http://{self.auth_address}/system/function/{fn_name}'
+        res = self.get_session().get(endpoint, headers={'Content-Type' : 'application/json'})
+
+        if res.status_code != 200:
+            raise FaasReturnedError(res)
+
+        return self.__fingerprint_description(res.json())
+
+    async def aget_function_fingerprint(self, fn_name: str) -> str:
+        """
+        Async version of `get_function_fingerprint`
+
+        arguments:
+            fn_name: The name of the function in the OpenFaaS provider
+        """
+        self.ensure_auth()
+
+        endpoint = f'http://{self.auth_address}/system/function/{fn_name}'
+        res = await self.__async_transport.request('GET', endpoint, headers={'Content-Type' : 'application/json'})
+
+        if res.status_code != 200:
+            raise FaasReturnedError(res)
+
+        return self.__fingerprint_description(json.loads(res.content))
+
+    @staticmethod
+    def __fingerprint_description(description: dict) -> str:
+        # Fields that change with each deployment. Replica counts and invocation stats are left out
+        deployment = {field: description.get(field) for field in ['image', 'createdAt', 'annotations', 'labels', 'envProcess', 'namespace']}
+        return sha256(json.dumps(deployment, sort_keys=True, default=str).encode()).hexdigest()
+
     def is_away_protocol(self, fn_name: str) -> bool:
         """
         Returns if a function was built with away's protocol, i.e: if it contains the annotation marking it as such
@@ -226,6 +416,44 @@ class FaasConnection():
         annotations = self.get_function_annotations(fn_name)
         return 'built-with' in annotations and annotations['built-with'] == 'away'
 
+    def is_away_batch_protocol(self, fn_name: str) -> bool:
+        """
+        Returns if a function was built with away's protocol in batch mode, i.e: it takes a list of argument bundles per request
+
+        arguments:
+            fn_name: The name of the function in the OpenFaaS provider
+        """
+        annotations = self.get_function_annotations(fn_name)
+        return annotations.get('built-with') == 'away' and annotations.get('away-batch') == 'true'
+
+    def get_function_protocol_version(self, fn_name: str) -> int:
+        """
+        Returns the version of away's protocol a function was built with, as recorded in its annotations.
+        Functions built before protocol versions were recorded use version 1
+
+        arguments:
+            fn_name: The name of the function in the OpenFaaS provider
+        """
+        annotations = self.get_function_annotations(fn_name)
+        assert annotations.get('built-with') == 'away', f'Function {fn_name} was not built with away\'s protocol'
+        return int(annotations.get('away-protocol', 1))
+
+    def get_function_codec(self, fn_name: str, annotations: dict[str, str] | None = None) -> str:
+        """
+        Returns the identifier of the codec a function was built with, as recorded in its annotations (see `protocol.Codec`).
+        Functions built before codecs were recorded use the codec of their protocol version
+
+        arguments:
+            fn_name: The name of the function in the OpenFaaS provider
+            annotations: The annotations of the function, if already read with `get_function_annotations`
+        """
+        if annotations is None: annotations = self.get_function_annotations(fn_name)
+        if 'away-codec' in annotations:
+            return annotations['away-codec']
+
+        assert annotations.get('built-with') == 'away', f'Function {fn_name} was not built with away\'s protocol'
+        return PROTOCOL_CODECS[int(annotations.get('away-protocol', 1))]
+
     def get_sysinfo(self) -> dict[str, str]:
         """
         Returns OpenFaaS system information. Requires authentication
@@ -234,7 +462,7 @@ class FaasConnection():
         self.ensure_auth()
 
         endpoint = f'http://{self.address}/system/info'
-        res = requests.get(endpoint, headers={"Authorization": "Basic YWRtaW46MTIzNA=="})
+        res = self.get_session().get(endpoint, headers={"Authorization": "Basic YWRtaW46MTIzNA=="})
         if res.status_code != 200:
             raise FaasReturnedError(res)
         
@@ -0,0 +1,339 @@
+import asyncio
+import weakref
+from base64 import b64encode
+from urllib.parse import urlsplit, urlencode, unquote
+from time import monotonic
+from collections import deque
+
+from typing import Any, AsyncIterator, Iterable
+
+class HostConnection():
+    """
+    A connection checked out of a `HostPool`, which holds one of its slots until it is released
+    """
+
+    def __init__(self, pool: 'HostPool', reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.pool = pool
+        self.reader = reader
+        self.writer = writer
+        self.released = False
+
+    def release(self, reusable: bool = False):
+        """
+        Puts the connection back in the pool if it is `reusable`, or closes it. Frees its slot either way
+        """
+        if self.released: return
+        self.released = True
+
+        if reusable:
+            self.pool.idle.append((self.reader, self.writer, monotonic()))
+        else:
+            self.writer.close()
+        self.pool.slots.release()
+
+    def __del__(self):
+        # a response whose body was never read, nor closed
+        try:
+            self.release()
+        except RuntimeError:
+            # its event loop is already closed
+            pass
+
+class AsyncResponse():
+    """
+    The response of a request made with `AsyncTransport`. Mirrors the parts of `requests.Response` used by the proxies
+    """
+
+    def __init__(self,
+        status_code: int,
+        reason: str,
+        headers: dict[str, str],
+        content: bytes | None,
+        chunks: AsyncIterator[bytes] | None = None,
+        connection: HostConnection | None = None):
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        # `None` until the body of a streamed response is read
+        self.content = content
+        self.__chunks = chunks
+        self.__connection = connection
+
+    def iter_chunks(self) -> AsyncIterator[bytes]:
+        """
+        Returns the body of a streamed response as it arrives. The connection goes back to the pool once it is exhausted,
+        and is closed if the iterator (or the response) is closed, or garbage collected, before that
+        """
+        assert self.__chunks is not None, 'The body of the response was already read'
+        chunks, self.__chunks = self.__chunks, None
+        return chunks
+
+    async def aread(self) -> bytes:
+        """
+        Reads the rest of the body of a streamed response
+        """
+        if self.content is None:
+            chunks = self.iter_chunks()
+            try:
+                self.content = b''.join([chunk async for chunk in chunks])
+            finally:
+                await chunks.aclose()
+
+        return self.content
+
+    def close(self):
+        """
+        Closes the connection of a streamed response whose body is not read to the end
+        """
+        self.__chunks = None
+        if self.__connection is not None:
+            self.__connection.release()
+
+    @property
+    def text(self) -> str:
+        assert self.content is not None, 'The body of a streamed response must be read first, see `aread`'
+        return self.content.decode('utf-8', errors='replace')
+
+    def __repr__(self) -> str:
+        return f'<AsyncResponse [{self.status_code}]>'
+
+class HostPool():
+    """
+    Keep-alive connections to a single host, bound to a single event loop
+    """
+
+    def __init__(self, maxsize: int):
+        self.idle = deque()
+        self.slots = asyncio.Semaphore(maxsize)
+
+class AsyncTransport():
+    """
+    A non-blocking HTTP/1.1 client built on asyncio streams
+
+    Connections are pooled per event loop and per host. At most `pool_maxsize` connections are open to a host at a time,
+    requests over that limit wait for a free connection instead of taking a thread each
+    """
+
+    def __init__(self, pool_maxsize: int = 100, keepalive_timeout: float | None = None):
+        self.pool_maxsize = pool_maxsize
+        self.keepalive_timeout = keepalive_timeout
+        # Streams are bound to the loop that opened them, so each loop gets its own set of pools.
+        #  Pools of a loop that has been garbage collected are dropped with it
+        self.__pools = weakref.WeakKeyDictionary()
+
+    def __get_host_pool(self, host: str, port: int) -> HostPool:
+        loop = asyncio.get_running_loop()
+        loop_pools = self.__pools.setdefault(loop, {})
+
+        if (host, port) not in loop_pools:
+            loop_pools[(host, port)] = HostPool(self.pool_maxsize)
+
+        return loop_pools[(host, port)]
+
+    async def request(self, method: str, url: str, data: Any = None, headers: dict[str, str] | None = None, stream: bool = False) -> AsyncResponse:
+        """
+        Sends a request, reusing a pooled connection to the host if one is available
+
+        With `stream`, returns once the head of the response is read, and the body is read with `AsyncResponse.iter_chunks`
+        """
+        parts = urlsplit(url)
+        if parts.scheme != 'http':
+            raise ValueError(f'Unsupported scheme {parts.scheme!r} in {url}: the async transport only speaks plain http')
+        host = parts.hostname
+        port = parts.port or 80
+        path = parts.path or '/'
+        if parts.query: path += '?' + parts.query
+
+        request_headers = {
+            'Host': f'{host}:{port}',
+            'User-Agent': 'away',
+            'Accept': '*/*',
+            'Connection': 'keep-alive',
+        }
+        if parts.username is not None:
+            credentials = f'{unquote(parts.username)}:{unquote(parts.password or "")}'
+            request_headers['Authorization'] = 'Basic ' + b64encode(credentials.encode()).decode()
+
+        if AsyncTransport.__is_streamed_body(data):
+            # sent in chunks as it is produced
+            body = data
+            request_headers['Transfer-Encoding'] = 'chunked'
+        else:
+            body = self.__encode_body(data, request_headers)
+            request_headers['Content-Length'] = str(len(body))
+        request_headers.update(headers or {})
+
+        head = f'{method} {path} HTTP/1.1\r\n' + ''.join(f'{k}: {v}\r\n' for k, v in request_headers.items()) + '\r\n'
+
+        pool = self.__get_host_pool(host, port)
+        await pool.slots.acquire()
+        try:
+            reader, writer, status_code, reason, response_headers, keep_alive = await self.__send(pool, host, port, head.encode('latin-1'), body)
+        except BaseException:
+            pool.slots.release()
+            raise
+        connection = HostConnection(pool, reader, writer)
+
+        if method == 'HEAD' or status_code in (204, 304) or status_code < 200:
+            # responses without a body, whatever their headers say. A 101 switches the connection to another protocol
+            connection.release(keep_alive and status_code != 101)
+            return AsyncResponse(status_code, reason, response_headers, b'', AsyncTransport.__empty_body())
+
+        chunks = self.__iter_body(connection, response_headers, keep_alive)
+        response = AsyncResponse(status_code, reason, response_headers, None, chunks, connection)
+        if not stream: await response.aread()
+
+        return response
+
+    async def __send(self, pool: HostPool, host: str, port: int, head: bytes, body: bytes | Iterable[bytes]):
+
+        is_streamed = not isinstance(body, bytes)
+        # a streamed body cannot be sent again over a fresh connection if a pooled one turns out to be dropped
+        reader, writer, reused = await self.__checkout(pool, host, port, reuse=not is_streamed)
+        try:
+            await self.__write_request(writer, head, body)
+            head = await self.__read_head(reader)
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            writer.close()
+            if not reused:
+                raise ConnectionError(f'Connection to {host}:{port} failed: {repr(e)}') from e
+            # The server may have dropped an idle keep-alive connection: retry once on a fresh one
+            reader, writer = await asyncio.open_connection(host, port)
+            try:
+                await self.__write_request(writer, head, body)
+                head = await self.__read_head(reader)
+            except BaseException:
+                writer.close()
+                raise
+        except BaseException:
+            # Includes cancellation: a half-used connection can never be put back in the pool
+            writer.close()
+            raise
+
+        return (reader, writer, *head)
+
+    @staticmethod
+    async def __write_request(writer: asyncio.StreamWriter, head: bytes, body: bytes | Iterable[bytes]):
+
+        if isinstance(body, bytes):
+            writer.write(head + body)
+            await writer.drain()
+            return
+
+        writer.write(head)
+        for chunk in body:
+            # an empty chunk would end the body
+            if len(chunk) == 0: continue
+            writer.write(b'%x\r\n' % len(chunk) + bytes(chunk) + b'\r\n')
+            await writer.drain()
+
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    @staticmethod
+    def __is_streamed_body(data: Any) -> bool:
+        return hasattr(data, '__iter__') and not isinstance(data, (str, bytes, bytearray, memoryview, dict, list, tuple))
+
+    async def __checkout(self, pool: HostPool, host: str, port: int, reuse: bool = True):
+
+        while reuse and len(pool.idle) > 0:
+            reader, writer, last_used = pool.idle.pop()
+            is_expired = self.keepalive_timeout is not None and monotonic() - last_used > self.keepalive_timeout
+            if is_expired or writer.is_closing() or reader.at_eof():
+                writer.close()
+                continue
+            return reader, writer, True
+
+        reader, writer = await asyncio.open_connection(host, port)
+        return reader, writer, False
+
+    @staticmethod
+    def __encode_body(data: Any, headers: dict[str, str]) -> bytes:
+
+        if data is None or (not isinstance(data, (str, bytes, dict)) and len(data) == 0):
+            return b''
+        if isinstance(data, dict):
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            return urlencode(data).encode()
+        if isinstance(data, str):
+            return data.encode('utf-8')
+
+        return bytes(data)
+
+    @staticmethod
+    async def __read_head(reader: asyncio.StreamReader) -> tuple[int, str, dict[str, str], bool]:
+
+        while True:
+            status_line = await reader.readline()
+            if status_line == b'':
+                raise asyncio.IncompleteReadError(b'', None)
+
+            version, status_code, *reason = status_line.decode('latin-1').strip().split(' ', 2)
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            # interim responses, such as 100 Continue or 103 Early Hints, come before the final one
+            if not 100 <= int(status_code) < 200 or int(status_code) == 101:
+                break
+
+        keep_alive = headers.get('connection', '').lower() != 'close' and version != 'HTTP/1.0'
+
+        return int(status_code), reason[0] if reason else '', headers, keep_alive
+
+    @staticmethod
+    async def __empty_body() -> AsyncIterator[bytes]:
+        return
+        yield
+
+    async def __iter_body(self, connection: HostConnection, headers: dict[str, str], keep_alive: bool) -> AsyncIterator[bytes]:
+
+        reader = connection.reader
+        finished = False
+        try:
+            if headers.get('transfer-encoding', '').lower() == 'chunked':
+                while True:
+                    size = int((await reader.readline()).split(b';')[0].strip(), 16)
+                    if size == 0:
+                        # skip trailers
+                        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                            pass
+                        break
+                    yield await reader.readexactly(size)
+                    await reader.readexactly(2)
+            elif 'content-length' in headers:
+                remaining = int(headers['content-length'])
+                while remaining > 0:
+                    chunk = await reader.read(min(remaining, 2**16))
+                    if chunk == b'':
+                        raise asyncio.IncompleteReadError(b'', remaining)
+                    remaining -= len(chunk)
+                    yield chunk
+            else:
+                keep_alive = False
+                while True:
+                    chunk = await reader.read(2**16)
+                    if chunk == b'':
+                        break
+                    yield chunk
+
+            finished = True
+        finally:
+            # a connection whose response was not read to the end cannot be reused
+            connection.release(finished and keep_alive)
+
+    async def aclose(self):
+        """
+        Closes the pooled connections opened from the running event loop
+        """
+        loop_pools = self.__pools.pop(asyncio.get_running_loop(), {})
+
+        for pool in loop_pools.values():
+            while len(pool.idle) > 0:
+                _, writer, _ = pool.idle.pop()
+                writer.close()
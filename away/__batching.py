@@ -0,0 +1,154 @@
+import asyncio
+import threading
+import weakref
+from concurrent.futures import Future
+
+from typing import Any, Iterable, Callable, Awaitable, Tuple
+
+from .exceptions import FaasReturnedError
+
+def __unwrap_batch_results(function_name: str, results: Iterable[Any], return_exceptions: bool = False) -> list[Any]:
+    """
+    Converts the per-item `[ok, value]` results returned by a batch handler into values.
+    Failed items are raised, or returned in place as `FaasReturnedError` if `return_exceptions`
+    """
+    unwrapped = []
+    for is_ok, value in results:
+        if not is_ok:
+            value = FaasReturnedError(f'Function {function_name} raised: {value}')
+            if not return_exceptions:
+                raise value
+
+        unwrapped.append(value)
+
+    return unwrapped
+
+class MicroBatcher():
+    """
+    Collects the calls made from any thread within `window` seconds, or until `max_size` calls are waiting,
+    and sends them together with `send_batch`. Each caller gets back the result of its own call
+    """
+
+    def __init__(self, send_batch: Callable[[list[Tuple]], list[Any]], window: float, max_size: int):
+        assert max_size > 0, f'max_batch_size must be positive, got {max_size}'
+
+        self.send_batch = send_batch
+        self.window = window
+        self.max_size = max_size
+        self.__lock = threading.Lock()
+        self.__pending = []
+        self.__timer = None
+
+    def submit(self, args: Tuple) -> Any:
+        fut = Future()
+
+        with self.__lock:
+            self.__pending.append((args, fut))
+
+            full_batch = None
+            if len(self.__pending) >= self.max_size:
+                full_batch = self.__take()
+            elif self.__timer is None:
+                self.__timer = threading.Timer(self.window, self.flush)
+                self.__timer.daemon = True
+                self.__timer.start()
+
+        # a full batch is sent right away, by the caller that filled it
+        if full_batch is not None: self.__dispatch(full_batch)
+
+        return fut.result()
+
+    def flush(self):
+        """
+        Sends the calls waiting for the batching window to expire
+        """
+        with self.__lock:
+            batch = self.__take()
+
+        if len(batch) > 0: self.__dispatch(batch)
+
+    def __take(self) -> list[Tuple[Tuple, Future]]:
+        if self.__timer is not None:
+            self.__timer.cancel()
+            self.__timer = None
+
+        batch, self.__pending = self.__pending, []
+        return batch
+
+    def __dispatch(self, batch: list[Tuple[Tuple, Future]]):
+        try:
+            results = self.send_batch([args for args, _ in batch])
+        except Exception as e:
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+
+        for (_, fut), res in zip(batch, results):
+            if isinstance(res, FaasReturnedError):
+                fut.set_exception(res)
+            else:
+                fut.set_result(res)
+
+class AsyncMicroBatcher():
+    """
+    Collects the calls awaited within `window` seconds on an event loop, or until `max_size` calls are waiting,
+    and sends them together with `send_batch`. Each caller gets back the result of its own call
+    """
+
+    def __init__(self, send_batch: Callable[[list[Tuple]], Awaitable[list[Any]]], window: float, max_size: int):
+        assert max_size > 0, f'max_batch_size must be positive, got {max_size}'
+
+        self.send_batch = send_batch
+        self.window = window
+        self.max_size = max_size
+        # pending calls and flush timer, per event loop
+        self.__loop_state = weakref.WeakKeyDictionary()
+
+    async def submit(self, args: Tuple) -> Any:
+        loop = asyncio.get_running_loop()
+        state = self.__loop_state.setdefault(loop, {'pending': [], 'timer': None, 'dispatches': set()})
+
+        fut = loop.create_future()
+        state['pending'].append((args, fut))
+
+        if len(state['pending']) >= self.max_size:
+            self.flush()
+        elif state['timer'] is None:
+            state['timer'] = loop.call_later(self.window, self.flush)
+
+        return await fut
+
+    def flush(self):
+        """
+        Sends the calls waiting for the batching window to expire on the running event loop
+        """
+        state = self.__loop_state.get(asyncio.get_running_loop())
+        if state is None: return
+
+        if state['timer'] is not None:
+            state['timer'].cancel()
+            state['timer'] = None
+
+        batch, state['pending'] = state['pending'], []
+        if len(batch) > 0:
+            # the loop only keeps weak references to tasks: hold on to the dispatch until it is done
+            dispatch = asyncio.ensure_future(self.__dispatch(batch))
+            state['dispatches'].add(dispatch)
+            dispatch.add_done_callback(state['dispatches'].discard)
+
+    async def __dispatch(self, batch: list[Tuple[Tuple, asyncio.Future]]):
+        try:
+            results = await self.send_batch([args for args, _ in batch])
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done(): fut.set_exception(e)
+            return
+
+        for (_, fut), res in zip(batch, results):
+            # the caller may have been cancelled while waiting
+            if fut.done(): continue
+
+            if isinstance(res, FaasReturnedError):
+                fut.set_exception(res)
+            else:
+                fut.set_result(res)
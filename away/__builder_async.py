@@ -1,14 +1,25 @@
 
-import requests
 import asyncio
+from time import monotonic
 
 from .FaasConnection import FaasConnection
-from .exceptions import FaasReturnedError, FaasFunctionTimedOutError
+from .exceptions import FaasReturnedError, FaasFunctionTimedOutError, FaasCircuitOpenError
 
 import typing
-from typing import Callable, Any, Awaitable
+from typing import Callable, Any, Awaitable, AsyncIterator, Iterable, Tuple
 
 from .common_utils import parametrized, pack_args
+from .__fanout import __make_async_fanout
+from .cache import ResultCache, DeploymentFingerprint, __make_cache, __make_cache_key
+from .__singleflight import AsyncSingleFlight
+from .retry import RetryPolicy, RetryStats, __resolve_retry_policy
+from .circuit_breaker import CircuitBreaker, __with_fallback
+from .hedging import HedgePolicy, __make_hedger
+from .timeouts import __resolve_call_limits, __resolve_request_limits
+from .compression import CompressionPolicy, __make_compression_policy
+from .__streaming import __aiter_records
+from .__batching import __unwrap_batch_results, AsyncMicroBatcher
+from .__async_transport import AsyncResponse
 
 def __builder_async(function_name: str,
     faas: FaasConnection,
@@ -19,16 +30,157 @@ def __builder_async(function_name: str,
     unpack_args: Callable = lambda e: e,
     replace_underscore=True,
     is_auth: bool = False,
+    batch: bool = False,
+    auto_batch: bool = False,
+    batch_window: float = 0.005,
+    max_batch_size: int = 64,
+    cache: bool | ResultCache | None = None,
+    coalesce: bool = False,
+    retry: RetryPolicy | bool | None = None,
+    circuit_breaker: CircuitBreaker | dict | bool | None = None,
+    fallback: Callable | None = None,
+    hedge: HedgePolicy | float | bool | None = None,
+    timeout: float | None = None,
+    deadline: float | None = None,
+    stream: bool = False,
+    compression: CompressionPolicy | str | bool | None = None,
     verbose: bool = False) -> Awaitable:
-    
+
+    assert not batch or implicit_exception_handling, 'Batch-mode functions require implicit_exception_handling'
+    assert not auto_batch or batch, 'auto_batch requires a function published in batch mode (batch=True)'
+    assert not (cache and batch), 'Caching is not available for batch-mode functions'
+    assert not (coalesce and batch), 'Coalescing is not available for batch-mode functions'
+    assert not stream or implicit_exception_handling, 'Streaming functions require implicit_exception_handling'
+    assert not (stream and (batch or cache or coalesce or hedge or fallback)), 'Streaming functions cannot be batched, cached, coalesced, hedged or have a fallback'
+
+    result_cache = __make_cache(cache)
+    # identical calls in flight at the same time share a single request
+    flights = AsyncSingleFlight() if coalesce else None
+
+    retry_policy = __resolve_retry_policy(retry, faas.retry_policy)
+    retry_stats = RetryStats()
+
+    # idempotent functions can have slow requests raced by a second one
+    hedger = __make_hedger(hedge)
+
+    # large payloads can be compressed, if both ends agree on an encoding
+    compression = __make_compression_policy(compression)
+
     if replace_underscore: function_name = function_name.replace('_', '-')
 
     if ensure_present: faas.ensure_fn_present(function_name)
 
+    if circuit_breaker is True:
+        circuit_breaker = faas.get_circuit_breaker(function_name)
+    elif isinstance(circuit_breaker, dict):
+        circuit_breaker = faas.get_circuit_breaker(function_name, **circuit_breaker)
+    elif circuit_breaker is False:
+        circuit_breaker = None
+    assert fallback is None or circuit_breaker is not None, 'A fallback requires a circuit_breaker'
+
+    # cache entries of caches that track deployments are only valid for the deployment that produced them
+    fingerprint = None
+    if result_cache is not None and result_cache.track_deployments:
+        fingerprint = DeploymentFingerprint(faas, function_name)
+
     endpoint = f'http://{faas.auth_address if is_auth else faas.address}/function/{function_name+namespace}'
-    loop = asyncio.get_event_loop()
 
-    async def faas_fn(*args, **kwargs) -> Awaitable:
+    async def send_with_retries(packed_args: str | dict, encoding_headers: dict[str, str]) -> AsyncResponse:
+
+        started_at = monotonic()
+        deadline_at, request_timeout = __resolve_call_limits(timeout, deadline)
+        attempt = 0
+        while True:
+            attempt += 1
+            res, error = None, None
+            attempt_timeout, headers = __resolve_request_limits(function_name, deadline_at, request_timeout)
+            headers = {**encoding_headers, **headers}
+            get = lambda: faas.get_async_transport().request('GET', endpoint, data=packed_args, headers=headers, stream=stream)
+            try:
+                # cancelling the request closes its connection
+                res = await asyncio.wait_for(get() if hedger is None else hedger.acall(get), attempt_timeout)
+                # the body of a failed streamed response is read, freeing its connection
+                if stream and res.status_code != 200: await res.aread()
+            except asyncio.TimeoutError as e:
+                timed_out = FaasFunctionTimedOutError(f'Function {function_name} did not answer within {attempt_timeout:.3f}s')
+                # the replica is only to blame for the request's own timeout, not for what remained of the call's deadline
+                timed_out.replica_timed_out = request_timeout is not None and attempt_timeout >= request_timeout
+                raise timed_out from e
+            except (OSError, asyncio.IncompleteReadError) as e:
+                if retry_policy is None: raise
+                error = e
+
+            if retry_policy is None: break
+
+            delay = retry_policy.next_delay(attempt, started_at,
+                status_code=None if res is None else res.status_code,
+                error=error,
+                retry_after=None if res is None else res.headers.get('retry-after'))
+            if delay is None: break
+            # no point in a retry that would start past the deadline
+            if deadline_at is not None and monotonic() + delay >= deadline_at: break
+
+            if verbose: print(f'[INFO]: Attempt {attempt} got {res if error is None else repr(error)}, retrying in {delay:.3f}s')
+            await asyncio.sleep(delay)
+
+        if retry_policy is not None: retry_stats.record(attempt - 1)
+        if error is not None: raise error
+
+        return res
+
+    async def send(packed_args: str | dict) -> AsyncResponse:
+
+        if circuit_breaker is not None and not circuit_breaker.allow():
+            raise FaasCircuitOpenError(f'The circuit breaker of function {function_name} is open')
+
+        encoding_headers = {}
+        if compression is not None: packed_args, encoding_headers = compression.encode_request(packed_args)
+
+        started_at = monotonic()
+        try:
+            res = await send_with_retries(packed_args, encoding_headers)
+        except BaseException as e:
+            if circuit_breaker is not None:
+                # only requests that were sent and got no answer count as failures of the replicas: not cancellations,
+                #  interruptions or the caller's deadline
+                is_replica_failure = getattr(e, 'replica_timed_out', False) or isinstance(e, (OSError, asyncio.IncompleteReadError))
+                if is_replica_failure: circuit_breaker.record(False, monotonic() - started_at)
+                else: circuit_breaker.release()
+            raise
+
+        # only failures of the function's replicas count, not of the calls' arguments
+        if circuit_breaker is not None: circuit_breaker.record(res.status_code < 500 and res.status_code != 429, monotonic() - started_at)
+
+        if verbose: print(f'[INFO]: Got {res}, implicit_exception_handling={implicit_exception_handling}')
+        if implicit_exception_handling:
+            if res.status_code == 502: # pragma: no cover
+                raise FaasFunctionTimedOutError(f'Function {function_name} timed out')
+
+            elif res.status_code != 200:
+                raise FaasReturnedError(f'Function returned non 200 code: {res.status_code}, {res.text}')
+
+        return res
+
+    def read_text(res) -> str:
+        # handlers compress the responses of proxies that accept it
+        return res.text if compression is None else compression.decode_response(res.text)
+
+    async def stream_fn(*args, **kwargs) -> AsyncIterator[Any]:
+
+        if verbose: print(f'[INFO]: Async-Stream-requesting at endpoint {endpoint} with data={args}')
+        res = await send(pack_args(args))
+        chunks = res.iter_chunks()
+        try:
+            async for item in __aiter_records(function_name, chunks, unpack_args):
+                yield item
+        finally:
+            # also drops the connection if the caller stops iterating early
+            await chunks.aclose()
+
+    async def call_fn(*args, **kwargs) -> Awaitable:
+
+        if auto_batch: return await batcher.submit(args)
+        if batch: return (await call_batch([args]))[0]
 
         if verbose: print(f'[INFO]: Async-Requesting at endpoint {endpoint} with data={args}')
 
@@ -36,31 +188,67 @@ def __builder_async(function_name: str,
 
         if verbose: print(f'[INFO]: Packed args: {args}')
 
-        def start_get():
-            res = requests.get(endpoint, data=args)
+        cache_key = None if result_cache is None else __make_cache_key(faas.address, function_name, args, '' if fingerprint is None else await fingerprint.aget())
+        r = None if cache_key is None else result_cache.get(cache_key)
+
+        if r is not None:
+            if verbose: print(f'[INFO]: Cache hit for {function_name}')
+            status_code = 200
+        else:
+            if flights is not None:
+                res = await flights.do(__make_cache_key(faas.address, function_name, args), lambda: send(args))
+            else:
+                res = await send(args)
+            r, status_code = read_text(res), res.status_code
+            if cache_key is not None and status_code == 200: result_cache.put(cache_key, r)
+
+        if unpack_args is not None:
+            r = unpack_args(r)
+
+        return r if implicit_exception_handling else (r, status_code)
 
-            if verbose: 
-                print(f'[INFO]: Got {res}, implicit_exception_handling={implicit_exception_handling}')
-            if implicit_exception_handling:
-                if res.status_code == 502: # pragma: no cover
-                    raise FaasFunctionTimedOutError(f'Function {function_name} timed out')
+    async def call_batch(args_iterable: Iterable[Tuple], return_exceptions: bool = False) -> list[Any]:
+        """
+        Calls the function once per argument tuple in `args_iterable`, all in a single request.
+        Requires the function to be published in batch mode
 
-                elif res.status_code != 200:
-                    raise FaasReturnedError(f'Function returned non 200 code: {res.status_code}, {res.text}')
-            r = res.text
-            if unpack_args is not None:
-                r = unpack_args(r)
+        If `return_exceptions`, the items that raised in the server are returned as `FaasReturnedError` in place of their result.
+        Otherwise, the first failed item raises
 
-            return r if implicit_exception_handling else (r, res.status_code)
+        Usage:
+        res = await sum_one.batch([(1,), (2,), (3,)]) # returns [2, 3, 4]
+        """
+        bundles = [tuple(args) for args in args_iterable]
 
+        if verbose: print(f'[INFO]: Async-Batch-requesting at endpoint {endpoint} with {len(bundles)} argument bundles')
 
-        res_fut = asyncio.to_thread(start_get)
+        res = await send(pack_args(bundles))
 
-        if verbose: print(f'[INFO]: Got {res_fut}')
+        return __unwrap_batch_results(function_name, unpack_args(read_text(res)), return_exceptions=return_exceptions)
 
-        return (await asyncio.gather(res_fut))[0]
+    faas_fn = stream_fn if stream else call_fn
+    if fallback is not None: faas_fn = __with_fallback(faas_fn, fallback)
 
     faas_fn.__faas_id__ = hash(faas)
+    if not stream: faas_fn.map, faas_fn.starmap = __make_async_fanout(faas_fn)
+    if batch: faas_fn.batch = call_batch
+    if retry_policy is not None: faas_fn.retry_stats = retry_stats
+    if circuit_breaker is not None: faas_fn.circuit_breaker = circuit_breaker
+    if hedger is not None: faas_fn.hedger = hedger
+    if compression is not None: faas_fn.compression = compression
+    if result_cache is not None:
+        faas_fn.cache = result_cache
+
+        async def invalidate(*args):
+            result_cache.invalidate(
+                __make_cache_key(faas.address, function_name, pack_args(args), '' if fingerprint is None else await fingerprint.aget())
+            )
+
+        faas_fn.invalidate = invalidate
+    if auto_batch:
+        # Concurrent single calls are collected and sent together
+        batcher = AsyncMicroBatcher(lambda bundles: call_batch(bundles, return_exceptions=True), batch_window, max_batch_size)
+        faas_fn.flush = batcher.flush
     faas_fn.__faas_croscall_endpoint__ = f'http://gateway.openfaas.svc.cluster.local.:8080/function/{function_name+namespace}'
     return faas_fn
 
@@ -0,0 +1,149 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+
+from typing import Callable, Any, Iterable, Iterator, AsyncIterator, Tuple
+
+def __make_sync_fanout(faas_fn: Callable[[Any], Any]) -> Tuple[Callable, Callable]:
+    """
+    Creates the `map` and `starmap` methods of a sync proxy
+    """
+
+    def starmap(
+        args_iterable: Iterable[Tuple],
+        concurrency: int = 8,
+        ordered: bool = True,
+        return_exceptions: bool = False) -> Iterator[Any]:
+        """
+        Calls the function once per argument tuple in `args_iterable`, with at most `concurrency` calls in flight.
+        `args_iterable` is consumed lazily, only as calls complete
+
+        Results are yielded in input order if `ordered`, or as soon as they finish otherwise.
+        If `return_exceptions`, exceptions raised by a call are yielded in place of its result. Otherwise, the first
+        exception is raised and the pending calls are cancelled
+
+        Usage:
+        for res in fibonacci.starmap([(10,), (20,), (30,)], concurrency=2):
+            ...
+        """
+        assert concurrency > 0, f'concurrency must be positive, got {concurrency}'
+
+        def unwrap(fut):
+            exc = fut.exception()
+            if exc is None:
+                return fut.result()
+            if return_exceptions:
+                return exc
+            raise exc
+
+        def take_finished():
+            if ordered:
+                return [pending.popleft()]
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                pending.remove(fut)
+            return done
+
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='away-map')
+        pending = deque()
+        try:
+            for args in args_iterable:
+                # calls keep the context of the caller, e.g. its deadline
+                pending.append(executor.submit(contextvars.copy_context().run, faas_fn, *args))
+
+                # backpressure: only take more arguments once a call has finished
+                if len(pending) >= concurrency:
+                    for fut in take_finished():
+                        yield unwrap(fut)
+
+            while len(pending) > 0:
+                for fut in take_finished():
+                    yield unwrap(fut)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def map(args_iterable: Iterable[Any], *fanout_args, **fanout_kwargs) -> Iterator[Any]:
+        """
+        Like `starmap`, for a function taking a single argument. Calls the function once per item in `args_iterable`
+
+        Usage:
+        for res in fibonacci.map(range(30), concurrency=4):
+            ...
+        """
+        return starmap(((arg,) for arg in args_iterable), *fanout_args, **fanout_kwargs)
+
+    return map, starmap
+
+def __make_async_fanout(faas_fn: Callable[[Any], Any]) -> Tuple[Callable, Callable]:
+    """
+    Creates the `map` and `starmap` methods of an async proxy
+    """
+
+    async def starmap(
+        args_iterable: Iterable[Tuple],
+        concurrency: int = 64,
+        ordered: bool = True,
+        return_exceptions: bool = False) -> AsyncIterator[Any]:
+        """
+        Calls the function once per argument tuple in `args_iterable`, with at most `concurrency` calls in flight.
+        `args_iterable` is consumed lazily, only as calls complete
+
+        Results are yielded in input order if `ordered`, or as soon as they finish otherwise.
+        If `return_exceptions`, exceptions raised by a call are yielded in place of its result. Otherwise, the first
+        exception is raised and the pending calls are cancelled
+
+        Usage:
+        async for res in fibonacci.starmap([(10,), (20,), (30,)], concurrency=2):
+            ...
+        """
+        assert concurrency > 0, f'concurrency must be positive, got {concurrency}'
+
+        def unwrap(task):
+            exc = task.exception()
+            if exc is None:
+                return task.result()
+            if return_exceptions:
+                return exc
+            raise exc
+
+        async def take_finished():
+            if ordered:
+                task = pending.popleft()
+                await asyncio.wait([task])
+                return [task]
+
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                pending.remove(task)
+            return done
+
+        pending = deque()
+        try:
+            for args in args_iterable:
+                pending.append(asyncio.ensure_future(faas_fn(*args)))
+
+                # backpressure: only take more arguments once a call has finished
+                if len(pending) >= concurrency:
+                    for task in await take_finished():
+                        yield unwrap(task)
+
+            while len(pending) > 0:
+                for task in await take_finished():
+                    yield unwrap(task)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def map(args_iterable: Iterable[Any], *fanout_args, **fanout_kwargs) -> AsyncIterator[Any]:
+        """
+        Like `starmap`, for a function taking a single argument. Calls the function once per item in `args_iterable`
+
+        Usage:
+        async for res in fibonacci.map(range(30), concurrency=4):
+            ...
+        """
+        return starmap(((arg,) for arg in args_iterable), *fanout_args, **fanout_kwargs)
+
+    return map, starmap
@@ -1,4 +1,10 @@
 from typing import Callable, Any
+from types import CodeType
+from itertools import repeat
+import threading
+import builtins
+import operator
+import weakref
 import inspect
 import dis
 import warnings
@@ -6,8 +12,66 @@ import warnings
 from .common_utils import pack_args as default_pack_args
 from .common_utils import experimental
 from .exceptions import EnsureException
+from .build_report import BuildReport, CapturedDependency
+
+# What the expansion of dependencies reads from the code of a function: its source and the global names it loads.
+#  Code objects are immutable, so this is computed once per code object, keyed by its identity and hash, and reused
+#  by every function published in this process that shares it. The values the names are bound to are not cached:
+#  they are looked up again on each publish, as globals may be rebound or mutated in between
+__code_cache: dict[tuple[int, int], tuple[weakref.ref, dict[Any, Any]]] = {}
+__code_cache_lock = threading.Lock()
+
+# The walks of the dependency graph from each function, for each id of FaaS connection (intra-cluster proxies depend
+#  on it), as `(dependencies, names checked, names closed, functions walked, their bindings)`, see `__read_bindings`. Functions that share
+#  helpers reach the same subgraphs: a walk that reaches a function again reuses its walk instead of walking its
+#  subgraph, as long as the globals and closure cells of every function in it are still bound to the same objects.
+#  Only the bindings are checked: the values themselves are packed again on each publish
+__walk_cache: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+# the binding of a global name that is not in the globals
+UNBOUND = object()
+
+# instructions that load a name from the globals, or from the builtins if it is not in them
+GLOBAL_LOAD_OPNAMES = {'LOAD_GLOBAL', 'LOAD_NAME', 'LOAD_FROM_DICT_OR_GLOBALS'}
+# instructions that load a global or nonlocal name, or bind or delete it
+NAME_LOAD_OPNAMES = GLOBAL_LOAD_OPNAMES | {'LOAD_DEREF', 'LOAD_CLASSDEREF', 'LOAD_FROM_DICT_OR_DEREF'}
+NAME_USE_OPNAMES = NAME_LOAD_OPNAMES | {'STORE_GLOBAL', 'DELETE_GLOBAL', 'STORE_NAME', 'DELETE_NAME', 'STORE_DEREF', 'DELETE_DEREF'}
+CONST_LOAD_OPNAMES = {'LOAD_CONST', 'LOAD_SMALL_INT'}
+
+# values that are merged with an equal value captured under another name, as they cannot be mutated through either
+IMMUTABLE_VALUE_TYPES = {str, bytes, tuple, frozenset}
+
+def __cached_code_info(code: CodeType, key: Any, compute: Callable[[], Any]) -> Any:
+    cache_key = (id(code), hash(code))
+    entry = __code_cache.get(cache_key)
+    # the identity check discards the entry of a collected code object whose id was reused
+    if entry is None or entry[0]() is not code:
+        with __code_cache_lock:
+            entry = __code_cache.get(cache_key)
+            if entry is None or entry[0]() is not code:
+                entry = (weakref.ref(code, lambda _: __code_cache.pop(cache_key, None)), {})
+                __code_cache[cache_key] = entry
+    info = entry[1]
+
+    if key not in info:
+        info[key] = compute()
+    return info[key]
+
+def __clear_code_cache():
+    """
+    Forgets the sources and names cached for the functions published so far, e.g. after editing their module
+    """
+    with __code_cache_lock:
+        __code_cache.clear()
+        __walk_cache.clear()
 
 def __get_fn_source(source_fn: Callable[[Any], Any], from_deco: bool=False):
+    code = getattr(source_fn, '__code__', None)
+    if code is None:
+        return __read_fn_source(source_fn, from_deco)
+    return __cached_code_info(code, ('source', from_deco), lambda: __read_fn_source(source_fn, from_deco))
+
+def __read_fn_source(source_fn: Callable[[Any], Any], from_deco: bool=False):
     source_fn_arr = inspect.getsource(source_fn).split('\n')
     is_lambda = __is_lambda(source_fn)
 
@@ -27,6 +91,105 @@ def __get_fn_source(source_fn: Callable[[Any], Any], from_deco: bool=False):
 
     return source_fn_txt
 
+def __get_global_names(code: CodeType) -> tuple[str, ...]:
+    """
+    Gets the names `code` loads from the globals, including in the code nested in it: comprehensions, lambdas and
+    inner functions, in order of first use
+    """
+
+    def compute():
+        names = {}
+        for instruction in dis.get_instructions(code):
+            if instruction.opname in GLOBAL_LOAD_OPNAMES:
+                names[instruction.argval] = None
+        for const in code.co_consts:
+            if isinstance(const, CodeType):
+                names.update(dict.fromkeys(__get_global_names(const)))
+        return tuple(names)
+
+    return __cached_code_info(code, 'global_names', compute)
+
+def __get_subscripted_names(code: CodeType) -> dict[str, frozenset | None]:
+    """
+    Gets the names `code` (and the code nested in it) loads, binds or deletes, with the constant keys it reads them with
+    (`TABLE['key']`), or `None` for the names it uses in any other way
+    """
+
+    def compute():
+        names = {}
+        instructions = list(dis.get_instructions(code))
+        for i, instruction in enumerate(instructions):
+            if instruction.opname not in NAME_USE_OPNAMES:
+                continue
+
+            key_load, subscript = (instructions[i + 1:i + 3] + [None, None])[:2]
+            is_constant_subscript = (
+                instruction.opname in NAME_LOAD_OPNAMES
+                and key_load is not None and key_load.opname in CONST_LOAD_OPNAMES
+                and subscript is not None and (subscript.opname == 'BINARY_SUBSCR' or (subscript.opname == 'BINARY_OP' and subscript.argrepr == '[]'))
+            )
+            keys = names.get(instruction.argval, frozenset())
+            names[instruction.argval] = keys | {key_load.argval} if is_constant_subscript and keys is not None else None
+
+        for const in code.co_consts:
+            if isinstance(const, CodeType):
+                __merge_subscripted_names(names, __get_subscripted_names(const))
+        return names
+
+    return __cached_code_info(code, 'subscripted_names', compute)
+
+def __merge_subscripted_names(names: dict[str, frozenset | None], other_names: dict[str, frozenset | None]):
+    for name, keys in other_names.items():
+        known_keys = names.get(name, frozenset())
+        names[name] = None if keys is None or known_keys is None else known_keys | keys
+
+def __get_closure_vars(fn: Callable[[Any], Any]) -> inspect.ClosureVars:
+    """
+    Same as `inspect.getclosurevars`, with the names of the code cached, and the names used in nested code
+    """
+    code = fn.__code__
+
+    nonlocal_vars = {}
+    for var_name, cell in zip(code.co_freevars, fn.__closure__ or ()):
+        # raises a ValueError for empty cells, like `inspect.getclosurevars`
+        nonlocal_vars[var_name] = cell.cell_contents
+
+    global_ns = fn.__globals__
+    builtin_ns = global_ns.get('__builtins__', builtins.__dict__)
+    if inspect.ismodule(builtin_ns):
+        builtin_ns = builtin_ns.__dict__
+
+    global_vars, builtin_vars, unbound_names = {}, {}, set()
+    for var_name in __get_global_names(code):
+        if var_name in global_ns:
+            global_vars[var_name] = global_ns[var_name]
+        elif var_name in builtin_ns:
+            builtin_vars[var_name] = builtin_ns[var_name]
+        else:
+            unbound_names.add(var_name)
+
+    return inspect.ClosureVars(nonlocal_vars, global_vars, builtin_vars, unbound_names)
+
+def __read_bindings(fn: Callable[[Any], Any]) -> tuple[tuple[str, ...], tuple[Any, ...], tuple[Any, ...]] | None:
+    """
+    Gets the global names `fn` loads, the objects they are bound to (or `UNBOUND`) and the contents of its closure cells,
+    or `None` if a cell is empty
+    """
+    names = __get_global_names(fn.__code__)
+    try:
+        cell_objs = tuple(cell.cell_contents for cell in fn.__closure__ or ())
+    except ValueError:
+        return None
+    return names, tuple(map(fn.__globals__.get, names, repeat(UNBOUND, len(names)))), cell_objs
+
+def __is_bound_as(fn: Callable[[Any], Any], bindings: tuple[tuple[str, ...], tuple[Any, ...], tuple[Any, ...]]) -> bool:
+    names, objs, cell_objs = bindings
+    try:
+        current_cell_objs = [cell.cell_contents for cell in fn.__closure__ or ()]
+    except ValueError:
+        return False
+    return all(map(operator.is_, map(fn.__globals__.get, names, repeat(UNBOUND, len(names))), objs)) and all(map(operator.is_, current_cell_objs, cell_objs))
+
 __is_lambda = lambda fn: inspect.isfunction(fn) and fn.__name__ == '<lambda>'
 
 def __is_away_fn(fn: Callable[[Any], Any]) -> bool:
@@ -40,6 +203,9 @@ def __is_away_protocol_fn(fn: Callable[[Any], Any]) -> bool:
 def __is_away_protocol_safe_fn(fn: Callable[[Any], Any]) -> bool:
     return __is_away_protocol_fn(fn) and fn.__away_protocol_is_safe__
 
+def __is_away_protocol_batch_fn(fn: Callable[[Any], Any]) -> bool:
+    return __is_away_protocol_fn(fn) and getattr(fn, '__away_protocol_is_batch__', False)
+
 def __is_stateless(fn: Callable[[Any], Any]) -> bool:
     # This is probably not the best way to check if a function is stateful,
     #   maybe it just happens to take an arg named 'self'...
@@ -57,27 +223,90 @@ def __ensure_stateless(fn):
         reason = 'takes \'self\' as an argument' if __is_takes_self(fn) else 'is a class method'
         raise EnsureException(f'Can only build stateless functions. The function {fn.__name__} ' + reason)
 
-def __get_external_dependencies(fn: Callable[[Any], Any], faas_id: int, from_deco: bool=False) -> str:
-    return __get_external_dependencies_rec(fn, faas_id, set(), from_deco=from_deco)
+def __get_external_dependencies(
+    fn: Callable[[Any], Any],
+    faas_id: int,
+    from_deco: bool=False,
+    sidecar: dict[str, bytes] | None = None,
+    report: BuildReport | None = None,
+    lazy_uses: dict[str, dict[str, str]] | None = None,
+    prune_keys: bool = True) -> str:
+    """
+    Gets the lines that define the dependencies of `fn` in the server. With a `sidecar`, captured values that are
+    not literals are pickled into it by name instead of being written inline, see `protocol.__pack_captured_to_sidecar`.
+    With `lazy_uses` as well, they are not defined by the lines: it maps each function of the handler to the names of
+    those it uses and their sidecar entries, see `protocol.__server_load_lazily`.
+    With a `report`, each dependency is recorded in it, see `build_report.BuildReport`
+
+    Captured values are pruned conservatively: identical values are defined once, and with `prune_keys`, dictionaries
+    that are only read with constant keys keep just those keys, see `__prune_dependencies`
+    """
+    dependencies = __prune_dependencies(fn, __get_external_dependencies_rec(fn, faas_id, set(), set(), {}, from_deco=from_deco), prune_keys=prune_keys)
 
-def __get_external_dependencies_rec(fn: Callable[[Any], Any], faas_id: int, closed_s: set[str], from_deco: bool=False) -> str:
     res = ''
+    # the sidecar entry of each value that is loaded lazily
+    lazy = {}
+    for var_name, var_obj, referenced_by, is_intracluster, alias_of, kept_keys in dependencies:
+        sidecar_size = 0
+        if alias_of is not None:
+            add = f'{var_name} = {alias_of}\n'
+            if alias_of in lazy:
+                lazy[var_name] = lazy[alias_of]
+                add = ''
+        else:
+            add = __expand_dependency_item(var_name, var_obj, sidecar)
+            if is_intracluster:
+                add = add.replace('intracluster_proxy', var_name)
+            if sidecar is not None and var_name in sidecar:
+                sidecar_size = len(sidecar[var_name])
+                if lazy_uses is not None:
+                    lazy[var_name] = var_name
+                    add = ''
+
+        res += add
+        if report is not None:
+            kind = 'proxy' if is_intracluster else 'function' if inspect.isfunction(var_obj) else 'module' if inspect.ismodule(var_obj) else 'value'
+            storage = 'alias' if alias_of is not None else 'sidecar' if sidecar_size > 0 else 'inline'
+            report.dependencies.append(CapturedDependency(var_name, kind, referenced_by, storage, len(add.encode('utf-8')) + sidecar_size, alias_of=alias_of, kept_keys=kept_keys))
+
+    if len(lazy) > 0:
+        # the captured values of a function are globals in the handler, even those it read from its closure
+        functions = [(fn.__name__, fn)] + [(var_name, var_obj) for var_name, var_obj, *_ in dependencies if inspect.isfunction(var_obj)]
+        for fn_name, dependency_fn in functions:
+            code = dependency_fn.__code__
+            names = {var_name: lazy[var_name] for var_name in __get_global_names(code) + code.co_freevars if var_name in lazy}
+            if len(names) > 0:
+                lazy_uses[fn_name] = names
+
+    return res
+
+def __get_external_dependencies_rec(fn: Callable[[Any], Any], faas_id: int, closed_s: set[str], checked_s: set[str], bindings_s: dict[Callable, tuple | None], from_deco: bool=False) -> list[tuple[str, Any, str, bool]]:
+    """
+    Gets the dependencies of `fn`, and of the functions it captures, as `(name, value, referencing function name,
+    is intra-cluster proxy)`, each followed by its own dependencies. Adds the names it checks to `checked_s`, and
+    `bindings_s` keeps the bindings of the functions read during the current publish, see `__read_bindings`
+    """
+    res = []
 
     try:
         # FIXME: Fails for recursive functions defined inside another function or a class
-        #         this looks like a problem on `inspect`'s end. (py3.10)
-        outside_vars = inspect.getclosurevars(fn)
+        #         their own cell is still empty when they are decorated. (py3.10)
+        outside_vars = __get_closure_vars(fn)
     except ValueError as e:
-        raise Exception(f"A value error was raised in `inspect.getclosurevars`. This is likely because you are decorating a recursive function within a function/closure or class. For the meantime, use `builder.mirror_in_faas`:\nError message {repr(e)} while expanding dependencies of function `{fn.__name__}` ({fn})")
+        raise Exception(f"A value error was raised while reading the closure. This is likely because you are decorating a recursive function within a function/closure or class. For the meantime, use `builder.mirror_in_faas`:\nError message {repr(e)} while expanding dependencies of function `{fn.__name__}` ({fn})")
 
     # recursive functions with decorator always have the function itself as unbound
     is_recursive_deco = from_deco and fn.__name__ in outside_vars.unbound
     if (is_recursive_deco and len(outside_vars.unbound) > 1) or (not is_recursive_deco and len(outside_vars.unbound) > 0) :
         warnings.warn(f'The function {fn.__name__} contains unbound variables ({outside_vars.unbound})that cannot be resolved at build time. These may result in errors within the built OpenFaaS function.', SyntaxWarning)
+    if len(outside_vars.unbound) > 0:
+        # its walk is not cached, see `__get_walked_dependencies`
+        bindings_s[fn] = None
     
     closed_s.add(fn.__name__)
     for group in [outside_vars.nonlocals, outside_vars.globals]:
         for var_name, var_obj in group.items():
+            checked_s.add(var_name)
             if var_name not in closed_s:
                 closed_s.add(var_name)
 
@@ -87,30 +316,130 @@ def __get_external_dependencies_rec(fn: Callable[[Any], Any], faas_id: int, clos
                     # discard the original proxy
                     var_obj = __build_intracluster_proxy(var_obj)
 
-                add = __expand_dependency_item(var_name, var_obj)
+                res.append((var_name, var_obj, fn.__name__, is_intracluster))
                 if is_intracluster:
-                    add = add.replace('intracluster_proxy', var_name)
+                    # not cached: the proxy is a new function
+                    res += __get_external_dependencies_rec(var_obj, faas_id, closed_s, checked_s, bindings_s)
+                elif inspect.isfunction(var_obj):
+                    res += __get_walked_dependencies(var_obj, faas_id, closed_s, checked_s, bindings_s)
 
-                res += add
-                if inspect.isfunction(var_obj):
-                    add = __get_external_dependencies_rec(var_obj, faas_id, closed_s)
-                    res += add
+    return res
+
+def __get_walked_dependencies(fn: Callable[[Any], Any], faas_id: int, closed_s: set[str], checked_s: set[str], bindings_s: dict[Callable, tuple | None]) -> list[tuple[str, Any, str, bool]]:
+    """
+    Same as `__get_external_dependencies_rec`, reusing the walk from `fn` cached by a previous one, see `__walk_cache`
+    """
+    walk = __walk_cache.get(fn, {}).get(faas_id)
+    is_new_walk = walk is None
+    if is_new_walk:
+        # walk from `fn` alone, so that later walks can reuse it
+        walked_closed_s, walked_checked_s = set(), set()
+        dependencies = __get_external_dependencies_rec(fn, faas_id, walked_closed_s, walked_checked_s, bindings_s)
+
+        functions = tuple([fn] + [var_obj for _, var_obj, _, is_intracluster in dependencies if inspect.isfunction(var_obj) and not is_intracluster])
+        bindings = tuple(bindings_s[walked_fn] if walked_fn in bindings_s else bindings_s.setdefault(walked_fn, __read_bindings(walked_fn)) for walked_fn in functions)
+        walk = (dependencies, frozenset(walked_checked_s - {fn.__name__}), frozenset(walked_closed_s), functions, bindings)
+        # functions with unbound names are walked each time, to warn about them
+        if None not in bindings:
+            __walk_cache.setdefault(fn, {})[faas_id] = walk
+
+    dependencies, walked_checked_s, walked_closed_s, functions, bindings = walk
+    # the walk is the same if the names it checked are not captured already, and its functions are still bound as they were
+    if walked_checked_s.isdisjoint(closed_s) and (is_new_walk or all(map(__is_bound_in_publish, functions, bindings, repeat(bindings_s, len(functions))))):
+        closed_s |= walked_closed_s
+        checked_s |= walked_checked_s
+        return list(dependencies)
+
+    return __get_external_dependencies_rec(fn, faas_id, closed_s, checked_s, bindings_s)
+
+def __is_bound_in_publish(fn: Callable[[Any], Any], bindings: tuple, bindings_s: dict[Callable, tuple | None]) -> bool:
+    # the bindings of each function are checked once per publish, and those found current are kept in `bindings_s`
+    current = bindings_s.get(fn, UNBOUND)
+    if current is bindings:
+        return True
+    if current is UNBOUND and __is_bound_as(fn, bindings):
+        bindings_s[fn] = bindings
+        return True
+    if current is UNBOUND:
+        current = bindings_s[fn] = __read_bindings(fn)
+    return current is not None and all(map(operator.is_, current[1], bindings[1])) and all(map(operator.is_, current[2], bindings[2]))
+
+def __prune_dependencies(fn: Callable[[Any], Any], dependencies: list[tuple[str, Any, str, bool]], prune_keys: bool = True) -> list[tuple[str, Any, str, bool, str | None, tuple[int, int] | None]]:
+    """
+    Adds to each dependency the name of an identical value captured before it, that it is defined as, and the
+    `(kept, total)` keys of the dictionaries it prunes. Only values are pruned, never functions or modules:
+     - values captured under several names are defined once, and then assigned. Values that are not the same object
+       are only merged if they are immutable (strings, bytes, tuples and frozensets) and equal
+     - with `prune_keys`, dictionaries captured under a single name, that all the functions of the handler only read
+       with constant keys (`TABLE['key']`), keep only those keys. Any other use of the name keeps the whole dictionary
+    """
+    # how each function of the handler uses the names it loads
+    subscripts = {}
+    if prune_keys:
+        for code in [fn.__code__] + [var_obj.__code__ for _, var_obj, _, _ in dependencies if inspect.isfunction(var_obj)]:
+            __merge_subscripted_names(subscripts, __get_subscripted_names(code))
+
+    captured_ids = {}
+    for _, var_obj, _, _ in dependencies:
+        captured_ids[id(var_obj)] = captured_ids.get(id(var_obj), 0) + 1
+
+    res = []
+    defined_by_id, defined_by_value = {}, {}
+    for var_name, var_obj, referenced_by, is_intracluster in dependencies:
+        alias_of, kept_keys = None, None
+        is_value = not (is_intracluster or inspect.isfunction(var_obj) or inspect.ismodule(var_obj))
+
+        if is_value:
+            alias_of = defined_by_id.get(id(var_obj))
+            if alias_of is None and type(var_obj) in IMMUTABLE_VALUE_TYPES:
+                try:
+                    value_key = (type(var_obj), hash(var_obj))
+                    for other_name, other_obj in defined_by_value.get(value_key, []):
+                        if type(other_obj) is type(var_obj) and other_obj == var_obj:
+                            alias_of = other_name
+                            break
+                    else:
+                        defined_by_value.setdefault(value_key, []).append((var_name, var_obj))
+                except TypeError:
+                    # e.g. tuples of mutable values
+                    pass
+
+            if alias_of is None:
+                defined_by_id[id(var_obj)] = var_name
+
+            keys = subscripts.get(var_name)
+            if alias_of is None and type(var_obj) is dict and keys is not None and captured_ids[id(var_obj)] == 1:
+                kept = {key: value for key, value in var_obj.items() if key in keys}
+                if len(kept) < len(var_obj):
+                    kept_keys = (len(kept), len(var_obj))
+                    var_obj = kept
+
+        res.append((var_name, var_obj, referenced_by, is_intracluster, alias_of, kept_keys))
 
     return res
 
 def __expand_dependency_item(
     var_name: str, 
-    var_obj: Any) -> str:
+    var_obj: Any,
+    sidecar: dict[str, bytes] | None = None) -> str:
     """
     Gets the line to insert in the template to define <var_name> with value <var_obj> in the server
     """
+    # functions are defined by their source, cached with their code. Lambda sources already include the name
+    if inspect.isfunction(var_obj):
+        return __get_fn_source(var_obj) + '\n'
+
     # avoid circular dependency
-    from .protocol import __pack_repr_or_protocol
+    from .protocol import __pack_repr_or_protocol, __pack_captured_to_sidecar
     res = ''
 
-    # only assign name to variables that can be assigned; i.e everything except non-functions. Lambda sources already include the name
-    if not inspect.isfunction(var_obj):
-        res += f'{var_name} = '
+    # only assign name to variables that can be assigned; i.e everything except non-functions
+    res += f'{var_name} = '
+
+    if sidecar is not None:
+        packed_line = __pack_captured_to_sidecar(var_name, var_obj, sidecar)
+        if packed_line is not None:
+            return res + packed_line + '\n'
 
     # Since we are pulling in a dependency, everything is assumed to be safe
     #  i.e: it's your fault if you use an unsafe dependency in your own function
@@ -123,6 +452,7 @@ def __build_intracluster_proxy(faas_fn: Callable[[Any], Any]) -> Callable[[Any],
 
     is_proto = __is_away_protocol_fn(faas_fn)
     is_safe_proto = __is_away_protocol_safe_fn(faas_fn)
+    is_batch = __is_away_protocol_batch_fn(faas_fn)
 
     # avoid circular dependency
     from .protocol import make_client_pack_args_fn, make_client_unpack_args_fn
@@ -146,17 +476,24 @@ def __build_intracluster_proxy(faas_fn: Callable[[Any], Any]) -> Callable[[Any],
     def intracluster_proxy(*args): # pragma: no cover
         # This function dependency has been detected to be present in the same cluster by Away
         import requests
-        args = pack_args(args)
+        args = pack_args([args] if is_batch else args)
         res = requests.get(endpoint, data=args)
 
         if res.status_code != 200:
             raise Exception(f'Function returned non 200 code: {res.status_code}, {res.text}')
 
-        return unpack_args(res.text)
+        res = unpack_args(res.text)
+        if is_batch:
+            # batch-mode functions answer with one `[ok, result]` item per args bundle
+            is_ok, res = res[0]
+            if not is_ok:
+                raise Exception(f'Function raised: {res}')
+
+        return res
 
     if is_proto:
         from .builder import __add_protocol_marker_attrs
-        __add_protocol_marker_attrs(intracluster_proxy, is_safe_proto)
+        __add_protocol_marker_attrs(intracluster_proxy, is_safe_proto, is_batch)
 
     return intracluster_proxy
 
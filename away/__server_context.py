@@ -0,0 +1,24 @@
+import contextvars
+
+# What a handler knows of the request it is serving: its headers, and what the unpacker found out for the packer,
+#  such as the protocol to answer in. Handlers on the of-watchdog serve requests concurrently, each in its own
+#  context. On the classic watchdog, each request has its own process and the headers are environment variables
+__away_request_state = contextvars.ContextVar('away_request_state')
+
+# The same, as it is defined in the handler, which cannot import away
+SERVER_CONTEXT_SOURCE = "import contextvars\n__away_request_state = contextvars.ContextVar('away_request_state')\n"
+
+def __server_request_state(): # pragma: no cover
+    try:
+        return __away_request_state.get()
+    except LookupError:
+        state = {}
+        __away_request_state.set(state)
+        return state
+
+def __server_request_header(name): # pragma: no cover
+    headers = __server_request_state().get('headers')
+    if headers is None:
+        import os
+        return os.getenv('Http_' + name.replace('-', '_'))
+    return headers.get(name.lower())
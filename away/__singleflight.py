@@ -0,0 +1,65 @@
+import asyncio
+import threading
+import weakref
+from concurrent.futures import Future
+
+from typing import Callable, Any, Awaitable
+
+class SingleFlight():
+    """
+    Coalesces identical calls made at the same time from several threads: only the first caller for a key runs the call,
+    the others wait for its outcome
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__in_flight = {}
+
+    def do(self, key: str, call: Callable[[], Any]) -> Any:
+        with self.__lock:
+            fut = self.__in_flight.get(key)
+            is_leader = fut is None
+            if is_leader:
+                fut = Future()
+                self.__in_flight[key] = fut
+
+        if not is_leader:
+            return fut.result()
+
+        try:
+            res = call()
+        except BaseException as e:
+            self.__forget(key)
+            fut.set_exception(e)
+            raise
+
+        self.__forget(key)
+        fut.set_result(res)
+        return res
+
+    def __forget(self, key: str):
+        # calls made from now on start a new flight
+        with self.__lock:
+            del self.__in_flight[key]
+
+class AsyncSingleFlight():
+    """
+    Coalesces identical calls awaited at the same time on an event loop: only the first caller for a key runs the call,
+    the others wait for its outcome
+    """
+
+    def __init__(self):
+        # calls in flight, per event loop
+        self.__in_flight = weakref.WeakKeyDictionary()
+
+    async def do(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        in_flight = self.__in_flight.setdefault(asyncio.get_running_loop(), {})
+
+        task = in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            in_flight[key] = task
+            task.add_done_callback(lambda _: in_flight.pop(key, None))
+
+        # a cancelled caller must not cancel the call for the others waiting on it
+        return await asyncio.shield(task)
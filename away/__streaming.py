@@ -0,0 +1,79 @@
+from typing import Callable, Any, Iterable, Iterator, AsyncIterator, Tuple
+
+from .exceptions import FaasReturnedError
+
+# Handlers of generator functions send each yielded item as its own record: a header line with the kind of the
+#  record ('=' for an item, '!' for an error that ended the stream) and the size of its payload in bytes,
+#  followed by the payload
+ITEM_RECORD = ord('=')
+ERROR_RECORD = ord('!')
+
+class RecordDecoder():
+    """
+    Splits the records of a streamed response as its bytes arrive
+    """
+
+    def __init__(self):
+        self.__buffer = bytearray()
+
+    def feed(self, data: bytes) -> list[Tuple[bool, str]]:
+        """
+        Adds the next bytes of the response, and returns the records completed by them as `(is_item, payload)`
+        """
+        self.__buffer += data
+
+        records = []
+        pos = 0
+        while True:
+            # records may be separated by whitespace, e.g. the newline `print` adds to the output of the handler
+            while pos < len(self.__buffer) and self.__buffer[pos] in b' \r\n':
+                pos += 1
+
+            end_of_header = self.__buffer.find(b'\n', pos)
+            if end_of_header == -1:
+                break
+
+            kind, size = self.__buffer[pos], int(self.__buffer[pos + 1:end_of_header])
+            end = end_of_header + 1 + size
+            if len(self.__buffer) < end:
+                break
+
+            records.append((kind == ITEM_RECORD, self.__buffer[end_of_header + 1:end].decode('utf-8')))
+            pos = end
+
+        del self.__buffer[:pos]
+        return records
+
+    def close(self):
+        """
+        Ensures that the response did not end in the middle of a record
+        """
+        if self.__buffer.strip() != b'':
+            raise FaasReturnedError(f'The stream ended in the middle of a record: {bytes(self.__buffer[:64])}')
+
+def __decode_records(function_name: str, records: list[Tuple[bool, str]], unpack_args: Callable[[str], Any] | None) -> Iterator[Any]:
+    for is_item, payload in records:
+        if not is_item:
+            raise FaasReturnedError(f'Function {function_name} raised: {payload}')
+        yield payload if unpack_args is None else unpack_args(payload)
+
+def __iter_records(function_name: str, chunks: Iterable[bytes], unpack_args: Callable[[str], Any] | None) -> Iterator[Any]:
+    """
+    Decodes the items of a streamed response from the chunks of its body, as they arrive
+    """
+    decoder = RecordDecoder()
+    for chunk in chunks:
+        yield from __decode_records(function_name, decoder.feed(chunk), unpack_args)
+
+    decoder.close()
+
+async def __aiter_records(function_name: str, chunks: AsyncIterator[bytes], unpack_args: Callable[[str], Any] | None) -> AsyncIterator[Any]:
+    """
+    Like `__iter_records`, for the chunks of a streamed `AsyncResponse`
+    """
+    decoder = RecordDecoder()
+    async for chunk in chunks:
+        for item in __decode_records(function_name, decoder.feed(chunk), unpack_args):
+            yield item
+
+    decoder.close()
@@ -0,0 +1,290 @@
+import os
+import json
+import tempfile
+import threading
+from hashlib import sha256
+from abc import ABC, abstractmethod
+
+from typing import Callable, Any, Iterable
+
+try:
+    import boto3
+except ImportError: # pragma: no cover
+    boto3 = None
+
+# Requests with arguments passed by reference start with a marker line, followed by a JSON list with one item per
+#  argument: `["ref", <sha256 of its packed form>]` for the arguments in the blob store, `["inline", <packed form>]`
+#  for the others. Each argument is packed on its own, as a bundle of one argument
+REFERENCES_MARKER = '%away-refs\n'
+
+# Where handlers keep the blobs they have read, across the requests served by the same replica
+HANDLER_CACHE_DIR = '/tmp/away-blobs'
+
+class BlobStore(ABC):
+    """
+    A content-addressed store of the arguments a proxy passes by reference: arguments that take at least `threshold`
+    bytes once packed are uploaded once, under the sha256 of their packed form, and calls only send that hash.
+    Calls that repeat a large argument, like a reference dataset, then only upload it on the first call
+
+    The function's handler reads the blobs from the store, and keeps the last ones it used, up to `cache_size` bytes,
+    in a local least-recently-used cache. The handler must be built with the same store, see `builder.mirror_in_faas`
+
+    See `FilesystemBlobStore`, `LocalBlobStore` and `S3BlobStore`. Other stores implement `exists`, `write`, `read`
+    and `server_read_source`
+
+    Usage:
+    store = FilesystemBlobStore('/mnt/shared/away-blobs')
+
+    @builder.publish(faas, blob_store=store)
+    def nearest(dataset, point):
+        ...
+    """
+
+    def __init__(self, threshold: int = 2**20, cache_size: int = 2**29):
+        self.threshold = threshold
+        self.cache_size = cache_size
+        # keys known to be in the store, not to check them again
+        self.__stored = set()
+        self.__lock = threading.Lock()
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """
+        Checks if the store has the blob `key`
+        """
+
+    @abstractmethod
+    def write(self, key: str, data: bytes):
+        """
+        Writes `data` to the store as the blob `key`
+        """
+
+    @abstractmethod
+    def read(self, key: str) -> bytes:
+        """
+        Reads the blob `key` from the store
+        """
+
+    @abstractmethod
+    def server_read_source(self) -> str:
+        """
+        Returns the source of the handler's `__away_read_blob(key)`, which reads a blob from the store
+        """
+
+    def put(self, data: bytes) -> str:
+        """
+        Stores `data` unless it is already in the store, and returns its key
+        """
+        key = sha256(data).hexdigest()
+        with self.__lock:
+            if key in self.__stored:
+                return key
+
+        if not self.exists(key):
+            self.write(key, data)
+
+        with self.__lock:
+            self.__stored.add(key)
+        return key
+
+    def make_client_pack_args_fn(self, pack_args: Callable[[Iterable[Any]], str]) -> Callable[[Iterable[Any]], str]:
+        """
+        Returns a packer of the arguments that passes the large ones by reference, and packs them with `pack_args`.
+        Calls with several arguments are sent as a list of them, inline or by reference, even if none is large.
+
+        Large arguments are packed and hashed on every call, also when they are already in the store: hashing them
+        (sha256, at hundreds of MB/s) costs less than packing them, and keying them by their content rather than by
+        the identity of the objects means a mutated argument is never sent as its previous version
+        """
+
+        def pack_args_by_reference(it):
+            # each argument is packed once, as a bundle of one, and those packed forms make up the request
+            args = list(it)
+            packed_args = [pack_args((arg,)) for arg in args]
+            if len(args) == 0 or not all(isinstance(packed_arg, str) for packed_arg in packed_args):
+                return pack_args(args)
+
+            items = []
+            for packed_arg in packed_args:
+                data = packed_arg.encode('utf-8')
+                if len(data) >= self.threshold:
+                    items.append(['ref', self.put(data)])
+                else:
+                    items.append(['inline', packed_arg])
+
+            # a bundle of one argument is the same as the argument packed on its own
+            if len(items) == 1 and items[0][0] == 'inline':
+                return packed_args[0]
+            return REFERENCES_MARKER + json.dumps(items)
+
+        return pack_args_by_reference
+
+    def server_source(self, server_unpack_args_name: str) -> str:
+        """
+        Returns the source of the handler's `__away_refs_unpack_args`, which resolves the arguments passed by reference
+        with `__server_read_cached_blob` and falls back to the given server function for the other requests
+        """
+        unpack_source = f"""def __away_refs_unpack_args(req):
+    if not req.startswith({REFERENCES_MARKER!r}):
+        return {server_unpack_args_name}(req)
+
+    import json
+    args = []
+    for kind, value in json.loads(req[{len(REFERENCES_MARKER)}:]):
+        if kind == 'ref':
+            value = __server_read_cached_blob(value, __away_read_blob, {HANDLER_CACHE_DIR!r}, {self.cache_size}).decode('utf-8')
+        # bundles of a single argument are the argument itself
+        arg, _ = {server_unpack_args_name}(value)
+        args.append(arg)
+
+    if len(args) == 1:
+        return args[0], 1
+    if len(args) == 0:
+        return None, 0
+    return tuple(args), len(args)
+"""
+        return self.server_read_source() + '\n' + unpack_source
+
+class FilesystemBlobStore(BlobStore):
+    """
+    A blob store in a directory shared by the caller and the function's replicas, e.g. a volume mounted in both
+
+    Usage:
+    store = FilesystemBlobStore('/mnt/shared/away-blobs', threshold=2**16)
+    """
+
+    def __init__(self, directory: str, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.directory, key))
+
+    def write(self, key: str, data: bytes):
+        # other writers of the same blob write the same bytes: the last rename wins
+        path = os.path.join(self.directory, key)
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False) as blob:
+            blob.write(data)
+        os.replace(blob.name, path)
+
+    def read(self, key: str) -> bytes:
+        with open(os.path.join(self.directory, key), 'rb') as blob:
+            return blob.read()
+
+    def server_read_source(self) -> str:
+        return f"""def __away_read_blob(key):
+    import os
+    with open(os.path.join({self.directory!r}, key), 'rb') as blob:
+        return blob.read()
+"""
+
+    def __repr__(self) -> str:
+        return f'FilesystemBlobStore({self.directory!r})'
+
+class LocalBlobStore(FilesystemBlobStore):
+    """
+    A stand-in blob store in a local temporary directory, for functions that run on the same machine as the caller,
+    e.g. while developing against a local cluster with the directory mounted
+
+    Usage:
+    store = LocalBlobStore()
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(os.path.join(tempfile.gettempdir(), 'away-blob-store'), **kwargs)
+
+    def __repr__(self) -> str:
+        return f'LocalBlobStore({self.directory!r})'
+
+class S3BlobStore(BlobStore):
+    """
+    A blob store in a bucket of an S3-compatible endpoint, such as AWS S3 or MinIO. Requires `boto3` here and in the
+    function's image, where it is added to the requirements. Both read their credentials the way `boto3` does,
+    e.g. from the `AWS_ACCESS_KEY_ID` and `AWS_SECRET_ACCESS_KEY` environment variables: credentials are never written
+    to the handler
+
+    Usage:
+    store = S3BlobStore('away-blobs', endpoint_url='http://minio.minio.svc:9000')
+    """
+
+    def __init__(self, bucket: str, endpoint_url: str | None = None, prefix: str = '', **kwargs):
+        assert boto3 is not None, 'S3BlobStore requires boto3. Install it with `python -m pip install boto3`'
+
+        super().__init__(**kwargs)
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.prefix = prefix
+        self.client = boto3.client('s3', endpoint_url=endpoint_url)
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+            return True
+        except self.client.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def write(self, key: str, data: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data)
+
+    def read(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)['Body'].read()
+
+    def server_read_source(self) -> str:
+        return f"""def __away_read_blob(key):
+    import boto3
+    s3 = boto3.client('s3', endpoint_url={self.endpoint_url!r})
+    return s3.get_object(Bucket={self.bucket!r}, Key={self.prefix!r} + key)['Body'].read()
+"""
+
+    def __repr__(self) -> str:
+        return f'S3BlobStore({self.bucket!r}, endpoint_url={self.endpoint_url!r})'
+
+# The handler's cache of blobs is a directory, so that it outlives the process of a request in the classic watchdog.
+#  Reading a blob marks it as the most recently used; the least recently used ones are evicted above `cache_size` bytes
+def __server_read_cached_blob(key, read_blob, cache_dir, cache_size): # pragma: no cover
+    import os, hashlib
+    path = os.path.join(cache_dir, key)
+    try:
+        with open(path, 'rb') as blob:
+            data = blob.read()
+        os.utime(path)
+        return data
+    except FileNotFoundError:
+        pass
+
+    data = read_blob(key)
+    if hashlib.sha256(data).hexdigest() != key:
+        raise ValueError('The blob ' + key + ' does not match its key')
+    if len(data) > cache_size:
+        return data
+
+    os.makedirs(cache_dir, exist_ok=True)
+    partial = path + '.' + str(os.getpid()) + '.tmp'
+    with open(partial, 'wb') as blob:
+        blob.write(data)
+    os.replace(partial, path)
+
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if not entry.name.endswith('.tmp'):
+            try:
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+            except FileNotFoundError:
+                pass
+    total = sum(size for _, size, _ in entries)
+    for _, size, evicted in sorted(entries):
+        if total <= cache_size:
+            break
+        if evicted == path:
+            continue
+        try:
+            os.remove(evicted)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+    return data
@@ -0,0 +1,113 @@
+import warnings
+
+from .exceptions import HandlerTooLargeError
+
+class CapturedDependency():
+    """
+    A dependency captured in a handler: a function, module or value the published function (or one of its captured
+    functions, `referenced_by`) uses from its scope
+
+    `storage` is where it is defined: `'inline'` in the handler's source, `'sidecar'` in `protocol.CAPTURED_SIDECAR`,
+    or `'alias'` of an identical value captured under another name (`alias_of`). `size` is the bytes it takes in
+    both the handler and the sidecar
+    """
+
+    def __init__(self, name: str, kind: str, referenced_by: str, storage: str, size: int, alias_of: str | None = None, kept_keys: tuple[int, int] | None = None):
+        self.name = name
+        self.kind = kind
+        self.referenced_by = referenced_by
+        self.storage = storage
+        self.size = size
+        self.alias_of = alias_of
+        # (kept, total) keys of dictionaries of which only some keys are used
+        self.kept_keys = kept_keys
+
+    def __repr__(self) -> str:
+        return f'CapturedDependency({self.name!r}, kind={self.kind!r}, referenced_by={self.referenced_by!r}, storage={self.storage!r}, size={self.size})'
+
+class BuildReport():
+    """
+    What ended up in the handler of a function: the size of each captured dependency, the function that referenced
+    it, and the size of the handler and of its sidecar. Filled in by `builder.__build_handler_template`, and
+    available as the `__away_build_report__` attribute of the proxies returned by `builder.mirror_in_faas`
+
+    Usage:
+    @builder.publish(faas)
+    def tokenize(text):
+        ...
+
+    print(tokenize.__away_build_report__)
+    """
+
+    def __init__(self):
+        self.fn_name = None
+        self.dependencies: list[CapturedDependency] = []
+        self.handler_size = 0
+        self.sidecar_size = 0
+
+    @property
+    def total_size(self) -> int:
+        return self.handler_size + self.sidecar_size
+
+    @property
+    def captured_size(self) -> int:
+        return sum(dependency.size for dependency in self.dependencies)
+
+    def __str__(self) -> str:
+        lines = [f'Handler of {self.fn_name}: {format_size(self.total_size)} (handler {format_size(self.handler_size)}, sidecar {format_size(self.sidecar_size)}, captured dependencies {format_size(self.captured_size)})']
+        for dependency in sorted(self.dependencies, key=lambda dependency: -dependency.size):
+            note = ''
+            if dependency.alias_of is not None:
+                note = f', same value as {dependency.alias_of}'
+            elif dependency.kept_keys is not None:
+                note = f', kept {dependency.kept_keys[0]} of {dependency.kept_keys[1]} keys'
+            lines.append(f'  {dependency.name:<24} {format_size(dependency.size):>10}  {dependency.kind} {dependency.storage}, referenced by {dependency.referenced_by}{note}')
+        return '\n'.join(lines)
+
+class SizeLimits():
+    """
+    Size thresholds of handlers, in bytes, checked when they are built: above a `warn_*` threshold the build warns,
+    above a `fail_*` threshold it raises a `HandlerTooLargeError` before the function is published.
+    `*_dependency_size` apply to each captured dependency, `*_handler_size` to the handler and its sidecar together.
+    `None` disables a threshold
+
+    Usage:
+    @builder.publish(faas, size_limits=SizeLimits(fail_dependency_size=2**20))
+    def tokenize(text):
+        ...
+    """
+
+    def __init__(self,
+        warn_dependency_size: int | None = 2**20,
+        fail_dependency_size: int | None = None,
+        warn_handler_size: int | None = 2**23,
+        fail_handler_size: int | None = None):
+
+        self.warn_dependency_size = warn_dependency_size
+        self.fail_dependency_size = fail_dependency_size
+        self.warn_handler_size = warn_handler_size
+        self.fail_handler_size = fail_handler_size
+
+    def check(self, report: BuildReport):
+        """
+        Warns, or raises a `HandlerTooLargeError`, for the dependencies and the handler of `report` above the thresholds
+        """
+        for dependency in report.dependencies:
+            self.__check(dependency.size, self.warn_dependency_size, self.fail_dependency_size,
+                f'The dependency {dependency.name} of {report.fn_name}, referenced by {dependency.referenced_by}, takes {format_size(dependency.size)}')
+
+        self.__check(report.total_size, self.warn_handler_size, self.fail_handler_size,
+            f'The handler of {report.fn_name} takes {format_size(report.total_size)}')
+
+    def __check(self, size: int, warn_size: int | None, fail_size: int | None, message: str):
+        if fail_size is not None and size > fail_size:
+            raise HandlerTooLargeError(f'{message}, above the limit of {format_size(fail_size)}')
+        if warn_size is not None and size > warn_size:
+            warnings.warn(f'{message}, above {format_size(warn_size)}. Oversized handlers slow down builds and cold starts')
+
+def format_size(size: int) -> str:
+    for unit in ['B', 'KiB', 'MiB']:
+        if size < 1024:
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GiB'
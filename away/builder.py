@@ -14,6 +14,7 @@ import yaml
 import subprocess
 import os
 import shutil
+import pickle
 
 from .common_utils import parametrized
 from .__fn_utils import __get_fn_source, __get_external_dependencies
@@ -26,19 +27,35 @@ from .__builder_async import from_name as async_from_name
 
 from .protocol import __safe_server_unpack_args, __unsafe_server_unpack_args
 from .protocol import __safe_server_pack_args, __unsafe_server_pack_args
-from .protocol import make_client_pack_args_fn, make_client_unpack_args_fn
+from .protocol import __safe_server_unpack_batch_args, __unsafe_server_unpack_batch_args
+from .protocol import __server_v2_codec_source
+from .protocol import make_client_stream_pack_args_fn
+from .protocol import make_client_negotiated_pack_args_fn, make_client_negotiated_unpack_args_fn, SignatureCodec
+from .protocol import make_client_negotiated_signature_pack_args_fn, make_client_negotiated_signature_unpack_args_fn
+from .protocol import get_protocol_codec, YAML_CODEC
+from .protocol import __server_load_captured, __server_load_lazily, CAPTURED_SIDECAR, CAPTURED_PICKLE_PROTOCOL
+from .compression import __server_request_stream, __server_decode_payload, __server_encode_payload
+from .blobstore import BlobStore, __server_read_cached_blob
+from .__server_context import __server_request_state, __server_request_header, SERVER_CONTEXT_SOURCE
+from .build_report import BuildReport, SizeLimits
 
 from .FaasConnection import FaasConnection
 
 # Functions are defined as separate implementation to avoid including extra information
 #  and checks in the published function
-HANDLER_TEMPLATE = '''
+# The handlers of every mode start with the same preamble: the codecs, the captured dependencies, the function
+#  and the deadline check. The mode's `handle` follows it
+HANDLER_PREAMBLE = '''
 # Built with Away version {} on {}
 
 # Args unpacker
 {}
 # Args packer
 {}
+# Payload encoding and protocol v2 codec
+{}
+# State of the request being served
+{}
 # Captured dependencies at build time
 {}
 # Wrapped to-publish function
@@ -46,9 +63,35 @@ HANDLER_TEMPLATE = '''
 
 EXPECTED_LEN_OF_ARGS = {}
 
-def handle(req):
+# The caller sends the time left before the deadline of the call, in seconds, in the X-Away-Time-Remaining header.
+#  It is turned into a deadline on the monotonic clock of the replica as the request arrives
+def __away_start_deadline():
+    import time, signal, threading
+    remaining = __server_request_header('X-Away-Time-Remaining')
+    state = __server_request_state()
+    state['deadline_at'] = None if remaining is None else time.monotonic() + float(remaining)
+
+    # The watchdog runs each call in its own process: stop working once nobody waits for the result
+    if remaining is not None and float(remaining) > 0 and threading.current_thread() is threading.main_thread():
+        def on_deadline(signum, frame):
+            raise TimeoutError('The deadline of the call passed')
+        signal.signal(signal.SIGALRM, on_deadline)
+        signal.setitimer(signal.ITIMER_REAL, float(remaining))
+
+def __away_check_deadline():
+    import time
+    deadline_at = __server_request_state().get('deadline_at')
+    if deadline_at is not None and time.monotonic() >= deadline_at:
+        raise TimeoutError('The deadline of the call passed')
+
+'''
+
+HANDLER_TEMPLATE = HANDLER_PREAMBLE + '''def handle(req):
+    __away_start_deadline()
+    __away_check_deadline()
+
     # Unpack args:
-    args_bundle, args_len = {}(req)
+    args_bundle, args_len = {}(__server_decode_payload(req))
     
     # Ensure correct signature
     assert args_len == EXPECTED_LEN_OF_ARGS, 'The function takes ' + str(EXPECTED_LEN_OF_ARGS) + ' arguments. ' + str(args_len) + ' were provided:' + str(args_bundle)
@@ -59,23 +102,171 @@ def handle(req):
     # Call
     res = {}({})
 
-    # Pack and send back
-    return {}(res)
+    # Pack, compress if the caller accepts it and send back
+    return __server_encode_payload({}(res))
+
+'''
+
+# Batch mode: the request carries a list of argument bundles, and the response a list of
+#  `[ok, result or error]` items, one per bundle
+BATCH_HANDLER_TEMPLATE = HANDLER_PREAMBLE + '''def handle(req):
+    __away_start_deadline()
+
+    # Unpack the list of args bundles:
+    batch = {}(__server_decode_payload(req))
+
+    results = []
+    for args_bundle, args_len in batch:
+        try:
+            # Bundles left once the deadline passed fail right away
+            __away_check_deadline()
+
+            # Ensure correct signature
+            assert args_len == EXPECTED_LEN_OF_ARGS, 'The function takes ' + str(EXPECTED_LEN_OF_ARGS) + ' arguments. ' + str(args_len) + ' were provided:' + str(args_bundle)
+
+            # Assign to names
+            {} = args_bundle
+
+            # Call
+            results.append([True, {}({})])
+        except Exception as e:
+            results.append([False, type(e).__name__ + ': ' + str(e)])
+
+    # Pack, compress if the caller accepts it and send back
+    return __server_encode_payload({}(results))
+
+'''
+
+# Streaming mode, for generator functions: each yielded item is sent as its own record, a header line
+#  with the kind of the record and the size of its payload in bytes, followed by the packed item.
+#  An error ends the stream with an error record
+STREAM_HANDLER_TEMPLATE = HANDLER_PREAMBLE + '''def handle_stream(req):
+    __away_start_deadline()
+    __away_check_deadline()
+
+    # Unpack args:
+    args_bundle, args_len = {}(__server_decode_payload(req))
+
+    # Ensure correct signature
+    assert args_len == EXPECTED_LEN_OF_ARGS, 'The function takes ' + str(EXPECTED_LEN_OF_ARGS) + ' arguments. ' + str(args_len) + ' were provided:' + str(args_bundle)
+
+    # Assign to names
+    {} = args_bundle
+
+    # Call, and pack each item as it is yielded
+    try:
+        for item in {}({}):
+            packed = {}(item)
+            yield '=' + str(len(packed.encode())) + '\\n' + packed
+    except Exception as e:
+        error = type(e).__name__ + ': ' + str(e)
+        yield '!' + str(len(error.encode())) + '\\n' + error
+
+def handle(req):
+    # The classic watchdog cannot stream: it sends the output of the handler once it returns
+    return ''.join(handle_stream(req))
+
+'''
+
+# The of-watchdog (`python3-http` templates) imports the handler once per replica and calls `handle(event, context)`
+#  for each request: imports and captured dependencies are only initialized once. Requests are served concurrently,
+#  each with its own state, which holds its headers instead of environment variables. It is appended to the handler
+#  as it is, not formatted
+HTTP_HANDLER_ADAPTER = '''
+# Served by the of-watchdog: concurrent requests, in a long-lived process
+__away_handle = handle
+
+def handle(event, context):
+    import signal, threading
+    token = __away_request_state.set({'headers': {k.lower(): v for k, v in event.headers.items()}})
+    try:
+        res = __away_handle(event.body.decode('utf-8') if isinstance(event.body, bytes) else event.body)
+    except Exception as e:
+        return {'statusCode': 500, 'body': type(e).__name__ + ': ' + str(e)}
+    finally:
+        # the process outlives the request: disarm its deadline
+        if threading.current_thread() is threading.main_thread():
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        __away_request_state.reset(token)
+
+    return {'statusCode': 200, 'body': res}
+'''
+
+# Streaming functions on the of-watchdog: `handle` returns a generator of the records as the body, which the template
+#  sends as it is produced, chunk by chunk, when the content type is `application/octet-stream`. The records are
+#  produced in a copy of the context of the request, since `handle` returns before they are. Errors before the function
+#  runs fail the request, and those of the function end the stream with an error record
+HTTP_STREAM_HANDLER_ADAPTER = '''
+# Served by the of-watchdog: concurrent requests, in a long-lived process, streamed
+def handle(event, context):
+    import contextvars, signal, threading
+    request_context = contextvars.copy_context()
+    def start():
+        __away_request_state.set({'headers': {k.lower(): v for k, v in event.headers.items()}})
+        records = handle_stream(event.body.decode('utf-8') if isinstance(event.body, bytes) else event.body)
+        return records, next(records, None)
+
+    def disarm():
+        # the process outlives the request: disarm its deadline
+        if threading.current_thread() is threading.main_thread():
+            signal.setitimer(signal.ITIMER_REAL, 0)
 
+    try:
+        records, record = request_context.run(start)
+    except Exception as e:
+        disarm()
+        return {'statusCode': 500, 'body': type(e).__name__ + ': ' + str(e)}
+
+    def body(record):
+        try:
+            while record is not None:
+                yield record
+                record = request_context.run(next, records, None)
+        finally:
+            disarm()
+
+    return {'statusCode': 200, 'body': body(record), 'headers': {'Content-type': 'application/octet-stream'}}
 '''
 
+# OpenFaaS templates functions can be published with
+CLASSIC_TEMPLATES = ('python3', 'python3-debian')
+HTTP_TEMPLATES = ('python3-http', 'python3-http-debian')
+
 def __build_handler_template(
     source_fn: Callable,
     server_unpack_args: Callable[[str], Iterable],
     server_pack_args: Callable[[Iterable[Any]], str],
     faas_id: int,
-    from_deco=False) -> str:
+    from_deco=False,
+    batch: bool = False,
+    stream: bool = False,
+    signature_codec: SignatureCodec | None = None,
+    blob_store: BlobStore | None = None,
+    http: bool = False,
+    sidecar: dict[str, bytes] | None = None,
+    report: BuildReport | None = None,
+    size_limits: SizeLimits | None = None,
+    prune_keys: bool = True) -> str:
     """
     Populates `HANDLER_TEMPLATE` with the decorated function, appropriate arg unpacking and checks
+
+    With a `sidecar`, captured values that are not literals are pickled into it, to be written to `CAPTURED_SIDECAR`
+    next to the handler, instead of being written inline. The handler loads them as they are first used
+
+    With a `report`, the size of each captured dependency, and of the handler and its sidecar, are recorded in it.
+    The handler is then checked against `size_limits`, if given, see `build_report.SizeLimits`
+
+    With `prune_keys`, captured dictionaries that are only read with constant keys keep just those keys, see `__fn_utils.__prune_dependencies`
     """
     fn_args = inspect.getfullargspec(source_fn).args
 
-    captured_vars_txt = __get_external_dependencies(source_fn, faas_id, from_deco=from_deco)
+    if report is None and size_limits is not None:
+        report = BuildReport()
+
+    lazy_uses = {}
+    captured_vars_txt = __get_external_dependencies(source_fn, faas_id, from_deco=from_deco, sidecar=sidecar, report=report, lazy_uses=lazy_uses, prune_keys=prune_keys)
+    if sidecar is not None and len(sidecar) > 0:
+        captured_vars_txt = inspect.getsource(__server_load_captured) + '\n' + inspect.getsource(__server_load_lazily) + '\n' + captured_vars_txt
 
     if captured_vars_txt != '':
         warnings.warn(f'[WARN]: The function {source_fn.__name__} uses variables outside function scope in function body. These will be statically assigned to their current values because OpenFaaS functions are stateless', SyntaxWarning) 
@@ -90,23 +281,55 @@ def __build_handler_template(
         fn_arg_names = '_'
 
     source_fn_txt = __get_fn_source(source_fn, from_deco=from_deco)
+    if len(lazy_uses) > 0:
+        # once every function that uses a value of the sidecar is defined
+        source_fn_txt += f'\n\n__server_load_lazily({lazy_uses!r})'
 
     server_unpack_args_txt = inspect.getsource(server_unpack_args).replace('\t\t','')
     server_pack_args_txt = inspect.getsource(server_pack_args).replace('\t\t','')
+    # (de)compression of the payloads, negotiated with the caller, and the codec of protocol v2
+    server_encoding_txt = '\n'.join(inspect.getsource(fn) for fn in [__server_request_stream, __server_decode_payload, __server_encode_payload]) + '\n' + __server_v2_codec_source()
+
+    server_unpack_args_name = server_unpack_args.__name__
+    server_pack_args_name = server_pack_args.__name__
+    if blob_store is not None:
+        # arguments passed by reference are read from the store, or the handler's cache of blobs
+        server_encoding_txt += '\n' + inspect.getsource(__server_read_cached_blob) + '\n' + blob_store.server_source(server_unpack_args_name)
+        server_unpack_args_name = '__away_refs_unpack_args'
+    if signature_codec is not None:
+        # the specialized codec wraps the generic one, which it uses for the calls it cannot represent
+        server_encoding_txt += '\n' + signature_codec.server_source(server_unpack_args_name, server_pack_args_name)
+        server_unpack_args_name = '__away_signature_unpack_args'
+        server_pack_args_name = '__away_signature_pack_args'
+
+    # the request's state, in the handler's own context variable
+    server_context_txt = SERVER_CONTEXT_SOURCE + '\n' + '\n'.join(inspect.getsource(fn) for fn in [__server_request_state, __server_request_header])
 
     handler = __format_handler_template(
         server_unpack_args_txt,
         server_pack_args_txt,
+        server_encoding_txt,
+        server_context_txt,
         source_fn_txt,
         captured_vars_txt,
         fn_args_n,
-        server_unpack_args.__name__,
+        server_unpack_args_name,
         fn_arg_names,
         source_fn.__name__,
         fn_arg_names if not noargs else '',
-        server_pack_args.__name__,
+        server_pack_args_name,
+        template=BATCH_HANDLER_TEMPLATE if batch else STREAM_HANDLER_TEMPLATE if stream else HANDLER_TEMPLATE
     )
 
+    if http:
+        handler += HTTP_STREAM_HANDLER_ADAPTER if stream else HTTP_HANDLER_ADAPTER
+
+    if report is not None:
+        report.fn_name = source_fn.__name__
+        report.handler_size = len(handler.encode('utf-8'))
+        report.sidecar_size = len(pickle.dumps(sidecar, protocol=CAPTURED_PICKLE_PROTOCOL)) if sidecar else 0
+        if size_limits is not None:
+            size_limits.check(report)
 
     return handler
 
@@ -114,6 +337,8 @@ def __build_handler_template(
 def __format_handler_template(
     server_unpack_args,
     server_pack_args,
+    server_encoding,
+    server_context,
     source_fn,
     captured_vars,
     fn_args_n,
@@ -121,16 +346,19 @@ def __format_handler_template(
     fn_arg_names,
     source_fn_name,
     fn_args_names,
-    server_pack_args_name) -> str:
+    server_pack_args_name,
+    template: str = HANDLER_TEMPLATE) -> str:
     """
     Formats HANDLER TEMPLATE. Separated for convenience, readability and the ability to add default information
     """
     
-    return HANDLER_TEMPLATE.format(
+    return template.format(
         version('away'),
         ctime(), # add version information by default
         server_unpack_args,
         server_pack_args,
+        server_encoding,
+        server_context,
         '' if len(captured_vars) == 0 else '# required to resolve captured dependencies\nimport yaml\n' + captured_vars,
         source_fn,
         fn_args_n,
@@ -159,12 +387,14 @@ def faas_function(fn: Callable[[Any], Any], *args, **kwargs) -> Callable[[Any],
         pass
     
     """
-    builder_fn = __from_faas_deco_async if inspect.iscoroutinefunction(fn) else __from_faas_deco_sync
+    builder_fn = __from_faas_deco_async if __is_async_stub(fn) else __from_faas_deco_sync
+    # generator stubs return the items of a function published in streaming mode as they arrive
+    if __is_generator_stub(fn): kwargs.setdefault('stream', True)
 
     return builder_fn(fn, *args, **kwargs)
 
 @parametrized
-def faas_function_with_protocol(fn: Callable[[Any], Any], *args, safe_args: bool = True, **kwargs) -> Callable[[Any], Any] | Callable[[Any], Awaitable]:
+def faas_function_with_protocol(fn: Callable[[Any], Any], *args, safe_args: bool = True, stream_args: bool = False, protocol: int | str | None = None, blob_store: BlobStore | None = None, **kwargs) -> Callable[[Any], Any] | Callable[[Any], Awaitable]:
     """
     Converts a blank function into an OpenFaaS function using away's protocol
 
@@ -173,6 +403,13 @@ def faas_function_with_protocol(fn: Callable[[Any], Any], *args, safe_args: bool
 
     Function stubs marked `async` will be using async wrappers, and vice-versa.
 
+    The version of away's `protocol`, or the identifier of a registered codec (see `protocol.Codec`), is read from
+    the function's annotations on its first call, unless given. Calls use YAML (version 1) if the annotations cannot be read.
+    So is the layout of the function's signature codec, if it was published with one (see `protocol.SignatureCodec`)
+
+    With a `blob_store`, large arguments are passed by reference, see `blobstore.BlobStore`. The function must
+    have been published with the same store
+
     Usage:
     faas = FaasConnection('my_faas_server.endpoint.com', port=1234, user='a', password='12345')
 
@@ -181,16 +418,19 @@ def faas_function_with_protocol(fn: Callable[[Any], Any], *args, safe_args: bool
         pass
     
     """
-    packer = make_client_pack_args_fn(safe_args)
-    unpacker = make_client_unpack_args_fn(safe_args)
+    faas = args[0] if len(args) > 0 else kwargs['faas']
+    protocol, signature = __resolve_client_protocol(protocol, faas, fn.__name__, kwargs, eager=__is_async_stub(fn))
+    packer = __make_client_packer(safe_args, stream_args, kwargs, protocol, blob_store, signature)
+    unpacker = __make_client_unpacker(safe_args, kwargs, protocol, signature)
 
-    builder_fn = __from_faas_deco_async if inspect.iscoroutinefunction(fn) else __from_faas_deco_sync
+    builder_fn = __from_faas_deco_async if __is_async_stub(fn) else __from_faas_deco_sync
+    if __is_generator_stub(fn): kwargs.setdefault('stream', True)
 
     fn = builder_fn(fn, *args, pack_args=packer, unpack_args=unpacker, **kwargs)
-    __add_protocol_marker_attrs(fn, safe_args)
+    __add_protocol_marker_attrs(fn, safe_args, kwargs.get('batch', False))
     return fn
 
-def sync_from_name_with_protocol(*args, safe_args: bool = True, **kwargs) -> Callable[[Any], Any]:
+def sync_from_name_with_protocol(*args, safe_args: bool = True, stream_args: bool = False, protocol: int | str | None = None, blob_store: BlobStore | None = None, **kwargs) -> Callable[[Any], Any]:
     """
     Creates an OpenFaaS sync function from a given name, using away's protocol by default
     The decorator method is still recommended. This builder is intended for building functions with a name that already exists
@@ -205,16 +445,18 @@ def sync_from_name_with_protocol(*args, safe_args: bool = True, **kwargs) -> Cal
     res = env()
     
     """
+    fn_name, faas = args[0] if len(args) > 0 else kwargs['function_name'], args[1] if len(args) > 1 else kwargs['faas']
+    protocol, signature = __resolve_client_protocol(protocol, faas, fn_name, kwargs)
 
     fn = sync_from_name(*args, 
-        pack_args=make_client_pack_args_fn(safe_args),
-        unpack_args=make_client_unpack_args_fn(safe_args),
+        pack_args=__make_client_packer(safe_args, stream_args, kwargs, protocol, blob_store, signature),
+        unpack_args=__make_client_unpacker(safe_args, kwargs, protocol, signature),
         **kwargs
     )
-    __add_protocol_marker_attrs(fn, safe_args)
+    __add_protocol_marker_attrs(fn, safe_args, kwargs.get('batch', False))
     return fn
 
-def async_from_name_with_protocol(*args, safe_args: bool = True, **kwargs) -> Callable[[Any], Awaitable]:
+def async_from_name_with_protocol(*args, safe_args: bool = True, stream_args: bool = False, protocol: int | str | None = None, blob_store: BlobStore | None = None, **kwargs) -> Callable[[Any], Awaitable]:
     """
     Creates an OpenFaaS sync function from a given name, using away's protocol by default
     The decorator method is still recommended. This builder is intended for building functions with a name that already exists
@@ -229,13 +471,16 @@ def async_from_name_with_protocol(*args, safe_args: bool = True, **kwargs) -> Ca
     res = env()
     
     """
+    fn_name, faas = args[0] if len(args) > 0 else kwargs['function_name'], args[1] if len(args) > 1 else kwargs['faas']
+    protocol, signature = __resolve_client_protocol(protocol, faas, fn_name, kwargs, eager=True)
+
     fn = async_from_name(*args,
-        pack_args=make_client_pack_args_fn(safe_args),
-        unpack_args=make_client_unpack_args_fn(safe_args),
+        pack_args=__make_client_packer(safe_args, stream_args, kwargs, protocol, blob_store, signature),
+        unpack_args=__make_client_unpacker(safe_args, kwargs, protocol, signature),
         **kwargs
     )
     
-    __add_protocol_marker_attrs(fn, safe_args)
+    __add_protocol_marker_attrs(fn, safe_args, kwargs.get('batch', False))
     return fn
 
 @parametrized
@@ -270,6 +515,13 @@ def mirror_in_faas(
     enable_dev_building: bool = False,
     server_unpack_args: Callable[[str], Tuple] | None = None,
     server_pack_args: Callable[[Iterable[Any]], str] | None = None,
+    batch: bool = False,
+    stream_args: bool = False,
+    protocol: int = 1,
+    blob_store: BlobStore | None = None,
+    template: str = 'python3',
+    size_limits: SizeLimits | None = None,
+    prune_keys: bool = True,
     __from_deco: bool = False,
     **kwargs) -> Callable[[Any], Any]:
     """
@@ -283,10 +535,48 @@ def mirror_in_faas(
         return fibbonacci(n-1) + fibbonacci(n-2)
 
     fibbonacci_mirrored_in_faas = mirror_in_faas(fibbonacci, faas)
+
+    With `batch=True`, the function is published in batch mode: every request carries a list of argument bundles.
+    The returned proxy then also has a `batch` method to run many calls in a single request:
+
+    fibbonacci_mirrored_in_faas.batch([(1,), (2,), (3,)]) # returns [1, 1, 2]
+
+    With `stream_args=True`, the proxy packs the arguments while it sends them, see `protocol.StreamedArgs`
+
+    Functions use version 1 of away's protocol (YAML) by default. With `protocol=2`, they use the msgpack-based
+    version 2, which adds `msgpack` to the function's requirements. The version and its codec (see `protocol.Codec`)
+    are recorded in the function's annotations. Proxies use YAML when msgpack is not installed locally, or for the calls
+    protocol v2 cannot represent
+
+    Functions whose arguments are all annotated as `bool`, `int` or `float` get a codec specialized to their
+    signature, see `protocol.SignatureCodec`. The specialized layout is recorded in the `away-signature` annotation
+
+    With a `blob_store`, the proxy uploads large arguments to the store once and only sends their hash, and the handler
+    reads them from there, see `blobstore.BlobStore`
+
+    With `template='python3-http'` (or `'python3-http-debian'`), the function runs on the of-watchdog: its handler is
+    imported once per replica and serves requests one at a time, instead of starting a process for each one
+
+    Generator functions are published in streaming mode: each yielded item is sent as its own record, and the
+    returned proxy is a generator that decodes the items as they arrive
+
+    What ended up in the handler is available as the proxy's `__away_build_report__`, see `build_report.BuildReport`.
+    Handlers above `size_limits` (by default, `SizeLimits()`) warn, or are not published, see `build_report.SizeLimits`.
+    Captured dictionaries that the function only reads with constant keys keep just those keys, unless `prune_keys=False`
     
     """
     __ensure_stateless(fn)
 
+    stream = inspect.isgeneratorfunction(fn)
+    assert not (stream and batch), 'Generator functions cannot be published in batch mode'
+
+    # do not modify the caller's (or the default) annotations
+    annotations = dict(annotations)
+    # a default instance would be shared by every call
+    if size_limits is None: size_limits = SizeLimits()
+
+    assert template in CLASSIC_TEMPLATES + HTTP_TEMPLATES, f'Unsupported template {template}. Supported templates: {CLASSIC_TEMPLATES + HTTP_TEMPLATES}'
+
     fn_name = fn.__name__.replace('_','-')
     
     assert not os.path.exists(f'{fn_name}.yml'), f'Cannot create FaaS function: The file {fn_name}.yml already exists'
@@ -294,7 +584,7 @@ def mirror_in_faas(
 
     try:
 
-        faas.create_from_template(registry_prefix, fn_name)
+        faas.create_from_template(registry_prefix, fn_name, template=template)
 
         has_to_use_protocol = server_unpack_args is None and server_pack_args is None
         # TODO: handle possible imports in function?
@@ -306,29 +596,60 @@ def mirror_in_faas(
             # Establish 'protocol': serialize and then back
             server_unpack_args = __safe_server_unpack_args if safe_args else __unsafe_server_unpack_args
             server_pack_args = __safe_server_pack_args if safe_args else __unsafe_server_pack_args
+            if batch:
+                server_unpack_args = __safe_server_unpack_batch_args if safe_args else __unsafe_server_unpack_batch_args
+
+            client_pack_args = __make_client_packer(safe_args, stream_args, {'batch': batch, **kwargs}, protocol)
+            client_unpack_args = __make_client_unpacker(safe_args, kwargs, protocol)
+
+        assert not batch or has_to_use_protocol, 'Batch mode is only available with away\'s protocol, not with custom server_unpack_args/server_pack_args'
+        assert not stream_args or has_to_use_protocol, 'Streamed arguments are only available with away\'s protocol, not with custom server_unpack_args/server_pack_args'
+        assert blob_store is None or (has_to_use_protocol and not (batch or stream_args)), 'Arguments can only be passed by reference with away\'s protocol, and neither in batch mode nor streamed'
+
+        if blob_store is not None:
+            client_pack_args = blob_store.make_client_pack_args_fn(client_pack_args)
 
-            client_pack_args = make_client_pack_args_fn(safe_args=safe_args)
-            client_unpack_args = make_client_unpack_args_fn(safe_args=safe_args)
+        # Specialize the codec to the annotated signature of the function, if it only takes scalars
+        signature_codec = None
+        if has_to_use_protocol and not (batch or stream or stream_args):
+            signature_codec = SignatureCodec.from_annotations(fn)
+        if signature_codec is not None:
+            client_pack_args = signature_codec.make_client_pack_args_fn(client_pack_args)
+            client_unpack_args = signature_codec.make_client_unpack_args_fn(client_unpack_args)
 
-        # Create handler
+        # Create handler, and the sidecar of the values it captures
         faas_id = hash(faas)
-        handler_source = __build_handler_template(fn, server_unpack_args, server_pack_args, faas_id, from_deco=__from_deco)
+        sidecar = {}
+        report = BuildReport()
+        handler_source = __build_handler_template(fn, server_unpack_args, server_pack_args, faas_id, from_deco=__from_deco, batch=batch, stream=stream, signature_codec=signature_codec, blob_store=blob_store, http=template in HTTP_TEMPLATES, sidecar=sidecar, report=report, size_limits=size_limits, prune_keys=prune_keys)
 
         with open(f'{fn_name}/requirements.txt', 'a') as requirements:
             if 'import yaml' in handler_source: requirements.write('pyyaml\n')
             if 'import requests' in handler_source: requirements.write('requests\n')
+            if 'import boto3' in handler_source: requirements.write('boto3\n')
+            if has_to_use_protocol and protocol >= 2: requirements.write('msgpack\n')
             for dep in module_imports:
                 requirements.write(dep+'\n')
 
         with open(f'{fn_name}/handler.py', 'w') as handler:
             handler.write(handler_source)
 
+        if len(sidecar) > 0:
+            with open(f'{fn_name}/{CAPTURED_SIDECAR}', 'wb') as captured:
+                pickle.dump(sidecar, captured, protocol=CAPTURED_PICKLE_PROTOCOL)
+
         
         with open(f'{fn_name}.yml', 'r+') as stack:
             description = yaml.load(stack, Loader=yaml.Loader)
         
             # 'tag' as built with protocol
-            if has_to_use_protocol: annotations['built-with'] = 'away'
+            if has_to_use_protocol:
+                annotations['built-with'] = 'away'
+                annotations['away-protocol'] = str(protocol)
+                annotations['away-codec'] = get_protocol_codec(protocol).id
+            if signature_codec is not None: annotations['away-signature'] = signature_codec.describe()
+            if batch: annotations['away-batch'] = 'true'
+            if stream: annotations['away-stream'] = 'true'
             if annotations != {}: description['functions'][fn_name]['annotations'] = annotations
 
             stack.seek(0)
@@ -351,11 +672,91 @@ def mirror_in_faas(
     else:
         create_fn = sync_from_name
 
-    fn = create_fn(fn_name, faas, pack_args=client_pack_args, unpack_args=client_unpack_args, **kwargs)
+    if stream: kwargs['stream'] = True
+    fn = create_fn(fn_name, faas, pack_args=client_pack_args, unpack_args=client_unpack_args, batch=batch, **kwargs)
 
-    if has_to_use_protocol: __add_protocol_marker_attrs(fn, safe_args)
+    if has_to_use_protocol: __add_protocol_marker_attrs(fn, safe_args, batch)
+    fn.__away_build_report__ = report
 
     return fn
 
-def __add_protocol_marker_attrs(fn: Callable[[Any], Any], is_safe_args: bool):
-    fn.__away_protocol_is_safe__ = is_safe_args
\ No newline at end of file
+def __resolve_client_protocol(protocol: int | str | None, faas: FaasConnection, fn_name: str, kwargs: dict[str, Any], eager: bool = False) -> tuple[int | str | Callable[[], str], str | Callable[[], str | None] | None]:
+    """
+    Returns the version of away's protocol (or the codec) of a proxy, and the layout of its signature codec (see
+    `protocol.SignatureCodec.describe`). If the protocol is not given, both are functions that read them from the
+    function's annotations. With `eager`, they are read right away instead
+    """
+    if protocol is not None:
+        return protocol, None
+
+    if kwargs.get('replace_underscore', True): fn_name = fn_name.replace('_', '-')
+
+    # read once, for both the packer and the unpacker
+    resolved = []
+    def resolve():
+        if len(resolved) == 0:
+            # the annotations of functions are only available to authenticated connections
+            if faas.is_auth():
+                annotations = faas.get_function_annotations(fn_name)
+                resolved.extend([faas.get_function_codec(fn_name, annotations), annotations.get('away-signature')])
+            else:
+                resolved.extend([YAML_CODEC.id, None])
+        return resolved
+    get_codec = lambda: resolve()[0]
+    get_signature = lambda: resolve()[1]
+
+    if not eager:
+        return get_codec, get_signature
+
+    # async proxies read it when they are built: reading it on the first call would block the event loop
+    try:
+        return get_codec(), get_signature()
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        # other errors, like functions that do not exist or were not built by away, are raised
+        warnings.warn(f'Could not read the annotations of function {fn_name}, its proxy uses YAML: {e!r}', RuntimeWarning)
+        return YAML_CODEC.id, None
+
+def __make_client_packer(safe_args: bool, stream_args: bool, kwargs: dict[str, Any], protocol: int | str | Callable[[], str] = 1, blob_store: BlobStore | None = None, signature: str | Callable[[], str | None] | None = None) -> Callable[[Iterable[Any]], Any]:
+    if not stream_args:
+        if callable(protocol):
+            pack_args = make_client_negotiated_pack_args_fn(protocol, safe_args)
+        else:
+            pack_args = get_protocol_codec(protocol).make_pack_args_fn(safe_args)
+
+        if blob_store is not None:
+            assert not kwargs.get('batch'), 'Arguments cannot be passed by reference in batch mode'
+            pack_args = blob_store.make_client_pack_args_fn(pack_args)
+
+        # as in `mirror_in_faas`, the signature codec comes before the others
+        if signature is None or kwargs.get('batch'):
+            return pack_args
+        if callable(signature):
+            return make_client_negotiated_signature_pack_args_fn(signature, pack_args)
+        return SignatureCodec.from_description(signature).make_client_pack_args_fn(pack_args)
+
+    # the packed arguments of a streamed call are only produced while they are sent
+    assert blob_store is None, 'Streamed arguments cannot be passed by reference'
+    assert not any(kwargs.get(option) for option in ('batch', 'cache', 'coalesce', 'hedge')), 'Streamed arguments cannot be batched, cached, coalesced or hedged'
+    return make_client_stream_pack_args_fn(safe_args)
+
+def __make_client_unpacker(safe_args: bool, kwargs: dict[str, Any], protocol: int | str | Callable[[], str] = 1, signature: str | Callable[[], str | None] | None = None) -> Callable[[str], Any]:
+    if callable(protocol):
+        unpack_args = make_client_negotiated_unpack_args_fn(protocol, safe_args)
+    else:
+        unpack_args = get_protocol_codec(protocol).make_unpack_args_fn(safe_args)
+
+    if signature is None or kwargs.get('batch') or kwargs.get('stream'):
+        return unpack_args
+    if callable(signature):
+        return make_client_negotiated_signature_unpack_args_fn(signature, unpack_args)
+    return SignatureCodec.from_description(signature).make_client_unpack_args_fn(unpack_args)
+
+def __is_async_stub(fn: Callable[[Any], Any]) -> bool:
+    return inspect.iscoroutinefunction(fn) or inspect.isasyncgenfunction(fn)
+
+def __is_generator_stub(fn: Callable[[Any], Any]) -> bool:
+    return inspect.isgeneratorfunction(fn) or inspect.isasyncgenfunction(fn)
+
+def __add_protocol_marker_attrs(fn: Callable[[Any], Any], is_safe_args: bool, is_batch: bool = False):
+    fn.__away_protocol_is_safe__ = is_safe_args
+    fn.__away_protocol_is_batch__ = is_batch
\ No newline at end of file
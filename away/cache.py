@@ -0,0 +1,317 @@
+import threading
+import sqlite3
+import os
+import warnings
+from collections import OrderedDict
+from time import monotonic, time
+
+from typing import Any
+
+from .__singleflight import SingleFlight, AsyncSingleFlight
+
+class ResultCache():
+    """
+    An in-memory LRU cache of function results, bounded by the total size in bytes of its entries.
+    Thread-safe, and can be shared between proxies
+
+    Results are stored as the raw response of the function: each hit is unpacked again, so callers never
+    share (and mutate) the same result object
+
+    Any object with the same `get`, `put`, `invalidate` and `stats` methods and a `track_deployments` attribute
+    can be used as a cache by the builders. See `SQLiteResultCache` for a persistent one
+
+    Usage:
+    cache = ResultCache(max_bytes=16 * 2**20, ttl=60)
+
+    @builder.faas_function_with_protocol(faas, cache=cache)
+    def lookup(key):
+        pass
+    """
+
+    def __init__(self, max_bytes: int = 64 * 2**20, ttl: float | None = None, track_deployments: bool = False):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # also key entries by the deployment of the function, so that a redeploy invalidates them
+        self.track_deployments = track_deployments
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self.__entries = OrderedDict() # key -> (value, size, expires_at)
+        self.__lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        """
+        Returns the cached value for `key`, or `None` if it is not cached or has expired
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+
+            if entry is not None and entry[2] is not None and monotonic() > entry[2]:
+                self.__remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.__entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, value: str, ttl: float | None = None):
+        """
+        Caches `value` for `key` for `ttl` seconds (by default, the cache's `ttl`), evicting the least recently used entries to fit
+        """
+        size = len(key.encode()) + len(value.encode())
+        if size > self.max_bytes:
+            return
+
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = None if ttl is None else monotonic() + ttl
+
+        with self.__lock:
+            if key in self.__entries:
+                self.__remove(key)
+
+            while self.size + size > self.max_bytes:
+                self.__remove(next(iter(self.__entries)))
+
+            self.__entries[key] = (value, size, expires_at)
+            self.size += size
+
+    def invalidate(self, key: str | None = None):
+        """
+        Removes `key` from the cache, or every entry if no key is given
+        """
+        with self.__lock:
+            if key is None:
+                self.__entries.clear()
+                self.size = 0
+            elif key in self.__entries:
+                self.__remove(key)
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the hit/miss counters and the current size of the cache
+        """
+        with self.__lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.__entries), 'size': self.size}
+
+    def __remove(self, key: str):
+        _, size, _ = self.__entries.pop(key)
+        self.size -= size
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __repr__(self) -> str:
+        return f'ResultCache({len(self)} entries, {self.size}/{self.max_bytes} bytes, hits={self.hits}, misses={self.misses})'
+
+class SQLiteResultCache():
+    """
+    A persistent cache of function results, stored in an SQLite database file. Many processes (and threads) can
+    use the same file at the same time, so that worker processes on a host share their results and start hot
+
+    Entries are evicted by age (`ttl`) and least recent use when the total size goes over `max_bytes`. By default,
+    entries are also keyed by the deployment of the function: redeploying it invalidates them
+
+    Usage:
+    cache = SQLiteResultCache('/var/cache/away/results.db', max_bytes=2**30, ttl=24 * 3600)
+
+    score = builder.sync_from_name_with_protocol('score', faas, cache=cache)
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 2**20, ttl: float | None = None, track_deployments: bool = True, timeout: float = 30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.track_deployments = track_deployments
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+        self.__connection = None
+        self.__pid = None
+
+    def __connect(self) -> sqlite3.Connection:
+        # connections cannot be shared with a forked process
+        if self.__connection is None or self.__pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False, isolation_level=None)
+            # WAL lets readers in other processes go on while one process writes
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS away_results ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, expires_at REAL, last_used REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS away_results_last_used ON away_results (last_used)')
+            self.__connection = connection
+            self.__pid = os.getpid()
+
+        return self.__connection
+
+    def get(self, key: str) -> str | None:
+        """
+        Returns the cached value for `key`, or `None` if it is not cached or has expired
+        """
+        now = time()
+        with self.__lock:
+            connection = self.__connect()
+            row = connection.execute('SELECT value, expires_at FROM away_results WHERE key = ?', (key,)).fetchone()
+
+            if row is not None and row[1] is not None and now > row[1]:
+                connection.execute('DELETE FROM away_results WHERE key = ?', (key,))
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            connection.execute('UPDATE away_results SET last_used = ? WHERE key = ?', (now, key))
+            return row[0]
+
+    def put(self, key: str, value: str, ttl: float | None = None):
+        """
+        Caches `value` for `key` for `ttl` seconds (by default, the cache's `ttl`), evicting expired and then
+        least recently used entries to fit
+        """
+        size = len(key.encode()) + len(value.encode())
+        if size > self.max_bytes:
+            return
+
+        now = time()
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = None if ttl is None else now + ttl
+
+        with self.__lock:
+            connection = self.__connect()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.execute('DELETE FROM away_results WHERE expires_at IS NOT NULL AND expires_at < ?', (now,))
+                connection.execute(
+                    'INSERT OR REPLACE INTO away_results (key, value, size, expires_at, last_used) VALUES (?, ?, ?, ?, ?)',
+                    (key, value, size, expires_at, now)
+                )
+
+                total_size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM away_results').fetchone()[0]
+                if total_size > self.max_bytes:
+                    evicted = 0
+                    for old_key, old_size in connection.execute('SELECT key, size FROM away_results ORDER BY last_used').fetchall():
+                        if total_size - evicted <= self.max_bytes: break
+                        if old_key == key: continue
+                        connection.execute('DELETE FROM away_results WHERE key = ?', (old_key,))
+                        evicted += old_size
+
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+    def invalidate(self, key: str | None = None):
+        """
+        Removes `key` from the cache, or every entry if no key is given
+        """
+        with self.__lock:
+            connection = self.__connect()
+            if key is None:
+                connection.execute('DELETE FROM away_results')
+            else:
+                connection.execute('DELETE FROM away_results WHERE key = ?', (key,))
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the hit/miss counters of this process and the current size of the cache
+        """
+        with self.__lock:
+            entries, size = self.__connect().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM away_results').fetchone()
+
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'size': size}
+
+    def close(self):
+        with self.__lock:
+            if self.__connection is not None:
+                self.__connection.close()
+                self.__connection = None
+
+    def __repr__(self) -> str:
+        return f'SQLiteResultCache({self.path}, max_bytes={self.max_bytes}, hits={self.hits}, misses={self.misses})'
+
+class DeploymentFingerprint():
+    """
+    Tracks the fingerprint of the current deployment of a function, refreshing it at most every `refresh` seconds.
+    Concurrent refreshes share a single request. Resolves to an empty fingerprint, with a warning, if the connection
+    cannot query the function (for example, if it is not authenticated), or to the last known one if a refresh fails
+    """
+
+    def __init__(self, faas: Any, function_name: str, refresh: float = 60):
+        self.faas = faas
+        self.function_name = function_name
+        self.refresh = refresh
+        self.__fingerprint = None
+        self.__resolved_at = 0.0
+        self.__flights = SingleFlight()
+        self.__async_flights = AsyncSingleFlight()
+
+    def __is_stale(self) -> bool:
+        return self.__fingerprint is None or monotonic() - self.__resolved_at > self.refresh
+
+    def __resolved(self, fingerprint: str):
+        self.__fingerprint = fingerprint
+        self.__resolved_at = monotonic()
+
+    def __unresolved(self, e: Exception):
+        # a transient failure keeps the last known fingerprint. Either way, it is tried again after `refresh` seconds
+        if self.__fingerprint is None:
+            warnings.warn(f'Could not get the deployment fingerprint of {self.function_name} ({e}). Its cached results will not be invalidated by a redeploy', RuntimeWarning)
+        self.__resolved(self.__fingerprint or '')
+
+    def __refresh(self) -> str:
+        # the staleness is checked again by the caller that runs the flight: a previous flight may have just ended
+        if self.__is_stale():
+            try:
+                self.__resolved(self.faas.get_function_fingerprint(self.function_name))
+            except Exception as e:
+                self.__unresolved(e)
+
+        return self.__fingerprint
+
+    async def __arefresh(self) -> str:
+        if self.__is_stale():
+            try:
+                self.__resolved(await self.faas.aget_function_fingerprint(self.function_name))
+            except Exception as e:
+                self.__unresolved(e)
+
+        return self.__fingerprint
+
+    def get(self) -> str:
+        if self.__is_stale():
+            return self.__flights.do(self.function_name, self.__refresh)
+
+        return self.__fingerprint
+
+    async def aget(self) -> str:
+        if self.__is_stale():
+            return await self.__async_flights.do(self.function_name, self.__arefresh)
+
+        return self.__fingerprint
+
+def __make_cache(cache: bool | ResultCache | None) -> ResultCache | None:
+    """
+    Resolves the `cache=` option of the builders: `True` for a new `ResultCache` with default settings,
+    `None`/`False` for no cache, or a cache to use (and possibly share) as is
+    """
+    if cache is True:
+        return ResultCache()
+    if cache is False or cache is None:
+        return None
+
+    return cache
+
+def __make_cache_key(address: str, function_name: str, packed_args: Any, fingerprint: str = '') -> str:
+    # caches can be shared between connections, and two gateways may serve different functions with the same name
+    if not isinstance(packed_args, str):
+        packed_args = repr(packed_args)
+
+    return f'{address}\0{function_name}\0{fingerprint}\0{packed_args}'
@@ -0,0 +1,171 @@
+import threading
+import inspect
+from collections import deque
+from time import monotonic
+
+from typing import Callable, Any
+
+from .exceptions import FaasCircuitOpenError
+
+class CircuitBreaker():
+    """
+    A circuit breaker for the calls to a function
+
+    While `closed`, calls go through and their outcomes are recorded over a rolling `window` of seconds. Once at least
+    `min_calls` were recorded, the breaker `open`s if the rate of failed calls reaches `error_rate_threshold`, or
+    the rate of calls slower than `slow_call_duration` seconds reaches `slow_call_rate_threshold`.
+
+    While `open`, calls fail fast (or use the proxy's fallback) without reaching the gateway. After `open_duration`
+    seconds the breaker becomes `half-open`, and lets `half_open_max_calls` probe calls through: it closes again if
+    they all succeed, or re-opens on the first failure
+
+    Breakers are shared by all the proxies of a function built from the same `FaasConnection`, see
+    `FaasConnection.get_circuit_breaker`
+
+    Usage:
+    @builder.faas_function(faas, circuit_breaker={'error_rate_threshold': 0.3, 'open_duration': 10}, fallback=lambda n: None)
+    def fibonacci(n):
+        pass
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self,
+        error_rate_threshold: float = 0.5,
+        slow_call_duration: float | None = None,
+        slow_call_rate_threshold: float = 0.5,
+        window: float = 30,
+        min_calls: int = 10,
+        open_duration: float = 30,
+        half_open_max_calls: int = 1):
+
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.window = window
+        self.min_calls = min_calls
+        self.open_duration = open_duration
+        self.half_open_max_calls = half_open_max_calls
+
+        self.__lock = threading.Lock()
+        self.__state = CircuitBreaker.CLOSED
+        self.__outcomes = deque() # (finished_at, is_failure, is_slow)
+        self.__opened_at = 0.0
+        self.__probes_in_flight = 0
+        self.__probes_succeeded = 0
+
+    @property
+    def state(self) -> str:
+        with self.__lock:
+            self.__update_state(monotonic())
+            return self.__state
+
+    def allow(self) -> bool:
+        """
+        Returns if a call can go through. Each allowed call must be followed by a `record` of its outcome, or a `release`
+        """
+        with self.__lock:
+            self.__update_state(monotonic())
+
+            if self.__state == CircuitBreaker.CLOSED:
+                return True
+            if self.__state == CircuitBreaker.HALF_OPEN and self.__probes_in_flight < self.half_open_max_calls:
+                self.__probes_in_flight += 1
+                return True
+
+            return False
+
+    def record(self, success: bool, duration: float):
+        """
+        Records the outcome of an allowed call, and how long it took in seconds
+        """
+        now = monotonic()
+        is_slow = self.slow_call_duration is not None and duration > self.slow_call_duration
+
+        with self.__lock:
+            self.__update_state(now)
+
+            if self.__state == CircuitBreaker.HALF_OPEN:
+                self.__probes_in_flight = max(self.__probes_in_flight - 1, 0)
+                if not success or is_slow:
+                    self.__open(now)
+                else:
+                    self.__probes_succeeded += 1
+                    if self.__probes_succeeded >= self.half_open_max_calls:
+                        self.__state = CircuitBreaker.CLOSED
+                        self.__outcomes.clear()
+                return
+
+            if self.__state == CircuitBreaker.OPEN:
+                # a call allowed before the breaker opened
+                return
+
+            self.__outcomes.append((now, not success, is_slow))
+            self.__prune(now)
+
+            n_calls = len(self.__outcomes)
+            if n_calls < self.min_calls:
+                return
+
+            failure_rate = sum(1 for _, is_failure, _ in self.__outcomes if is_failure) / n_calls
+            slow_rate = sum(1 for _, _, slow in self.__outcomes if slow) / n_calls
+
+            if failure_rate >= self.error_rate_threshold or (self.slow_call_duration is not None and slow_rate >= self.slow_call_rate_threshold):
+                self.__open(now)
+
+    def release(self):
+        """
+        Ends an allowed call without recording an outcome, for calls that say nothing of the function's replicas:
+        cancelled or interrupted ones, or calls whose deadline passed
+        """
+        with self.__lock:
+            if self.__state == CircuitBreaker.HALF_OPEN:
+                self.__probes_in_flight = max(self.__probes_in_flight - 1, 0)
+
+    def reset(self):
+        """
+        Closes the breaker and forgets the recorded outcomes
+        """
+        with self.__lock:
+            self.__state = CircuitBreaker.CLOSED
+            self.__outcomes.clear()
+
+    def __open(self, now: float):
+        self.__state = CircuitBreaker.OPEN
+        self.__opened_at = now
+        self.__outcomes.clear()
+
+    def __update_state(self, now: float):
+        if self.__state == CircuitBreaker.OPEN and now - self.__opened_at >= self.open_duration:
+            self.__state = CircuitBreaker.HALF_OPEN
+            self.__probes_in_flight = 0
+            self.__probes_succeeded = 0
+
+    def __prune(self, now: float):
+        while len(self.__outcomes) > 0 and now - self.__outcomes[0][0] > self.window:
+            self.__outcomes.popleft()
+
+    def __repr__(self) -> str:
+        return f'CircuitBreaker(state={self.state}, error_rate_threshold={self.error_rate_threshold}, slow_call_duration={self.slow_call_duration})'
+
+def __with_fallback(faas_fn: Callable[[Any], Any], fallback: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    """
+    Wraps a proxy to call `fallback` with the same arguments when its circuit breaker is open
+    """
+    if inspect.iscoroutinefunction(faas_fn):
+        async def with_fallback(*args, **kwargs):
+            try:
+                return await faas_fn(*args, **kwargs)
+            except FaasCircuitOpenError:
+                res = fallback(*args, **kwargs)
+                return await res if inspect.isawaitable(res) else res
+    else:
+        def with_fallback(*args):
+            try:
+                return faas_fn(*args)
+            except FaasCircuitOpenError:
+                return fallback(*args)
+
+    return with_fallback
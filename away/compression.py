@@ -0,0 +1,208 @@
+import gzip
+from base64 import b64encode, b64decode
+
+from typing import Callable, Tuple
+
+from .exceptions import FaasReturnedError
+from .__server_context import __server_request_header
+
+# The classic watchdog hands the body of a request to the handler as text, and cannot set the headers of its
+#  response. Compressed payloads are thus sent base64-encoded, the encoding of a request is sent in the
+#  X-Away-Content-Encoding header, and compressed responses start with a line naming their encoding
+CONTENT_ENCODING_HEADER = 'X-Away-Content-Encoding'
+ACCEPT_ENCODING_HEADER = 'X-Away-Accept-Encoding'
+THRESHOLD_HEADER = 'X-Away-Compression-Threshold'
+ENCODED_RESPONSE_MARKER = '%away-encoding '
+
+# Available codecs, by name: (compress, decompress)
+CODECS: dict[str, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    'gzip': (lambda data: gzip.compress(data, compresslevel=6), gzip.decompress)
+}
+
+try:
+    import zstandard
+    CODECS['zstd'] = (lambda data: zstandard.ZstdCompressor().compress(data), lambda data: zstandard.ZstdDecompressor().decompress(data))
+except ImportError: # pragma: no cover
+    pass
+
+try:
+    import lz4.frame
+    CODECS['lz4'] = (lz4.frame.compress, lz4.frame.decompress)
+except ImportError: # pragma: no cover
+    pass
+
+# Preferred encodings of responses, if available
+PREFERRED_ENCODINGS = ['zstd', 'lz4', 'gzip']
+
+class CompressionPolicy():
+    """
+    Describes how a proxy compresses the payloads of its calls
+
+    Requests are compressed with `encoding` when their packed arguments take at least `threshold` bytes.
+    The proxy also accepts compressed responses in any of the codecs available here (gzip, and zstd or lz4 if
+    `zstandard` or `lz4` are installed), and the handler compresses those that take at least `threshold` bytes
+    with the first of them available in the function's image. Payloads that would not get smaller are sent as-is
+
+    `encoding` must be available in the function's image: gzip always is
+
+    Requires a function published with this version of away
+
+    Usage:
+    @builder.faas_function_with_protocol(faas, compression=CompressionPolicy(threshold=4096))
+    def mean(values):
+        pass
+    """
+
+    def __init__(self, encoding: str = 'gzip', threshold: int = 1024):
+
+        assert encoding in CODECS, f'Encoding {encoding} is not available. Available encodings: {list(CODECS)}'
+
+        self.encoding = encoding
+        self.threshold = threshold
+        self.accept_encoding = ', '.join(e for e in PREFERRED_ENCODINGS if e in CODECS)
+
+    def encode_request(self, packed_args: str | dict | bytes) -> Tuple[str | dict | bytes, dict[str, str]]:
+        """
+        Returns the body of a request with `packed_args`, and the headers that negotiate its encoding
+        """
+        headers = {ACCEPT_ENCODING_HEADER: self.accept_encoding, THRESHOLD_HEADER: str(self.threshold)}
+        if not isinstance(packed_args, str):
+            return packed_args, headers
+
+        data = packed_args.encode('utf-8')
+        if len(data) < self.threshold:
+            return packed_args, headers
+
+        compress, _ = CODECS[self.encoding]
+        armored = b64encode(compress(data)).decode('ascii')
+        if len(armored) >= len(data):
+            return packed_args, headers
+
+        headers[CONTENT_ENCODING_HEADER] = self.encoding
+        return armored, headers
+
+    @staticmethod
+    def decode_response(text: str) -> str:
+        """
+        Returns the payload of a response that may have been compressed by the handler
+        """
+        if not text.startswith(ENCODED_RESPONSE_MARKER):
+            return text
+
+        encoding, _, armored = text[len(ENCODED_RESPONSE_MARKER):].partition('\n')
+        if encoding not in CODECS:
+            raise FaasReturnedError(f'The function answered with an unsupported encoding: {encoding}')
+
+        _, decompress = CODECS[encoding]
+        return decompress(b64decode(armored)).decode('utf-8')
+
+    def __repr__(self) -> str:
+        return f'CompressionPolicy(encoding={self.encoding}, threshold={self.threshold}, accept_encoding={self.accept_encoding})'
+
+def __make_compression_policy(compression: CompressionPolicy | str | bool | None) -> CompressionPolicy | None:
+    """
+    Resolves the `compression=` option of the builders: `True` for a default `CompressionPolicy`, the name of the
+    encoding of requests, or a `CompressionPolicy`
+    """
+    if compression is None or compression is False:
+        return None
+    if compression is True:
+        return CompressionPolicy()
+    if isinstance(compression, str):
+        return CompressionPolicy(encoding=compression)
+
+    return compression
+
+def __server_request_stream(body): # pragma: no cover
+    # File-like bodies are parsed as they are read when they are YAML. The payloads of the other protocols start
+    #  with a marker, `%away-...`, and are read whole
+    import codecs, io
+    if not isinstance(body, io.TextIOBase):
+        body = codecs.getreader('utf-8')(body)
+
+    head = body.read(1)
+    if head == '%':
+        return head + body.read()
+
+    class RequestStream():
+        # what the unpackers use of a request: whether it starts with a marker, and reading it
+        def __init__(self):
+            self.buffer = head
+
+        def startswith(self, prefix):
+            while len(self.buffer) < len(prefix):
+                data = body.read(len(prefix) - len(self.buffer))
+                if not data:
+                    break
+                self.buffer += data
+            return self.buffer.startswith(prefix)
+
+        def read(self, size=-1):
+            buffered, self.buffer = self.buffer, ''
+            if size is None or size < 0:
+                return buffered + body.read()
+            if len(buffered) >= size:
+                self.buffer = buffered[size:]
+                return buffered[:size]
+            return buffered + body.read(size - len(buffered))
+
+    return RequestStream()
+
+def __server_decode_payload(req): # pragma: no cover
+    import base64
+    encoding = __server_request_header('X-Away-Content-Encoding')
+    if encoding is None or encoding == 'identity':
+        return __server_request_stream(req) if hasattr(req, 'read') else req
+
+    # compressed payloads are decompressed whole
+    if hasattr(req, 'read'):
+        req = req.read()
+
+    data = base64.b64decode(req)
+    if encoding == 'gzip':
+        import gzip
+        data = gzip.decompress(data)
+    elif encoding == 'zstd':
+        import zstandard
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif encoding == 'lz4':
+        import lz4.frame
+        data = lz4.frame.decompress(data)
+    else:
+        raise ValueError('Unsupported payload encoding: ' + encoding)
+
+    return data.decode('utf-8')
+
+def __server_encode_payload(res): # pragma: no cover
+    import base64
+    accepted = __server_request_header('X-Away-Accept-Encoding')
+    if accepted is None or not isinstance(res, str):
+        return res
+
+    data = res.encode('utf-8')
+    if len(data) < int(__server_request_header('X-Away-Compression-Threshold') or '1024'):
+        return res
+
+    # the first encoding accepted by the caller that is available in this image
+    for encoding in [e.strip() for e in accepted.split(',')]:
+        try:
+            if encoding == 'gzip':
+                import gzip
+                compressed = gzip.compress(data, compresslevel=6)
+            elif encoding == 'zstd':
+                import zstandard
+                compressed = zstandard.ZstdCompressor().compress(data)
+            elif encoding == 'lz4':
+                import lz4.frame
+                compressed = lz4.frame.compress(data)
+            else:
+                continue
+        except ImportError:
+            continue
+
+        armored = base64.b64encode(compressed).decode('ascii')
+        if len(armored) >= len(data):
+            return res
+        return '%away-encoding ' + encoding + '\n' + armored
+
+    return res
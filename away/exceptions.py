@@ -13,4 +13,12 @@ class FaasServiceUnavailableException(Exception):
 
 class FaasFunctionTimedOutError(Exception):
     def __init__(self, message):
-        super().__init__(message)
\ No newline at end of file
+        super().__init__(message)
+
+class FaasCircuitOpenError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+class HandlerTooLargeError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
@@ -0,0 +1,239 @@
+import asyncio
+import math
+import threading
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from time import monotonic
+
+from typing import Callable, Any, Awaitable
+
+class LatencyHistogram():
+    """
+    A rolling histogram of the latencies of the last `size` requests, in log-spaced buckets
+    (each `growth` times wider than the previous one, from `min_latency` seconds)
+    """
+
+    def __init__(self, size: int = 1000, min_latency: float = 0.001, growth: float = 1.1, n_buckets: int = 160):
+        self.size = size
+        self.min_latency = min_latency
+        self.growth = growth
+        self.__counts = [0] * n_buckets
+        self.__samples = deque() # bucket of each sample in the window
+        self.__lock = threading.Lock()
+
+    def __bucket(self, latency: float) -> int:
+        if latency <= self.min_latency:
+            return 0
+        return min(int(math.log(latency / self.min_latency, self.growth)) + 1, len(self.__counts) - 1)
+
+    def record(self, latency: float):
+        bucket = self.__bucket(latency)
+
+        with self.__lock:
+            self.__samples.append(bucket)
+            self.__counts[bucket] += 1
+
+            if len(self.__samples) > self.size:
+                self.__counts[self.__samples.popleft()] -= 1
+
+    def percentile(self, p: float) -> float | None:
+        """
+        Returns an upper bound of the `p`-th percentile (0-100) of the latencies in the window, or `None` if it is empty
+        """
+        with self.__lock:
+            n = len(self.__samples)
+            if n == 0:
+                return None
+
+            rank = math.ceil(n * p / 100)
+            seen = 0
+            for bucket, count in enumerate(self.__counts):
+                seen += count
+                if seen >= rank:
+                    return self.min_latency * self.growth ** bucket
+
+        return None # pragma: no cover
+
+    def __len__(self) -> int:
+        return len(self.__samples)
+
+    def __repr__(self) -> str:
+        return f'LatencyHistogram({len(self)} samples, p50={self.percentile(50)}, p99={self.percentile(99)})'
+
+class HedgePolicy():
+    """
+    Describes when a proxy sends a second, speculative request for a call whose first request has not answered yet.
+    The first good response (not a connection error or 5xx) wins, and the slower request is cancelled
+
+    The delay before hedging is a fixed `delay` in seconds or, if `delay` is `None`, the `percentile` of the latency
+    of the proxy's recent requests. Until `min_samples` latencies are known, percentile-based policies do not hedge.
+    The delay is never shorter than `min_delay`
+
+    Only use hedging for idempotent functions: both requests may run to completion in the function
+
+    Usage:
+    @builder.faas_function_with_protocol(faas, hedge=HedgePolicy(percentile=95))
+    def lookup(key):
+        pass
+    """
+
+    def __init__(self,
+        delay: float | None = None,
+        percentile: float = 95,
+        min_delay: float = 0.005,
+        min_samples: int = 20,
+        window: int = 1000,
+        max_workers: int = 64):
+
+        assert 0 < percentile < 100, f'percentile must be between 0 and 100, got {percentile}'
+
+        self.delay = delay
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.window = window
+        self.max_workers = max_workers
+
+    def hedge_delay(self, latency: LatencyHistogram) -> float | None:
+        """
+        Returns how long to wait for the first request before hedging it, or `None` to not hedge
+        """
+        if self.delay is not None:
+            return max(self.delay, self.min_delay)
+
+        if len(latency) < self.min_samples:
+            return None
+
+        return max(latency.percentile(self.percentile), self.min_delay)
+
+    def __repr__(self) -> str:
+        return f'HedgePolicy(delay={self.delay}, percentile={self.percentile}, min_delay={self.min_delay})'
+
+class Hedger():
+    """
+    Sends the requests of a proxy, hedging them according to `policy`. Keeps the latency histogram of the proxy
+    and counts the hedged requests (`hedged`) and those that answered first (`hedge_wins`)
+    """
+
+    def __init__(self, policy: HedgePolicy):
+        self.policy = policy
+        self.latency = LatencyHistogram(size=policy.window)
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.__executor = None
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def __is_good(res: Any) -> bool:
+        return res.status_code < 500
+
+    @staticmethod
+    def __pick(done: set, pending: set, is_good: Callable[[Any], bool]) -> Any:
+        # a good response wins right away, a bad one only if there is nothing left to wait for
+        for fut in done:
+            if is_good(fut): return fut
+        if len(pending) == 0:
+            return next(iter(done))
+        return None
+
+    def __get_executor(self) -> ThreadPoolExecutor:
+        with self.__lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(max_workers=self.policy.max_workers, thread_name_prefix='away-hedge')
+                # the threads of a proxy that is dropped without being closed are let go along with it
+                weakref.finalize(self, self.__executor.shutdown, wait=False)
+            return self.__executor
+
+    def close(self):
+        """
+        Lets the threads of sync hedged requests go once their requests end. The hedger remains usable
+        """
+        with self.__lock:
+            if self.__executor is not None:
+                self.__executor.shutdown(wait=False)
+                self.__executor = None
+
+    def __timed(self, request: Callable[[], Any]) -> Any:
+        started_at = monotonic()
+        res = request()
+        self.latency.record(monotonic() - started_at)
+        return res
+
+    def call(self, request: Callable[[], Any]) -> Any:
+        """
+        Makes `request`, and makes it again if it has not answered after the hedging delay. Returns the first good response
+        """
+        delay = self.policy.hedge_delay(self.latency)
+        if delay is None:
+            return self.__timed(request)
+
+        executor = self.__get_executor()
+        primary = executor.submit(self.__timed, request)
+        pending = {primary}
+
+        done, _ = wait(pending, timeout=delay)
+        if len(done) == 0:
+            self.hedged += 1
+            pending.add(executor.submit(self.__timed, request))
+
+        try:
+            while True:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                fut = self.__pick(done, pending, lambda fut: fut.exception() is None and Hedger.__is_good(fut.result()))
+                if fut is not None:
+                    if fut is not primary: self.hedge_wins += 1
+                    return fut.result()
+        finally:
+            # requests already running cannot be interrupted: their responses are discarded
+            for fut in pending:
+                fut.cancel()
+
+    async def acall(self, request: Callable[[], Awaitable]) -> Any:
+        """
+        Like `call`, for an async `request`. The slower request is cancelled, closing its connection
+        """
+        async def timed():
+            started_at = monotonic()
+            res = await request()
+            self.latency.record(monotonic() - started_at)
+            return res
+
+        delay = self.policy.hedge_delay(self.latency)
+        if delay is None:
+            return await timed()
+
+        primary = asyncio.ensure_future(timed())
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if len(done) == 0:
+                self.hedged += 1
+                pending.add(asyncio.ensure_future(timed()))
+
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                task = self.__pick(done, pending, lambda task: task.exception() is None and Hedger.__is_good(task.result()))
+                if task is not None:
+                    if task is not primary: self.hedge_wins += 1
+                    return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def __repr__(self) -> str:
+        return f'Hedger({self.policy}, hedged={self.hedged}, hedge_wins={self.hedge_wins}, {self.latency})'
+
+def __make_hedger(hedge: HedgePolicy | float | bool | None) -> Hedger | None:
+    """
+    Resolves the `hedge=` option of the builders: `True` for a percentile-based `HedgePolicy`, a number for a fixed
+    delay in seconds, or a `HedgePolicy`
+    """
+    if hedge is None or hedge is False:
+        return None
+    if hedge is True:
+        return Hedger(HedgePolicy())
+    if isinstance(hedge, (int, float)):
+        return Hedger(HedgePolicy(delay=hedge))
+
+    return Hedger(hedge)
@@ -1,13 +1,53 @@
 import yaml
-from typing import Callable, Any, Awaitable, Tuple, Iterable
+from typing import Callable, Any, Awaitable, Tuple, Iterable, Iterator
+from base64 import b64encode, b64decode
+from datetime import datetime, date
 import inspect
+import pickle
+import math
+import ast
+import struct
+import threading
+import textwrap
 import warnings
 
 from .__fn_utils import __get_fn_source
+from .__server_context import __server_request_state
+
+try:
+    import msgpack
+except ImportError: # pragma: no cover
+    msgpack = None
+
+# pyyaml's bindings to libyaml, which are much faster, when it was built with them. They write the same YAML
+YAML_SAFE_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+YAML_DUMPER = getattr(yaml, 'CDumper', yaml.Dumper)
+
+# Latest version of away's protocol: 1 is YAML, 2 is msgpack-based (see `__server_v2_loads`)
+PROTOCOL_VERSION = 2
+V2_MARKER = '%away-v2\n'
+
+# Extension types of protocol v2
+EXT_TUPLE = 1
+EXT_SET = 2
+EXT_FROZENSET = 3
+EXT_DATETIME = 4
+EXT_DATE = 5
+# NumPy arrays: the length of a header with their dtype and shape, the header, and their raw buffer
+EXT_NDARRAY = 6
+# pyarrow Tables and pandas DataFrames, as an Arrow IPC stream
+EXT_ARROW_TABLE = 7
+EXT_DATAFRAME = 8
 
 def __safe_server_unpack_args(req): # pragma: no cover
-    import yaml
-    args =  yaml.safe_load(req)
+    # answer in the protocol of the request
+    is_v2 = req.startswith('%away-v2\n')
+    __server_request_state()['v2'] = is_v2
+    if is_v2:
+        args = __server_v2_loads(req)
+    else:
+        import yaml
+        args =  yaml.load(req, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
     if len(args)==1:
         return args[0], 1
     if len(args)==0:
@@ -16,9 +56,15 @@ def __safe_server_unpack_args(req): # pragma: no cover
     return args, len(args)
 
 def __unsafe_server_unpack_args(req): # pragma: no cover
-    import yaml
-    # uses pyyaml's unsafe Loader
-    args =  yaml.load(req, Loader=yaml.Loader)
+    # answer in the protocol of the request
+    is_v2 = req.startswith('%away-v2\n')
+    __server_request_state()['v2'] = is_v2
+    if is_v2:
+        args = __server_v2_loads(req)
+    else:
+        import yaml
+        # uses pyyaml's unsafe Loader
+        args =  yaml.load(req, Loader=getattr(yaml, 'CLoader', yaml.Loader))
     if len(args)==1:
         return args[0], 1
     if len(args)==0:
@@ -26,37 +72,748 @@ def __unsafe_server_unpack_args(req): # pragma: no cover
 
     return args, len(args)
 
+def __safe_server_unpack_batch_args(req): # pragma: no cover
+    is_v2 = req.startswith('%away-v2\n')
+    __server_request_state()['v2'] = is_v2
+    if is_v2:
+        batch = __server_v2_loads(req)
+    else:
+        import yaml
+        batch = yaml.load(req, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+    bundles = []
+    for args in batch:
+        if len(args)==1:
+            bundles.append((args[0], 1))
+        elif len(args)==0:
+            bundles.append((None, 0))
+        else:
+            bundles.append((args, len(args)))
+
+    return bundles
+
+def __unsafe_server_unpack_batch_args(req): # pragma: no cover
+    is_v2 = req.startswith('%away-v2\n')
+    __server_request_state()['v2'] = is_v2
+    if is_v2:
+        batch = __server_v2_loads(req)
+    else:
+        import yaml
+        # uses pyyaml's unsafe Loader
+        batch = yaml.load(req, Loader=getattr(yaml, 'CLoader', yaml.Loader))
+    bundles = []
+    for args in batch:
+        if len(args)==1:
+            bundles.append((args[0], 1))
+        elif len(args)==0:
+            bundles.append((None, 0))
+        else:
+            bundles.append((args, len(args)))
+
+    return bundles
+
 def __safe_server_pack_args(req): # pragma: no cover
+    if __server_request_state().get('v2', False):
+        try:
+            return __server_v2_dumps(req)
+        except (TypeError, OverflowError, ValueError):
+            # not representable in protocol v2, e.g. ints above 64 bits
+            pass
     import yaml
-    args =  yaml.safe_dump(req)
+    args =  yaml.dump(req, Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper))
     return args
 
 def __unsafe_server_pack_args(req): # pragma: no cover
+    if __server_request_state().get('v2', False):
+        try:
+            # keeping the types of the values: those msgpack would lose are sent in YAML
+            return __server_v2_dumps(req, exact=True)
+        except (TypeError, OverflowError, ValueError):
+            # not representable in protocol v2, e.g. ints above 64 bits
+            pass
     import yaml
-    args =  yaml.dump(req)
+    args =  yaml.dump(req, Dumper=getattr(yaml, 'CDumper', yaml.Dumper))
     return args
 
-def make_client_pack_args_fn(safe_args: bool = True) -> Callable[[Iterable[Any]], str]: 
+def make_client_pack_args_fn(safe_args: bool = True, protocol: int = 1) -> Callable[[Iterable[Any]], str]: 
+
+    # protocol v2 needs msgpack here: without it, calls use YAML, which every handler understands
+    if protocol >= 2 and msgpack is not None:
+        return __make_client_v2_pack_args_fn(safe_args)
 
     # NOTE: Why does this have this very particular structure?
     #        this if-else block and particular variable assign and then return helps implement intra-cluster
     #        dependencies due to the dependency expansion engine, which will take the below line literally and 
     #        include it in the intracluster proxy. I'd love to have it be more elegant :)
+    #       The lambdas pick libyaml's dumpers themselves for the same reason: they only depend on `yaml`
     if safe_args: 
-        pack_args = lambda it: yaml.safe_dump(it)
+        pack_args = lambda it: yaml.dump(it, Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper))
     else:
-        pack_args = lambda it: yaml.dump(it)
+        pack_args = lambda it: yaml.dump(it, Dumper=getattr(yaml, 'CDumper', yaml.Dumper))
 
     return pack_args
 
-def make_client_unpack_args_fn(safe_args: bool = True) -> Callable[[str], Tuple[Any]]: 
+def make_client_unpack_args_fn(safe_args: bool = True, protocol: int = 1) -> Callable[[str], Tuple[Any]]: 
+    if protocol >= 2 and msgpack is not None:
+        return __make_client_v2_unpack_args_fn(safe_args)
+
     if safe_args:
-        unpack_args = lambda st: yaml.safe_load(st)
+        unpack_args = lambda st: yaml.load(st, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
     else:
-        unpack_args = lambda st: yaml.load(st, Loader=yaml.Loader)
+        unpack_args = lambda st: yaml.load(st, Loader=getattr(yaml, 'CLoader', yaml.Loader))
 
     return unpack_args
 
+class Codec():
+    """
+    A codec of away's protocol, registered by name and version with `register_codec`.
+    Its factories take `safe_args` and return the client's packer of the arguments and unpacker of the results
+
+    Functions record the identifier of their codec, `<name>/<version>`, in the `away-codec` annotation,
+    and the `*_with_protocol` builders resolve it from there
+
+    Usage:
+    register_codec(Codec('json', 1, lambda safe_args: json.dumps, lambda safe_args: json.loads))
+
+    add = builder.sync_from_name_with_protocol('add', faas, protocol='json/1')
+    """
+
+    def __init__(
+        self,
+        name: str,
+        version: int,
+        make_pack_args_fn: Callable[[bool], Callable[[Iterable[Any]], str]],
+        make_unpack_args_fn: Callable[[bool], Callable[[str], Any]]):
+
+        assert '/' not in name, f'The name of a codec cannot contain "/": {name}'
+        self.name = name
+        self.version = version
+        self.make_pack_args_fn = make_pack_args_fn
+        self.make_unpack_args_fn = make_unpack_args_fn
+
+    @property
+    def id(self) -> str:
+        return f'{self.name}/{self.version}'
+
+    def __repr__(self) -> str:
+        return f'Codec({self.id})'
+
+# Registered codecs, by identifier
+CODECS: dict[str, Codec] = {}
+
+def register_codec(codec: Codec) -> Codec:
+    """
+    Registers a codec, so that proxies can resolve it by name and version
+    """
+    assert codec.id not in CODECS, f'A codec {codec.id} is already registered'
+    CODECS[codec.id] = codec
+    return codec
+
+def get_codec(name: str, version: int | None = None) -> Codec:
+    """
+    Returns the registered codec with the given name and version, or the latest version if not given.
+    The name can also be a `<name>/<version>` identifier, as recorded in the `away-codec` annotation
+
+    Usage:
+    get_codec('yaml') # Codec(yaml/1)
+    """
+    if version is None and '/' in name:
+        name, version = name.split('/', 1)
+        version = int(version)
+
+    versions = [codec.version for codec in CODECS.values() if codec.name == name]
+    assert len(versions) > 0, f'There is no codec named {name}. Register it with `protocol.register_codec`'
+    codec_id = f'{name}/{max(versions) if version is None else version}'
+    assert codec_id in CODECS, f'There is no codec {codec_id}. Registered versions of {name}: {sorted(versions)}'
+
+    return CODECS[codec_id]
+
+# Codecs of the versions of away's protocol. Both use libyaml for YAML when it is available
+YAML_CODEC = register_codec(Codec('yaml', 1, lambda safe_args: make_client_pack_args_fn(safe_args, 1), lambda safe_args: make_client_unpack_args_fn(safe_args, 1)))
+MSGPACK_CODEC = register_codec(Codec('msgpack', 1, lambda safe_args: make_client_pack_args_fn(safe_args, 2), lambda safe_args: make_client_unpack_args_fn(safe_args, 2)))
+PROTOCOL_CODECS = {1: YAML_CODEC.id, 2: MSGPACK_CODEC.id}
+
+def get_protocol_codec(protocol: int | str) -> Codec:
+    """
+    Returns the codec of a version of away's protocol, or the registered codec with the given identifier
+    """
+    if isinstance(protocol, str):
+        return get_codec(protocol)
+
+    assert protocol in PROTOCOL_CODECS, f'Unknown version of away\'s protocol: {protocol}'
+    return get_codec(PROTOCOL_CODECS[protocol])
+
+def make_client_negotiated_pack_args_fn(get_protocol: Callable[[], int | str], safe_args: bool = True) -> Callable[[Iterable[Any]], str]:
+    """
+    Like `make_client_pack_args_fn`, for a function whose protocol version (or codec, see `Codec`) is only known
+    once it is called. `get_protocol` is called on the first call, and calls use YAML if it raises
+    """
+    return __make_client_negotiated_fn(get_protocol, lambda codec: codec.make_pack_args_fn(safe_args))
+
+def make_client_negotiated_unpack_args_fn(get_protocol: Callable[[], int | str], safe_args: bool = True) -> Callable[[str], Any]:
+    """
+    Like `make_client_unpack_args_fn`, for a function whose protocol version (or codec) is only known once it is called
+    """
+    return __make_client_negotiated_fn(get_protocol, lambda codec: codec.make_unpack_args_fn(safe_args))
+
+def __make_client_negotiated_fn(get_protocol: Callable[[], int | str], make_fn: Callable[[Codec], Callable]) -> Callable:
+    fns = []
+    lock = threading.Lock()
+
+    def negotiated_fn(arg):
+        if len(fns) == 0:
+            with lock:
+                if len(fns) == 0:
+                    try:
+                        codec = get_protocol_codec(get_protocol())
+                    except Exception:
+                        codec = YAML_CODEC
+                    fns.append(make_fn(codec))
+
+        return fns[0](arg)
+
+    return negotiated_fn
+
+def __v2_default(obj: Any, exact: bool = False) -> Any:
+    # with `exact`, values are not packed as one of their base types, which would lose their type (e.g. namedtuples,
+    #  OrderedDicts, IntEnums or numpy scalars): they fall back to YAML, which keeps it
+    lossy = (tuple, set, frozenset, date, bool, int, float, str, bytes, list, dict, bytearray, memoryview)
+    if exact and type(obj) not in (tuple, set, frozenset, datetime, date) and isinstance(obj, lossy):
+        raise TypeError(f'Cannot pack objects of type {type(obj).__name__} with protocol v2 without losing their type')
+
+    if isinstance(obj, tuple):
+        return msgpack.ExtType(EXT_TUPLE, __v2_packb(list(obj), exact))
+    if isinstance(obj, set):
+        return msgpack.ExtType(EXT_SET, __v2_packb(list(obj), exact))
+    if isinstance(obj, frozenset):
+        return msgpack.ExtType(EXT_FROZENSET, __v2_packb(list(obj), exact))
+    if isinstance(obj, datetime):
+        return msgpack.ExtType(EXT_DATETIME, obj.isoformat().encode())
+    if isinstance(obj, date):
+        return msgpack.ExtType(EXT_DATE, obj.isoformat().encode())
+    # numpy is only imported when its values are packed
+    if type(obj).__module__ == 'numpy':
+        return __v2_numpy_default(obj)
+    if type(obj).__module__.split('.')[0] in ('pandas', 'pyarrow'):
+        return __v2_arrow_default(obj)
+    # `strict_types` only packs the exact types msgpack knows, not their subclasses
+    for base in (bool, int, float, str, bytes, list, dict):
+        if isinstance(obj, base):
+            return base(obj)
+    if isinstance(obj, (bytearray, memoryview)):
+        return bytes(obj)
+    raise TypeError(f'Cannot pack objects of type {type(obj).__name__} with protocol v2')
+
+def __v2_ext_hook(code: int, data: bytes) -> Any:
+    if code == EXT_TUPLE:
+        return tuple(__v2_unpackb(data))
+    if code == EXT_SET:
+        return set(__v2_unpackb(data))
+    if code == EXT_FROZENSET:
+        return frozenset(__v2_unpackb(data))
+    if code == EXT_DATETIME:
+        return datetime.fromisoformat(data.decode())
+    if code == EXT_DATE:
+        return date.fromisoformat(data.decode())
+    if code == EXT_NDARRAY:
+        return __v2_unpack_ndarray(data)
+    if code in (EXT_ARROW_TABLE, EXT_DATAFRAME):
+        return __v2_unpack_arrow(code, data)
+    return msgpack.ExtType(code, data)
+
+def __v2_numpy_default(obj: Any) -> Any:
+    import numpy
+
+    if isinstance(obj, numpy.ndarray):
+        # arrays of python objects or with named fields have no raw buffer that can be sent as-is
+        if obj.dtype.hasobject or obj.dtype.fields is not None:
+            raise TypeError(f'Cannot pack arrays of dtype {obj.dtype} with protocol v2')
+
+        array = obj if obj.flags.c_contiguous else obj.copy(order='C')
+        # the dtype string includes the byte order, e.g. '<f8'
+        header = msgpack.packb([array.dtype.str, list(array.shape)])
+        return msgpack.ExtType(EXT_NDARRAY, b''.join([len(header).to_bytes(4, 'little'), header, array.data]))
+
+    if isinstance(obj, numpy.generic):
+        return obj.item()
+
+    raise TypeError(f'Cannot pack objects of type {type(obj).__name__} with protocol v2')
+
+def __v2_unpack_ndarray(data: bytes) -> Any:
+    import numpy
+
+    header_len = int.from_bytes(data[:4], 'little')
+    dtype, shape = msgpack.unpackb(data[4:4 + header_len])
+    # a read-only view of the received bytes, without per-element work
+    return numpy.frombuffer(data, dtype=dtype, offset=4 + header_len).reshape(shape)
+
+def __v2_packb(obj: Any, exact: bool = False) -> bytes:
+    return msgpack.packb(obj, default=lambda o: __v2_default(o, exact), strict_types=True, use_bin_type=True)
+
+def __v2_unpackb(data: bytes) -> Any:
+    return msgpack.unpackb(data, ext_hook=__v2_ext_hook, strict_map_key=False)
+
+# Protocol v2 is msgpack, with extension types for the values it has no type for, armored in base64 because
+#  the classic watchdog passes payloads as text. Its payloads start with a marker line, and handlers answer in the
+#  protocol of the request
+def __server_v2_loads(req: str) -> Any:
+    return __v2_unpackb(b64decode(req[len(V2_MARKER):]))
+
+def __server_v2_dumps(res: Any, exact: bool = False) -> str:
+    return V2_MARKER + b64encode(__v2_packb(res, exact)).decode('ascii')
+
+# The codec of protocol v2, as it is repeated in the handler, which cannot import away: the same functions and constants.
+#  It is defined in a function of its own, so that the names it uses do not collide with those of the handler,
+#  and built on the first request in protocol v2, so that images without msgpack can serve the others
+V2_CODEC_CONSTANTS = ('V2_MARKER', 'EXT_TUPLE', 'EXT_SET', 'EXT_FROZENSET', 'EXT_DATETIME', 'EXT_DATE', 'EXT_NDARRAY', 'EXT_ARROW_TABLE', 'EXT_DATAFRAME')
+V2_CODEC_FUNCTIONS = ('__v2_default', '__v2_ext_hook', '__v2_numpy_default', '__v2_unpack_ndarray', '__v2_arrow_default', '__v2_unpack_arrow', '__v2_packb', '__v2_unpackb', '__server_v2_loads', '__server_v2_dumps')
+
+def __server_v2_codec_source() -> str:
+    """
+    Returns the source of the protocol v2 codec of the handler, which defines `__server_v2_loads` and `__server_v2_dumps`
+    """
+    body = '\n'.join([
+        'import msgpack',
+        'from base64 import b64encode, b64decode',
+        'from datetime import datetime, date',
+        'from typing import Any',
+        *[f'{name} = {globals()[name]!r}' for name in V2_CODEC_CONSTANTS],
+        '',
+        *[inspect.getsource(globals()[name]) for name in V2_CODEC_FUNCTIONS],
+        'return __server_v2_loads, __server_v2_dumps'
+    ])
+
+    return '\n'.join([
+        'def __away_v2_codec():',
+        textwrap.indent(body, '    '),
+        '',
+        '__away_v2_codec_fns = []',
+        '',
+        'def __server_v2_loads(req):',
+        '    if len(__away_v2_codec_fns) == 0:',
+        '        __away_v2_codec_fns.extend(__away_v2_codec())',
+        '    return __away_v2_codec_fns[0](req)',
+        '',
+        'def __server_v2_dumps(res, exact=False):',
+        '    if len(__away_v2_codec_fns) == 0:',
+        '        __away_v2_codec_fns.extend(__away_v2_codec())',
+        '    return __away_v2_codec_fns[1](res, exact)',
+        ''
+    ])
+
+def __make_client_v2_pack_args_fn(safe_args: bool) -> Callable[[Iterable[Any]], str]:
+    yaml_pack_args = make_client_pack_args_fn(safe_args)
+
+    def pack_args(it):
+        try:
+            # unsafe calls keep the types of their values: those msgpack would lose are sent in YAML
+            return __server_v2_dumps(it, exact=not safe_args)
+        except (TypeError, OverflowError, ValueError):
+            # not representable in protocol v2, e.g. ints above 64 bits or arbitrary objects
+            return yaml_pack_args(it)
+
+    return pack_args
+
+def __make_client_v2_unpack_args_fn(safe_args: bool) -> Callable[[str], Tuple[Any]]:
+    yaml_unpack_args = make_client_unpack_args_fn(safe_args)
+
+    def unpack_args(st):
+        if st.startswith(V2_MARKER):
+            return __server_v2_loads(st)
+        return yaml_unpack_args(st)
+
+    return unpack_args
+
+def __v2_arrow_default(obj: Any) -> Any:
+    import pyarrow, pyarrow.ipc
+
+    # the columns are written as they are, without per-row work
+    is_table = isinstance(obj, pyarrow.Table)
+    if not is_table and type(obj).__name__ != 'DataFrame':
+        raise TypeError(f'Cannot pack objects of type {type(obj).__name__} with protocol v2')
+
+    table = obj if is_table else pyarrow.Table.from_pandas(obj)
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    return msgpack.ExtType(EXT_ARROW_TABLE if is_table else EXT_DATAFRAME, sink.getvalue().to_pybytes())
+
+def __v2_unpack_arrow(code: int, data: bytes) -> Any:
+    import pyarrow, pyarrow.ipc
+
+    # the columns of the table are views of the received bytes
+    table = pyarrow.ipc.open_stream(pyarrow.py_buffer(data)).read_all()
+    return table if code == EXT_ARROW_TABLE else table.to_pandas()
+
+class StreamedArgs():
+    """
+    The arguments of a call, packed with away's protocol while they are sent in a chunked request body,
+    instead of being packed into a single string first
+
+    Lists and iterators are packed a few items at a time, and bytes and file-like objects (opened in binary or text mode)
+    in blocks: they arrive at the function as `bytes`. Other arguments are packed one at a time
+
+    Each iteration packs the arguments again, so that a failed request can be retried. Iterator arguments can only
+    be sent once, and file-like arguments are read again from their position when the call was made if they are seekable
+
+    Usage:
+    word_count = builder.sync_from_name_with_protocol('word_count', faas, stream_args=True)
+
+    with open('corpus.txt', 'rb') as corpus:
+        word_count(corpus)
+    """
+
+    def __init__(self, args: Iterable[Any], dump: Callable[[Any], str], chunk_size: int = 2**16, items_per_block: int = 1024):
+        self.args = tuple(args)
+        self.dump = dump
+        self.chunk_size = chunk_size
+        self.items_per_block = items_per_block
+        # where to read file-like arguments from again
+        self.__positions = {i: arg.tell() for i, arg in enumerate(self.args) if StreamedArgs.__is_seekable(arg)}
+        self.__iterated = False
+
+    @staticmethod
+    def __is_file(arg: Any) -> bool:
+        return hasattr(arg, 'read') and not isinstance(arg, (str, bytes))
+
+    @staticmethod
+    def __is_seekable(arg: Any) -> bool:
+        return StreamedArgs.__is_file(arg) and hasattr(arg, 'seekable') and arg.seekable()
+
+    def __iter__(self) -> Iterator[bytes]:
+        if self.__iterated:
+            assert not any(StreamedArgs.__is_one_shot(arg) for arg in self.args), 'Iterator arguments can only be sent once'
+            for i, position in self.__positions.items():
+                self.args[i].seek(position)
+        self.__iterated = True
+
+        # group the packed text in chunks of about `chunk_size` bytes
+        buffer, size = [], 0
+        for text in self.__iter_text():
+            buffer.append(text)
+            size += len(text)
+            if size >= self.chunk_size:
+                yield ''.join(buffer).encode()
+                buffer, size = [], 0
+
+        if size > 0:
+            yield ''.join(buffer).encode()
+
+    @staticmethod
+    def __is_one_shot(arg: Any) -> bool:
+        return (isinstance(arg, Iterator) and not StreamedArgs.__is_file(arg)) or (StreamedArgs.__is_file(arg) and not StreamedArgs.__is_seekable(arg))
+
+    def __iter_text(self) -> Iterator[str]:
+        # the arguments are a sequence with one entry per argument
+        if len(self.args) == 0:
+            yield '[]\n'
+
+        for arg in self.args:
+            if StreamedArgs.__is_file(arg):
+                yield from self.__iter_binary(iter(lambda: arg.read(self.chunk_size), arg.read(0)))
+            elif isinstance(arg, (bytes, bytearray, memoryview)):
+                view = memoryview(arg)
+                yield from self.__iter_binary(view[i:i + self.chunk_size] for i in range(0, len(view), self.chunk_size))
+            elif isinstance(arg, list) or (isinstance(arg, Iterator)):
+                yield from self.__iter_sequence(arg)
+            else:
+                yield self.dump([arg])
+
+    def __iter_sequence(self, items: Iterable[Any]) -> Iterator[str]:
+        # entries of the nested sequence are indented under the entry of the argument
+        first = True
+        block = []
+        for item in items:
+            block.append(item)
+            if len(block) == self.items_per_block:
+                yield StreamedArgs.__nest(self.dump(block), first)
+                block, first = [], False
+
+        if len(block) > 0 or first:
+            yield StreamedArgs.__nest(self.dump(block) if len(block) > 0 else '[]\n', first)
+
+    @staticmethod
+    def __nest(text: str, first: bool) -> str:
+        nested = ''.join('  ' + line if line.strip() != '' else line for line in text.splitlines(keepends=True))
+        return '- ' + nested[2:] if first else nested
+
+    def __iter_binary(self, blocks: Iterable[bytes | str]) -> Iterator[str]:
+        yield '- !!binary |\n'
+
+        # base64 is only split at multiples of 3 bytes, so that the lines join into a single value
+        pending = b''
+        for block in blocks:
+            block = block.encode() if isinstance(block, str) else bytes(block)
+            pending += block
+            cut = len(pending) - len(pending) % 3
+            if cut > 0:
+                yield '  ' + b64encode(pending[:cut]).decode() + '\n'
+                pending = pending[cut:]
+
+        if len(pending) > 0:
+            yield '  ' + b64encode(pending).decode() + '\n'
+        else:
+            # an empty block scalar is an empty string: make it an empty value instead
+            yield '  \n'
+
+    def __repr__(self) -> str:
+        return f'StreamedArgs({len(self.args)} arguments)'
+
+def make_client_stream_pack_args_fn(safe_args: bool = True) -> Callable[[Iterable[Any]], StreamedArgs]:
+    """
+    Like `make_client_pack_args_fn`, but packs the arguments while they are sent. See `StreamedArgs`
+    """
+    dumper = YAML_SAFE_DUMPER if safe_args else YAML_DUMPER
+    dump = lambda obj: yaml.dump(obj, Dumper=dumper)
+
+    return lambda it: StreamedArgs(it, dump)
+
+# struct formats of the annotations that signature-specialized codecs support, and their marker line
+SIGNATURE_FORMATS = {'bool': '?', 'int': 'q', 'float': 'd'}
+SIGNATURE_MARKER = '%away-sig\n'
+
+class SignatureCodec():
+    """
+    A codec specialized to the type annotations of a function, for the functions that take a few scalars.
+    The arguments, if they are all annotated as `bool`, `int` or `float`, and the result, if it is also annotated as one of them,
+    are packed with `struct` in a fixed layout instead of the generic protocol
+
+    Calls whose values do not have exactly the annotated types (or ints above 64 bits) fall back to the generic protocol
+
+    Usage:
+    def sum_some_numbers(one: int, another: int) -> int:
+        return one + another
+
+    codec = SignatureCodec.from_annotations(sum_some_numbers) # SignatureCodec(args_format='<qq', result_format='<q')
+    """
+
+    def __init__(self, args_format: str, result_format: str | None):
+        self.args_format = args_format
+        self.result_format = result_format
+        self.__args_struct = struct.Struct(args_format)
+        self.__result_struct = None if result_format is None else struct.Struct(result_format)
+
+    @staticmethod
+    def from_annotations(fn: Callable[[Any], Any]) -> 'SignatureCodec | None':
+        """
+        Returns the codec for the annotations of `fn`, or `None` if its arguments cannot be specialized (or there is nothing to specialize)
+        """
+        spec = inspect.getfullargspec(fn)
+
+        formats = [SignatureCodec.__format_of(spec.annotations.get(arg)) for arg in spec.args]
+        if None in formats or spec.varargs is not None or spec.varkw is not None or len(spec.kwonlyargs) > 0:
+            return None
+
+        result_format = SignatureCodec.__format_of(spec.annotations.get('return'))
+        if len(formats) == 0 and result_format is None:
+            return None
+        return SignatureCodec('<' + ''.join(formats), None if result_format is None else '<' + result_format)
+
+    @staticmethod
+    def from_description(description: str) -> 'SignatureCodec':
+        """
+        Returns the codec of a layout recorded by `describe`
+        """
+        args_format, result_format = description.split(':')
+        return SignatureCodec(args_format, None if result_format == '-' else result_format)
+
+    @staticmethod
+    def __format_of(annotation: Any) -> str | None:
+        # annotations are strings with `from __future__ import annotations`
+        name = annotation if isinstance(annotation, str) else getattr(annotation, '__name__', None)
+        if annotation is not None and not isinstance(annotation, str) and annotation not in (bool, int, float):
+            return None
+        return SIGNATURE_FORMATS.get(name)
+
+    @staticmethod
+    def __types_of(fmt: str) -> list[type]:
+        return [{'?': bool, 'q': int, 'd': float}[code] for code in fmt[1:]]
+
+    def describe(self) -> str:
+        """
+        Returns the layout of the codec, as recorded in the annotations of the function
+        """
+        return f'{self.args_format}:{self.result_format or "-"}'
+
+    def make_client_pack_args_fn(self, pack_args: Callable[[Iterable[Any]], str]) -> Callable[[Iterable[Any]], str]:
+        """
+        Returns a packer of the arguments that falls back to `pack_args`
+        """
+        packer = self.__args_struct
+        types = SignatureCodec.__types_of(self.args_format)
+
+        def signature_pack_args(it):
+            if len(it) == len(types) and all(type(value) is kind for value, kind in zip(it, types)):
+                try:
+                    return SIGNATURE_MARKER + b64encode(packer.pack(*it)).decode('ascii')
+                except struct.error:
+                    pass
+            return pack_args(it)
+
+        return signature_pack_args
+
+    def make_client_unpack_args_fn(self, unpack_args: Callable[[str], Any]) -> Callable[[str], Any]:
+        """
+        Returns an unpacker of the result that falls back to `unpack_args`
+        """
+        if self.__result_struct is None:
+            return unpack_args
+
+        unpacker = self.__result_struct
+
+        def signature_unpack_args(st):
+            if st.startswith(SIGNATURE_MARKER):
+                return unpacker.unpack(b64decode(st[len(SIGNATURE_MARKER):]))[0]
+            return unpack_args(st)
+
+        return signature_unpack_args
+
+    def server_source(self, server_unpack_args_name: str, server_pack_args_name: str) -> str:
+        """
+        Returns the source of the handler's `__away_signature_unpack_args` and `__away_signature_pack_args`,
+        which fall back to the given server functions
+        """
+        marker = repr(SIGNATURE_MARKER)
+
+        # bundles of a single argument are the argument itself, see `__safe_server_unpack_args`
+        n_args = len(self.args_format) - 1
+        unpacked = f"struct.unpack({self.args_format!r}, base64.b64decode(req[{len(SIGNATURE_MARKER)}:]))"
+        bundle = {0: 'None', 1: unpacked + '[0]'}.get(n_args, unpacked)
+        unpack_source = f"""def __away_signature_unpack_args(req):
+    state = __server_request_state()
+    state['signature'] = req.startswith({marker})
+    if state['signature']:
+        import struct, base64
+        state['v2'] = False
+        return {bundle}, {n_args}
+    return {server_unpack_args_name}(req)
+"""
+
+        if self.__result_struct is None:
+            pack_source = f"""def __away_signature_pack_args(res):
+    return {server_pack_args_name}(res)
+"""
+        else:
+            result_type = SignatureCodec.__types_of(self.result_format)[0].__name__
+            # the result is only packed in the fixed layout for callers that use it
+            pack_source = f"""def __away_signature_pack_args(res):
+    if __server_request_state().get('signature', False) and type(res) is {result_type}:
+        import struct, base64
+        try:
+            return {marker} + base64.b64encode(struct.pack({self.result_format!r}, res)).decode('ascii')
+        except struct.error:
+            pass
+    return {server_pack_args_name}(res)
+"""
+
+        return unpack_source + '\n' + pack_source
+
+    def __repr__(self) -> str:
+        return f'SignatureCodec(args_format={self.args_format!r}, result_format={self.result_format!r})'
+
+def make_client_negotiated_signature_pack_args_fn(get_signature: Callable[[], str | None], pack_args: Callable[[Iterable[Any]], str]) -> Callable[[Iterable[Any]], str]:
+    """
+    Like `SignatureCodec.make_client_pack_args_fn`, for a function whose signature layout (see `SignatureCodec.describe`)
+    is only known once it is called. `get_signature` is called on the first call, and calls use `pack_args` if it returns `None` or raises
+    """
+    return __make_client_negotiated_signature_fn(get_signature, pack_args, lambda codec: codec.make_client_pack_args_fn(pack_args))
+
+def make_client_negotiated_signature_unpack_args_fn(get_signature: Callable[[], str | None], unpack_args: Callable[[str], Any]) -> Callable[[str], Any]:
+    """
+    Like `SignatureCodec.make_client_unpack_args_fn`, for a function whose signature layout is only known once it is called
+    """
+    return __make_client_negotiated_signature_fn(get_signature, unpack_args, lambda codec: codec.make_client_unpack_args_fn(unpack_args))
+
+def __make_client_negotiated_signature_fn(get_signature: Callable[[], str | None], fallback: Callable, make_fn: Callable[[SignatureCodec], Callable]) -> Callable:
+    fns = []
+    lock = threading.Lock()
+
+    def negotiated_fn(arg):
+        if len(fns) == 0:
+            with lock:
+                if len(fns) == 0:
+                    try:
+                        description = get_signature()
+                    except Exception:
+                        description = None
+                    fns.append(fallback if description is None else make_fn(SignatureCodec.from_description(description)))
+
+        return fns[0](arg)
+
+    return negotiated_fn
+
+# Captured values that are not literals can be pickled into a sidecar file next to the handler, instead of being
+#  written inline as YAML. The sidecar maps their names to their pickles, which are loaded on their own, by the first
+#  call of a function that uses them, see `__server_load_lazily`
+CAPTURED_SIDECAR = 'away_captured.pickle'
+# supported by python 3.8 and later
+CAPTURED_PICKLE_PROTOCOL = 5
+# Literals with a longer repr, like lookup tables, also go to the sidecar
+CAPTURED_INLINE_LIMIT = 1024
+
+def __pack_captured_to_sidecar(var_name: str, var_obj: Any, sidecar: dict[str, bytes]) -> str | None:
+    """
+    Returns the expression that defines a captured value in the handler, and pickles it into `sidecar` if needed.
+    Returns `None` for the values that are written inline: small literals, functions, and the values pickle cannot pack
+    """
+    if inspect.ismodule(var_obj):
+        return f'__import__(\'importlib\').import_module({var_obj.__name__!r})'
+    if inspect.isfunction(var_obj):
+        return None
+    if len(repr(var_obj)) <= CAPTURED_INLINE_LIMIT and __is_repr_literal(var_obj):
+        return None
+
+    try:
+        sidecar[var_name] = pickle.dumps(var_obj, protocol=CAPTURED_PICKLE_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return None
+
+    return f'__server_load_captured({var_name!r})'
+
+def __server_load_captured(name): # pragma: no cover
+    # the sidecar is read once, on the first captured value, and each value is only unpickled when it is first used.
+    #  Values captured under several names are unpickled once
+    global __away_captured_values, __away_captured_objects
+    import pickle
+    if '__away_captured_values' not in globals():
+        import os
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'away_captured.pickle'), 'rb') as sidecar:
+            __away_captured_values = pickle.load(sidecar)
+        __away_captured_objects = {}
+    if name not in __away_captured_objects:
+        __away_captured_objects[name] = pickle.loads(__away_captured_values.pop(name))
+    return __away_captured_objects[name]
+
+def __server_load_lazily(uses): # pragma: no cover
+    # The values in the sidecar are not defined at import: each function of the handler that uses some is replaced by
+    #  a trampoline, that defines them on its first call and puts the function back. `uses` maps the names of the
+    #  functions to the names they use, and the sidecar entry of each
+    import functools, threading, types
+    handler_globals = globals()
+    lock = threading.Lock()
+
+    def load(names):
+        with lock:
+            for var_name, entry in names.items():
+                if var_name not in handler_globals:
+                    handler_globals[var_name] = __server_load_captured(entry)
+
+    def trampoline(fn_name, fn, names):
+        @functools.wraps(fn)
+        def load_then_call(*args, **kwargs):
+            load(names)
+            if handler_globals.get(fn_name) is load_then_call:
+                handler_globals[fn_name] = fn
+            return fn(*args, **kwargs)
+        return load_then_call
+
+    for fn_name, names in uses.items():
+        fn = handler_globals.get(fn_name)
+        if isinstance(fn, types.FunctionType):
+            handler_globals[fn_name] = trampoline(fn_name, fn, names)
+        else:
+            load(names)
+
 def __pack_repr_or_protocol(var_obj: Any, safe_args: bool = False) -> str:
 
     if __is_repr_literal(var_obj):
@@ -74,14 +831,45 @@ def __pack_repr_or_protocol(var_obj: Any, safe_args: bool = False) -> str:
 
         return packed_line
 
-def __is_repr_literal(var_obj: Any) -> bool:
+# Exact types whose values always have a literal repr, and containers that do when their items do. The repr of
+#  frozensets calls the builtin, which the handler has too
+LITERAL_TYPES = {str, bytes, int, bool, type(None)}
+LITERAL_CONTAINER_TYPES = {list, tuple, set, frozenset, dict}
 
-    is_repr_literal = True
+def __is_repr_literal(var_obj: Any) -> bool:
+    """
+    Whether the repr of `var_obj` is a python literal that evaluates back to it, so it can be written inline in the handler.
+    Values of builtin types are classified by their type, the others by parsing their repr, which is never run
+    """
     try:
-        fake_scope = {}
-        exec(f'test = {repr(var_obj)}', fake_scope)
-        assert fake_scope['test'] == var_obj
-    except SyntaxError:
-        is_repr_literal = False
-    
-    return is_repr_literal
+        is_literal = __is_builtin_literal(var_obj)
+        if is_literal is not None:
+            return is_literal
+        var_repr = repr(var_obj)
+        # default reprs of objects, functions and modules, no literal starts with it
+        if var_repr.startswith('<'):
+            return False
+        return ast.literal_eval(var_repr) == var_obj
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        # e.g. reprs of objects, of types that are not builtins, or of values that contain themselves
+        return False
+
+def __is_builtin_literal(var_obj: Any) -> bool | None:
+    # `None` when it cannot tell from the types alone
+    kind = type(var_obj)
+    if kind in LITERAL_TYPES:
+        return True
+    if kind is float:
+        # inf and nan have no literal
+        return math.isfinite(var_obj)
+    if kind not in LITERAL_CONTAINER_TYPES:
+        return None
+    items = [item for pair in var_obj.items() for item in pair] if kind is dict else var_obj
+    is_literal = True
+    for item in items:
+        item_is_literal = __is_builtin_literal(item)
+        if item_is_literal is False:
+            return False
+        if item_is_literal is None:
+            is_literal = None
+    return is_literal
@@ -0,0 +1,128 @@
+import random
+import threading
+from contextvars import ContextVar
+from time import monotonic
+
+from typing import Iterable
+
+class RetryPolicy():
+    """
+    Describes when and how calls to a function are retried
+
+    A call is retried if the function answers with one of `retry_statuses`, or, with `retry_connection_errors`,
+    if the connection fails. Attempt `n` (from 1) waits `backoff * multiplier**(n-1)` seconds, capped at
+    `max_backoff`. With `jitter`, the wait is drawn uniformly from `[0, wait]` so retrying clients spread out.
+    A `Retry-After` header sent by the gateway is honoured as a lower bound
+
+    No retry is made past `max_attempts` attempts in total or if it would start after `deadline` seconds
+    from the start of the call
+
+    Usage:
+    policy = RetryPolicy(max_attempts=5, retry_statuses=(429, 502, 503), deadline=10)
+
+    faas = FaasConnection(password=1234, retry=policy) # default for every proxy of the connection
+    fibonacci = builder.sync_from_name('fibonacci', faas, retry=policy) # or for a single proxy
+    """
+
+    def __init__(self,
+        max_attempts: int = 3,
+        retry_statuses: Iterable[int] = (429, 502, 503, 504),
+        retry_connection_errors: bool = True,
+        backoff: float = 0.1,
+        multiplier: float = 2,
+        max_backoff: float = 5,
+        jitter: bool = True,
+        deadline: float | None = None):
+
+        assert max_attempts > 0, f'max_attempts must be positive, got {max_attempts}'
+
+        self.max_attempts = max_attempts
+        self.retry_statuses = frozenset(retry_statuses)
+        self.retry_connection_errors = retry_connection_errors
+        self.backoff = backoff
+        self.multiplier = multiplier
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.deadline = deadline
+
+    def next_delay(self,
+        attempt: int,
+        started_at: float,
+        status_code: int | None = None,
+        error: Exception | None = None,
+        retry_after: str | None = None) -> float | None:
+        """
+        Returns how long to wait before retrying a failed attempt, or `None` if it should not be retried
+
+        arguments:
+            attempt: The number of the attempt that just finished, from 1
+            started_at: When the call started, as given by `time.monotonic`
+            status_code: The status code of the response, if there was one
+            error: The connection error raised by the attempt, if any
+            retry_after: The `Retry-After` header of the response, if any
+        """
+        if attempt >= self.max_attempts:
+            return None
+
+        if error is not None:
+            if not self.retry_connection_errors: return None
+        elif status_code not in self.retry_statuses:
+            return None
+
+        delay = min(self.backoff * self.multiplier ** (attempt - 1), self.max_backoff)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+
+        if retry_after is not None and retry_after.strip().isdigit():
+            delay = max(delay, float(retry_after))
+
+        if self.deadline is not None and monotonic() + delay - started_at > self.deadline:
+            return None
+
+        return delay
+
+    def __repr__(self) -> str:
+        return f'RetryPolicy(max_attempts={self.max_attempts}, retry_statuses={sorted(self.retry_statuses)}, deadline={self.deadline})'
+
+class RetryStats():
+    """
+    Counts the retries used by the calls of a proxy
+
+    `last_retries` is the number of retries of the last call finished in the current thread or asyncio task
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.histogram = {} # retries used -> number of calls
+        self.__lock = threading.Lock()
+        self.__last_retries = ContextVar('away_last_retries', default=0)
+
+    def record(self, retries: int):
+        self.__last_retries.set(retries)
+
+        with self.__lock:
+            self.calls += 1
+            self.retries += retries
+            self.histogram[retries] = self.histogram.get(retries, 0) + 1
+
+    @property
+    def last_retries(self) -> int:
+        return self.__last_retries.get()
+
+    def __repr__(self) -> str:
+        return f'RetryStats(calls={self.calls}, retries={self.retries}, histogram={self.histogram})'
+
+def __resolve_retry_policy(retry: RetryPolicy | bool | None, faas_default: RetryPolicy | None) -> RetryPolicy | None:
+    """
+    Resolves the `retry=` option of the builders: `None` uses the default policy of the connection, `False` disables
+    retries, `True` uses a default `RetryPolicy`
+    """
+    if retry is None:
+        return faas_default
+    if retry is True:
+        return RetryPolicy()
+    if retry is False:
+        return None
+
+    return retry
@@ -0,0 +1,67 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import monotonic
+
+from typing import Iterator, Tuple
+
+from .exceptions import FaasFunctionTimedOutError
+
+# Header carrying the deadline of a call to its handler, as the seconds left before it passes: the handler
+#  counts them on its own clock, which need not agree with the client's
+DEADLINE_HEADER = 'X-Away-Time-Remaining'
+
+# (deadline as given by `time.monotonic`, timeout of each request) of the calls made in the current context
+__call_limits = ContextVar('away_call_limits', default=(None, None))
+
+@contextmanager
+def deadline(seconds: float | None, timeout: float | None = None) -> Iterator[None]:
+    """
+    Limits the proxy calls made inside the block: each call (with all its retries) must finish within `seconds`
+    from entering the block, and each of its requests within `timeout` seconds. Calls past the deadline raise
+    `FaasFunctionTimedOutError`. Blocks can be nested: the earliest deadline applies
+
+    The deadline is sent to the function's handler, which abandons the call once it has passed
+
+    Usage:
+    with timeouts.deadline(2.5):
+        a = fibonacci(10)
+        b = fibonacci(20) # shares what remains of the 2.5s
+    """
+    outer_deadline_at, outer_timeout = __call_limits.get()
+
+    deadline_at = None if seconds is None else monotonic() + seconds
+    if outer_deadline_at is not None:
+        deadline_at = outer_deadline_at if deadline_at is None else min(deadline_at, outer_deadline_at)
+
+    token = __call_limits.set((deadline_at, outer_timeout if timeout is None else timeout))
+    try:
+        yield
+    finally:
+        __call_limits.reset(token)
+
+def __resolve_call_limits(timeout: float | None, deadline: float | None) -> Tuple[float | None, float | None]:
+    """
+    Combines the `timeout=` and `deadline=` options of a proxy with the limits of the current context.
+    Returns the deadline of the call (as given by `time.monotonic`) and the timeout of each request
+    """
+    context_deadline_at, context_timeout = __call_limits.get()
+
+    deadline_at = None if deadline is None else monotonic() + deadline
+    if context_deadline_at is not None:
+        deadline_at = context_deadline_at if deadline_at is None else min(deadline_at, context_deadline_at)
+
+    return deadline_at, timeout if context_timeout is None else context_timeout
+
+def __resolve_request_limits(function_name: str, deadline_at: float | None, timeout: float | None) -> Tuple[float | None, dict[str, str]]:
+    """
+    Returns the timeout of the next request of a call and the headers that propagate its deadline,
+    or raises if the deadline has passed
+    """
+    if deadline_at is None:
+        return timeout, {}
+
+    remaining = deadline_at - monotonic()
+    if remaining <= 0:
+        raise FaasFunctionTimedOutError(f'The deadline of the call to function {function_name} passed')
+
+    return remaining if timeout is None else min(timeout, remaining), {DEADLINE_HEADER: f'{remaining:.3f}'}
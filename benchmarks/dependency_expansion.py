@@ -0,0 +1,79 @@
+"""
+Times the expansion of the dependencies of functions with wide and deep dependency graphs, and of a module of
+functions that share helpers, with the cache of code objects cold and warm
+
+Usage:
+python benchmarks/dependency_expansion.py [--width 200] [--depth 200] [--functions 50] [--repeat 5]
+"""
+from away.__fn_utils import __get_external_dependencies as get_external_dependencies
+from away.__fn_utils import __clear_code_cache as clear_code_cache
+import importlib.util
+import argparse
+import tempfile
+import time
+import sys
+import os
+
+def module_source(width, depth, functions):
+    lines = ['TABLE = {' + ', '.join(f"'k{i}': {i}" for i in range(50)) + '}', '']
+
+    # wide: one function calls many helpers
+    for i in range(width):
+        lines += [f'def wide_helper_{i}(x):', f'    return x + TABLE["k{i % 50}"]', '']
+    lines += ['def wide(x):', '    return sum([' + ', '.join(f'wide_helper_{i}(x)' for i in range(width)) + '])', '']
+
+    # deep: a chain of functions that each call the next one
+    lines += [f'def deep_{depth}(x):', '    return x', '']
+    for i in reversed(range(depth)):
+        lines += [f'def deep_{i}(x):', f'    return deep_{i + 1}(x) + 1', '']
+
+    # a module of functions that share the same helpers
+    for i in range(functions):
+        helpers = ', '.join(f'wide_helper_{(i + j) % width}' for j in range(20))
+        lines += [f'def shared_{i}(x):', f'    return [helper(x) for helper in ({helpers})] + [deep_{depth // 2}(x)]', '']
+    return '\n'.join(lines)
+
+def load_module(source, directory):
+    path = os.path.join(directory, 'away_benchmark_graph.py')
+    with open(path, 'w') as f:
+        f.write(source)
+    spec = importlib.util.spec_from_file_location('away_benchmark_graph', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def timed(fns, repeat, cold):
+    best = float('inf')
+    for _ in range(repeat):
+        if cold:
+            clear_code_cache()
+        start = time.perf_counter()
+        for fn in fns:
+            get_external_dependencies(fn, 0)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--width', type=int, default=200)
+    parser.add_argument('--depth', type=int, default=200)
+    parser.add_argument('--functions', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 4 * args.depth + 100))
+    with tempfile.TemporaryDirectory() as directory:
+        module = load_module(module_source(args.width, args.depth, args.functions), directory)
+        graphs = {
+            f'wide ({args.width} helpers)': [module.wide],
+            f'deep (chain of {args.depth})': [module.deep_0],
+            f'{args.functions} functions sharing helpers': [getattr(module, f'shared_{i}') for i in range(args.functions)]
+        }
+
+        print(f'{"graph":<40}{"cold (ms)":>12}{"warm (ms)":>12}{"speedup":>10}')
+        for name, fns in graphs.items():
+            cold, warm = timed(fns, args.repeat, cold=True), timed(fns, args.repeat, cold=False)
+            print(f'{name:<40}{cold * 1000:>12.2f}{warm * 1000:>12.2f}{cold / warm:>9.1f}x')
+
+if __name__ == '__main__':
+    main()
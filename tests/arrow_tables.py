@@ -0,0 +1,68 @@
+from away import FaasConnection, builder
+from away.builder import __build_handler_template as build_handler_template
+from away.protocol import make_client_pack_args_fn, make_client_unpack_args_fn
+from away.protocol import __safe_server_unpack_args as safe_server_unpack_args
+from away.protocol import __safe_server_pack_args as safe_server_pack_args
+from fake_templates import classic_function
+from fake_gateway import FakeGateway
+
+try:
+    import msgpack
+    import pyarrow as pa
+    import pandas as pd
+except ImportError:
+    msgpack = pa = pd = None
+
+def positives(frame):
+    return frame[frame['x'] > 0]
+
+import unittest
+@unittest.skipIf(msgpack is None or pa is None or pd is None, 'msgpack, pyarrow or pandas are not installed')
+class TestArrowTables(unittest.TestCase):
+
+    def setUp(self):
+        self.pack = make_client_pack_args_fn(safe_args=True, protocol=2)
+        self.unpack = make_client_unpack_args_fn(safe_args=True, protocol=2)
+
+    def test_dataframe(self):
+
+        frame = pd.DataFrame({'x': [1.5, -2.0, None], 'name': ['a', 'b', 'c'], 'when': pd.date_range('2024-01-01', periods=3)}, index=[10, 20, 30])
+
+        server_side_frame, _ = safe_server_unpack_args(self.pack((frame,)))
+        self.assertIsInstance(server_side_frame, pd.DataFrame)
+        pd.testing.assert_frame_equal(server_side_frame, frame)
+
+        pd.testing.assert_frame_equal(self.unpack(safe_server_pack_args(server_side_frame)), frame)
+
+    def test_table(self):
+
+        table = pa.table({'x': pa.array([1, None, 3], type=pa.int16()), 'tags': [['a'], [], ['b', 'c']]})
+
+        server_side_table, _ = safe_server_unpack_args(self.pack((table,)))
+        self.assertIsInstance(server_side_table, pa.Table)
+        self.assertTrue(server_side_table.equals(table))
+
+        self.assertTrue(self.unpack(safe_server_pack_args(server_side_table)).equals(table))
+
+    def test_mixed_with_other_values(self):
+
+        args = ({'frames': [pd.DataFrame({'x': [1]})]}, 3, (pa.table({'y': [2]}),))
+        (config, n, (table,)), _ = safe_server_unpack_args(self.pack(args))
+
+        pd.testing.assert_frame_equal(config['frames'][0], args[0]['frames'][0])
+        self.assertEqual(n, 3)
+        self.assertTrue(table.equals(args[2][0]))
+
+    def test_handler(self):
+
+        with FakeGateway() as gateway:
+            faas = FaasConnection(provider='127.0.0.1', port=gateway.port, user=None, ensure_available=False)
+            gateway.deploy('positives', classic_function(build_handler_template(positives, safe_server_unpack_args, safe_server_pack_args, hash(faas))))
+            positives_in_faas = builder.sync_from_name_with_protocol('positives', faas, protocol=2)
+
+            frame = pd.DataFrame({'x': [(-1) ** i * i for i in range(100000)]})
+            pd.testing.assert_frame_equal(positives_in_faas(frame), positives(frame))
+            faas.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+from away import FaasConnection, builder
+from away.__async_transport import AsyncTransport
+from fake_gateway import FakeGateway, TrackingGateway
+import asyncio
+import gc
+from base64 import b64encode
+
+import unittest
+class TestAsyncTransport(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.gateway = TrackingGateway().__enter__()
+        self.gateway.deploy('echo', lambda body, headers: (200, body))
+        self.gateway.deploy('whoami', lambda body, headers: (200, headers.get('Authorization', '')))
+        self.gateway.deploy('fails', lambda body, headers: (500, 'oops'))
+        self.faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False, async_pool_maxsize=8)
+
+    async def asyncTearDown(self):
+        await self.faas.aclose()
+
+    def tearDown(self):
+        self.gateway.__exit__()
+
+    async def test_many_in_flight(self):
+
+        echo = builder.async_from_name('echo', self.faas)
+
+        res = await asyncio.gather(*[echo(i) for i in range(1000)])
+
+        self.assertEqual(res, [str(i) for i in range(1000)])
+        self.assertLessEqual(len(self.gateway.connections), 8)
+
+    async def test_reuses_connections(self):
+
+        @builder.faas_function(self.faas)
+        async def echo(n):
+            pass
+
+        for i in range(10):
+            self.assertEqual(await echo(i), str(i))
+
+        self.assertEqual(len(self.gateway.connections), 1)
+
+    async def test_sends_auth(self):
+
+        faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False)
+        faas.auth_address = f'admin:1234@{faas.address}'
+        whoami = builder.async_from_name('whoami', faas, is_auth=True)
+
+        self.assertEqual(await whoami(), 'Basic ' + b64encode(b'admin:1234').decode())
+        await faas.aclose()
+
+    async def test_exceptions(self):
+
+        fails = builder.async_from_name('fails', self.faas, implicit_exception_handling=False)
+        self.assertEqual(await fails(), ('oops', 500))
+
+    async def test_survives_closed_keepalive(self):
+
+        echo = builder.async_from_name('echo', self.faas)
+
+        # the server silently drops every connection after answering
+        self.gateway.keep_alive = False
+        for i in range(5):
+            self.assertEqual(await echo(i), str(i))
+
+    async def test_async_with(self):
+
+        async with FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False) as faas:
+            echo = builder.async_from_name('echo', faas)
+            self.assertEqual(await echo(1), '1')
+
+        # the connection opened by the proxy is closed along with the block
+        self.assertEqual(faas.get_async_transport()._AsyncTransport__pools, {})
+
+class TestAsyncTransportResponses(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        # answers every request with the next canned response, byte for byte
+        self.responses = []
+        self.connections = 0
+
+        async def serve(reader, writer):
+            self.connections += 1
+            while True:
+                line = await reader.readline()
+                if line == b'':
+                    break
+                if line == b'\r\n':
+                    writer.write(self.responses.pop(0))
+                    await writer.drain()
+            writer.close()
+
+        self.server = await asyncio.start_server(serve, '127.0.0.1', 0)
+        self.url = f'http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/'
+        self.transport = AsyncTransport(pool_maxsize=1)
+
+    async def asyncTearDown(self):
+        await self.transport.aclose()
+        self.server.close()
+
+    async def test_interim_responses(self):
+
+        self.responses = [b'HTTP/1.1 100 Continue\r\n\r\nHTTP/1.1 103 Early Hints\r\nLink: </a>\r\n\r\nHTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok']
+
+        res = await self.transport.request('GET', self.url)
+        self.assertEqual((res.status_code, res.text), (200, 'ok'))
+
+    async def test_chunk_trailers(self):
+
+        self.responses = [
+            b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\nTrailer: Digest\r\n\r\n2;name=value\r\nok\r\n0\r\nDigest: abc\r\n\r\n',
+            b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok',
+        ]
+
+        self.assertEqual((await self.transport.request('GET', self.url)).text, 'ok')
+        # the trailers are read to the end, leaving the connection ready for the next response
+        self.assertEqual((await self.transport.request('GET', self.url)).text, 'ok')
+        self.assertEqual(self.connections, 1)
+
+    async def test_connection_close(self):
+
+        self.responses = [
+            b'HTTP/1.1 200 OK\r\nConnection: close\r\nContent-Length: 2\r\n\r\nok',
+            b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok',
+        ]
+
+        self.assertEqual((await self.transport.request('GET', self.url)).text, 'ok')
+        self.assertEqual((await self.transport.request('GET', self.url)).text, 'ok')
+        # the server asked for its connection not to be reused
+        self.assertEqual(self.connections, 2)
+
+    async def test_bodiless_responses(self):
+
+        # a 304 repeats the length of the body it stands for, without sending it
+        self.responses = [
+            b'HTTP/1.1 204 No Content\r\n\r\n',
+            b'HTTP/1.1 304 Not Modified\r\nContent-Length: 10\r\n\r\n',
+            b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok',
+        ]
+
+        self.assertEqual((await self.transport.request('GET', self.url)).content, b'')
+        res = await self.transport.request('GET', self.url, stream=True)
+        self.assertEqual([chunk async for chunk in res.iter_chunks()], [])
+        self.assertEqual((await self.transport.request('GET', self.url)).text, 'ok')
+        self.assertEqual(self.connections, 1)
+
+    async def test_unread_streams_release_the_pool(self):
+
+        self.responses = [b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok'] * 3
+
+        res = await self.transport.request('GET', self.url, stream=True)
+        res.close()
+        await asyncio.wait_for(self.transport.request('GET', self.url, stream=True), 1)
+        # neither read nor closed, only dropped
+        gc.collect()
+        self.assertEqual((await asyncio.wait_for(self.transport.request('GET', self.url), 1)).text, 'ok')
+
+    async def test_rejects_https(self):
+
+        with self.assertRaises(ValueError):
+            await self.transport.request('GET', self.url.replace('http', 'https'))
+
+class TestAsyncTransportLoops(unittest.TestCase):
+
+    def test_usable_from_several_loops(self):
+
+        with FakeGateway() as gateway:
+            gateway.deploy('echo', lambda body, headers: (200, body))
+            faas = FaasConnection(provider='127.0.0.1', port=gateway.port, user=None, ensure_available=False)
+
+            # built outside of any running loop
+            echo = builder.async_from_name('echo', faas)
+
+            self.assertEqual(asyncio.run(echo(1)), '1')
+            self.assertEqual(asyncio.run(echo(2)), '2')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+from away import FaasConnection, builder
+from away.builder import __build_handler_template as build_handler_template
+from away.protocol import __safe_server_unpack_batch_args as safe_server_unpack_batch_args
+from away.protocol import __safe_server_pack_args as safe_server_pack_args
+from away.protocol import make_client_pack_args_fn
+from away.exceptions import FaasReturnedError
+from fake_templates import classic_function
+from fake_gateway import FakeGateway
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+
+def sum_one(n):
+    return n + 1
+
+def sum_some_numbers(one, another):
+    return one + another
+
+import unittest
+class TestBatching(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.gateway = FakeGateway().__enter__()
+        cls.faas = FaasConnection(provider='127.0.0.1', port=cls.gateway.port, user=None, ensure_available=False)
+
+        for fn in [sum_one, sum_some_numbers]:
+            handler = build_handler_template(fn, safe_server_unpack_batch_args, safe_server_pack_args, hash(cls.faas), batch=True)
+            cls.gateway.deploy(fn.__name__.replace('_', '-'), classic_function(handler))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.gateway.__exit__()
+
+    def test_server_unpacks_bundles(self):
+
+        pack = make_client_pack_args_fn(safe_args=True)
+        bundles = safe_server_unpack_batch_args(pack([(1,), (1, 2), ()]))
+
+        self.assertEqual(bundles, [(1, 1), ([1, 2], 2), (None, 0)])
+
+    def test_batch_in_one_request(self):
+
+        sum_one_in_faas = builder.sync_from_name_with_protocol('sum_one', self.faas, batch=True)
+
+        requests_before = self.gateway.requests
+        res = sum_one_in_faas.batch([(i,) for i in range(1000)])
+
+        self.assertEqual(res, [i + 1 for i in range(1000)])
+        self.assertEqual(self.gateway.requests - requests_before, 1)
+
+    def test_single_call(self):
+
+        @builder.faas_function_with_protocol(self.faas, batch=True)
+        def sum_some_numbers(one, another):
+            pass
+
+        self.assertEqual(sum_some_numbers(1, 2), 3)
+        self.assertTrue(sum_some_numbers.__away_protocol_is_batch__)
+
+    def test_per_item_errors(self):
+
+        sum_one_in_faas = builder.sync_from_name_with_protocol('sum_one', self.faas, batch=True)
+
+        res = sum_one_in_faas.batch([(1,), ('a',), (1, 2)], return_exceptions=True)
+        self.assertEqual(res[0], 2)
+        self.assertIsInstance(res[1], FaasReturnedError)
+        self.assertIsInstance(res[2], FaasReturnedError)
+        self.assertIn('AssertionError', str(res[2]))
+
+        self.assertRaises(FaasReturnedError, sum_one_in_faas.batch, [(1,), ('a',)])
+        self.assertRaises(FaasReturnedError, sum_one_in_faas, 'a')
+
+    def test_auto_batch(self):
+
+        sum_one_in_faas = builder.sync_from_name_with_protocol('sum_one', self.faas, batch=True, auto_batch=True, batch_window=0.05, max_batch_size=16)
+
+        requests_before = self.gateway.requests
+        with ThreadPoolExecutor(32) as pool:
+            res = list(pool.map(sum_one_in_faas, range(64)))
+
+        self.assertEqual(res, [i + 1 for i in range(64)])
+        self.assertLess(self.gateway.requests - requests_before, 64)
+
+    def test_auto_batch_errors(self):
+
+        sum_one_in_faas = builder.sync_from_name_with_protocol('sum_one', self.faas, batch=True, auto_batch=True, batch_window=0.05)
+
+        with ThreadPoolExecutor(2) as pool:
+            ok, failed = pool.submit(sum_one_in_faas, 1), pool.submit(sum_one_in_faas, 'a')
+
+            self.assertEqual(ok.result(), 2)
+            self.assertRaises(FaasReturnedError, failed.result)
+
+    def test_auto_batch_requires_batch(self):
+
+        self.assertRaises(AssertionError, builder.sync_from_name_with_protocol, 'sum_one', self.faas, auto_batch=True)
+
+    def test_not_batch_has_no_method(self):
+
+        sum_one_in_faas = builder.sync_from_name_with_protocol('sum_one', self.faas)
+        self.assertFalse(hasattr(sum_one_in_faas, 'batch'))
+
+class TestAsyncBatching(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.gateway = FakeGateway().__enter__()
+        self.faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False)
+        handler = build_handler_template(sum_one, safe_server_unpack_batch_args, safe_server_pack_args, hash(self.faas), batch=True)
+        self.gateway.deploy('sum-one', classic_function(handler))
+
+    async def asyncTearDown(self):
+        await self.faas.aclose()
+
+    def tearDown(self):
+        self.gateway.__exit__()
+
+    async def test_batch(self):
+
+        sum_one_in_faas = builder.async_from_name_with_protocol('sum_one', self.faas, batch=True)
+
+        self.assertEqual(await sum_one_in_faas.batch([(1,), (2,)]), [2, 3])
+        self.assertEqual(await sum_one_in_faas(41), 42)
+
+    async def test_auto_batch(self):
+
+        sum_one_in_faas = builder.async_from_name_with_protocol('sum_one', self.faas, batch=True, auto_batch=True, max_batch_size=64)
+
+        res = await asyncio.gather(*[sum_one_in_faas(i) for i in range(200)])
+        self.assertEqual(res, [i + 1 for i in range(200)])
+        self.assertEqual(self.gateway.requests, 4)
+
+        res = await asyncio.gather(sum_one_in_faas(1), sum_one_in_faas('a'), return_exceptions=True)
+        self.assertEqual(res[0], 2)
+        self.assertIsInstance(res[1], FaasReturnedError)
+
+if __name__ == '__main__':
+    unittest.main()
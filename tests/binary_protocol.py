@@ -0,0 +1,240 @@
+from away import FaasConnection, builder
+from away.builder import __build_handler_template as build_handler_template
+from away.protocol import make_client_pack_args_fn, make_client_unpack_args_fn, V2_MARKER
+from away.protocol import __safe_server_unpack_args as safe_server_unpack_args
+from away.protocol import __unsafe_server_unpack_args as unsafe_server_unpack_args
+from away.protocol import __safe_server_pack_args as safe_server_pack_args
+from away.protocol import __unsafe_server_pack_args as unsafe_server_pack_args
+from away.protocol import __safe_server_unpack_batch_args as safe_server_unpack_batch_args
+from fake_templates import classic_function
+from fake_gateway import DescribingGateway
+from datetime import datetime, date, timezone
+from fractions import Fraction
+from collections import namedtuple, OrderedDict
+from enum import IntEnum
+import socket
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+def echo(value):
+    return value
+
+def add_one(n):
+    return n + 1
+
+def ordered(pairs):
+    import collections
+    return collections.OrderedDict(pairs)
+
+Point = namedtuple('Point', ['x', 'y'])
+
+class Color(IntEnum):
+    RED = 1
+
+class Bodies():
+    """
+    Records the bodies of the requests to a function
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.bodies = []
+
+    def __call__(self, body, headers):
+        self.bodies.append(body)
+        return self.fn(body, headers)
+
+ARGS = (
+    1, -2**63, 2**64 - 1, 1.5, None, True, 'ñé', b'\x00\xff',
+    (1, (2, 3)), [1, [2]], {4, 5}, frozenset({6}), {(1, 2): 'tuple key', 3: 'int key'},
+    datetime(2024, 1, 2, 3, 4, 5, 6), datetime(2024, 1, 2, tzinfo=timezone.utc), date(2024, 1, 2)
+)
+
+import unittest
+@unittest.skipIf(msgpack is None, 'msgpack is not installed')
+class TestProtocolV2(unittest.TestCase):
+
+    def test_round_trip(self):
+
+        pack = make_client_pack_args_fn(safe_args=True, protocol=2)
+        unpack = make_client_unpack_args_fn(safe_args=True, protocol=2)
+
+        packed = pack(ARGS)
+        self.assertTrue(packed.startswith(V2_MARKER))
+
+        server_side_args, args_len = safe_server_unpack_args(packed)
+        self.assertEqual(server_side_args, ARGS)
+        self.assertEqual([type(arg) for arg in server_side_args], [type(arg) for arg in ARGS])
+        self.assertEqual(args_len, len(ARGS))
+
+        # the handler answers in the protocol of the request
+        res = safe_server_pack_args(server_side_args)
+        self.assertTrue(res.startswith(V2_MARKER))
+        self.assertEqual(unpack(res + '\n'), ARGS)
+
+    def test_yaml_fallback(self):
+
+        pack = make_client_pack_args_fn(safe_args=False, protocol=2)
+        unpack = make_client_unpack_args_fn(safe_args=False, protocol=2)
+
+        # not representable in protocol v2
+        for args in [(2**64,), (Fraction(1, 3),)]:
+            packed = pack(args)
+            self.assertFalse(packed.startswith(V2_MARKER))
+
+            server_side_args, _ = unsafe_server_unpack_args(packed)
+            self.assertEqual(server_side_args, args[0])
+            self.assertEqual(unpack(unsafe_server_pack_args(server_side_args)), args[0])
+
+    def test_exact_types(self):
+
+        pack = make_client_pack_args_fn(safe_args=False, protocol=2)
+        unpack = make_client_unpack_args_fn(safe_args=False, protocol=2)
+
+        # unsafe calls keep the types msgpack would lose, even nested ones, by sending them in YAML
+        for arg in [Point(1, 2), [OrderedDict(a=1)], {'k': Color.RED}, [True, 1.5, (2,)]]:
+            packed = pack((arg,))
+            self.assertEqual(packed.startswith(V2_MARKER), arg == [True, 1.5, (2,)])
+
+            server_side_arg, _ = unsafe_server_unpack_args(packed)
+            self.assertEqual(repr(server_side_arg), repr(arg))
+
+        # the handler does too, with the codec of the client
+        handler = {}
+        exec(build_handler_template(ordered, unsafe_server_unpack_args, unsafe_server_pack_args, 0), handler)
+        res = handler['handle'](pack(([('b', 1), ('a', 2)],)))
+        self.assertFalse(res.startswith(V2_MARKER))
+        self.assertEqual(repr(unpack(res)), repr(OrderedDict([('b', 1), ('a', 2)])))
+
+        exec(build_handler_template(echo, unsafe_server_unpack_args, unsafe_server_pack_args, 0), handler)
+        res = handler['handle'](pack((ARGS,)))
+        self.assertTrue(res.startswith(V2_MARKER))
+        self.assertEqual(unpack(res), ARGS)
+
+        # safe calls pack them as their base type, as YAML cannot represent them safely
+        self.assertEqual(make_client_unpack_args_fn(protocol=2)(make_client_pack_args_fn(protocol=2)((Point(1, 2),))), ((1, 2),))
+
+    def test_yaml_requests(self):
+
+        # the handler answers YAML requests in YAML
+        safe_server_unpack_args(make_client_pack_args_fn(safe_args=True)((1, 2)))
+        self.assertEqual(safe_server_pack_args((1, 2)), '- 1\n- 2\n')
+
+    def test_batch(self):
+
+        pack = make_client_pack_args_fn(safe_args=True, protocol=2)
+        self.assertEqual(safe_server_unpack_batch_args(pack([(1,), (2, 3), ()])), [(1, 1), ((2, 3), 2), (None, 0)])
+
+@unittest.skipIf(msgpack is None, 'msgpack is not installed')
+class TestProtocolNegotiation(unittest.TestCase):
+
+    def setUp(self):
+        self.gateway = DescribingGateway().__enter__()
+        self.faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False)
+
+        self.gateway.deploy('echo', classic_function(build_handler_template(echo, safe_server_unpack_args, safe_server_pack_args, hash(self.faas))))
+        self.gateway.deploy('add-one', classic_function(build_handler_template(add_one, safe_server_unpack_batch_args, safe_server_pack_args, hash(self.faas), batch=True)))
+        self.echo = Bodies(self.gateway.functions['echo'])
+        self.gateway.deploy('echo', self.echo)
+
+        for name in ['echo', 'add-one']:
+            self.gateway.descriptions[name] = {'annotations': {'built-with': 'away', 'away-protocol': '2'}}
+
+    def tearDown(self):
+        self.faas.close()
+        self.gateway.__exit__()
+
+    def test_from_annotations(self):
+
+        self.faas.auth_address = self.faas.address
+        echo_in_faas = builder.sync_from_name_with_protocol('echo', self.faas)
+
+        self.assertEqual(echo_in_faas(ARGS), ARGS)
+        self.assertEqual(echo_in_faas({1, 2}), {1, 2})
+        self.assertTrue(all(body.startswith(V2_MARKER) for body in self.echo.bodies))
+        # the annotations are only read once
+        self.assertEqual(self.gateway.fingerprint_requests, 1)
+
+    def test_annotations_unavailable(self):
+
+        # reading the annotations requires an authenticated connection
+        @builder.faas_function_with_protocol(self.faas)
+        def echo(value):
+            pass
+
+        self.assertEqual(echo([1, 2]), [1, 2])
+        self.assertEqual(self.echo.bodies, ['- - 1\n  - 2\n'])
+
+    def test_version_1(self):
+
+        self.faas.auth_address = self.faas.address
+        self.gateway.descriptions['echo'] = {'annotations': {'built-with': 'away'}}
+        echo_in_faas = builder.sync_from_name_with_protocol('echo', self.faas)
+
+        self.assertEqual(echo_in_faas((1, 2)), [1, 2])
+        self.assertFalse(self.echo.bodies[0].startswith(V2_MARKER))
+
+    def test_batch(self):
+
+        add_one_in_faas = builder.sync_from_name_with_protocol('add_one', self.faas, batch=True, protocol=2)
+
+        self.assertEqual(add_one_in_faas.batch([(i,) for i in range(100)]), list(range(1, 101)))
+
+    def test_async(self):
+
+        import asyncio
+        echo_in_faas = builder.async_from_name_with_protocol('echo', self.faas, protocol=2)
+
+        async def call(value):
+            try:
+                return await echo_in_faas(value)
+            finally:
+                await self.faas.aclose()
+
+        self.assertEqual(asyncio.run(call(ARGS)), ARGS)
+        self.assertTrue(self.echo.bodies[0].startswith(V2_MARKER))
+
+    def test_async_from_annotations(self):
+
+        import asyncio
+        self.faas.auth_address = self.faas.address
+
+        # async proxies read the annotations when they are built, not on their first call in the event loop
+        echo_in_faas = builder.async_from_name_with_protocol('echo', self.faas)
+        @builder.faas_function_with_protocol(self.faas)
+        async def echo(value):
+            pass
+        self.assertEqual(self.gateway.fingerprint_requests, 2)
+
+        async def call(value):
+            try:
+                return [await echo_in_faas(value), await echo(value)]
+            finally:
+                await self.faas.aclose()
+
+        self.assertEqual(asyncio.run(call(ARGS)), [ARGS, ARGS])
+        self.assertTrue(all(body.startswith(V2_MARKER) for body in self.echo.bodies))
+        self.assertEqual(self.gateway.fingerprint_requests, 2)
+
+    def test_async_annotations_unreachable(self):
+
+        # a port nothing listens on
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        unreachable = FaasConnection(provider='127.0.0.1', port=port, user=None, ensure_available=False)
+        unreachable.auth_address = unreachable.address
+
+        with self.assertWarns(RuntimeWarning):
+            builder.async_from_name_with_protocol('echo', unreachable)
+
+        # functions that were not built by away are an error, not a fallback to YAML
+        self.faas.auth_address = self.faas.address
+        with self.assertRaises(AssertionError):
+            builder.async_from_name_with_protocol('not-away', self.faas)
+
+if __name__ == '__main__':
+    unittest.main()
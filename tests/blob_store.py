@@ -0,0 +1,176 @@
+from away import FaasConnection, builder, blobstore
+from away.builder import __build_handler_template as build_handler_template
+from away.blobstore import FilesystemBlobStore, LocalBlobStore, REFERENCES_MARKER
+from away.blobstore import __server_read_cached_blob as server_read_cached_blob
+from away.protocol import make_client_pack_args_fn
+from away.protocol import __safe_server_unpack_args as safe_server_unpack_args
+from away.protocol import __safe_server_pack_args as safe_server_pack_args
+from fake_templates import classic_function
+from fake_gateway import FakeGateway
+from hashlib import sha256
+import json
+import tempfile
+import shutil
+import os
+import time
+
+def count_above(values, limit):
+    return len([v for v in values if v > limit])
+
+class CountingStore(FilesystemBlobStore):
+    """
+    Counts the blobs written to the store
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.writes = 0
+
+    def write(self, key, data):
+        self.writes += 1
+        super().write(key, data)
+
+class Bodies():
+    """
+    Records the bodies of the requests to a function
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.bodies = []
+
+    def __call__(self, body, headers):
+        self.bodies.append(body)
+        return self.fn(body, headers)
+
+import unittest
+class TestBlobStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.store = CountingStore(os.path.join(self.directory, 'store'), threshold=1024)
+        self.pack = self.store.make_client_pack_args_fn(make_client_pack_args_fn())
+
+        # the handler's cache of blobs
+        self.handler_cache_dir = blobstore.HANDLER_CACHE_DIR
+        blobstore.HANDLER_CACHE_DIR = self.cache_dir
+
+    def tearDown(self):
+        blobstore.HANDLER_CACHE_DIR = self.handler_cache_dir
+        shutil.rmtree(self.directory)
+        shutil.rmtree(self.cache_dir)
+
+    def test_small_arguments(self):
+
+        self.assertEqual(self.pack(([1, 2],)), make_client_pack_args_fn()(([1, 2],)))
+        self.assertEqual(self.pack(([1, 2], 3)), REFERENCES_MARKER + json.dumps([['inline', make_client_pack_args_fn()((arg,))] for arg in ([1, 2], 3)]))
+        self.assertEqual(self.store.writes, 0)
+
+    def test_packs_once(self):
+
+        packed = []
+        def pack_args(it):
+            packed.append(tuple(it))
+            return make_client_pack_args_fn()(it)
+
+        dataset = list(range(1000))
+        self.store.make_client_pack_args_fn(pack_args)((dataset, 1))
+        self.assertEqual(packed, [(dataset,), (1,)])
+
+    def test_uploads_once(self):
+
+        dataset = list(range(1000))
+
+        first, second = self.pack((dataset, 1)), self.pack((dataset, 2))
+        self.assertTrue(first.startswith(REFERENCES_MARKER))
+        self.assertLess(len(second), 200)
+        self.assertEqual(self.store.writes, 1)
+
+        # other proxies with the same store find the blob in it
+        other_store = CountingStore(self.store.directory, threshold=1024)
+        other_store.make_client_pack_args_fn(make_client_pack_args_fn())((dataset, 3))
+        self.assertEqual(other_store.writes, 0)
+
+    def test_server_unpack(self):
+
+        namespace = {
+            safe_server_unpack_args.__name__: safe_server_unpack_args,
+            '__server_read_cached_blob': server_read_cached_blob
+        }
+        exec(self.store.server_source(safe_server_unpack_args.__name__), namespace)
+        unpack = namespace['__away_refs_unpack_args']
+
+        dataset = [str(i) for i in range(1000)]
+        self.assertEqual(unpack(self.pack((dataset, 1))), ((dataset, 1), 2))
+        self.assertEqual(unpack(self.pack((dataset,))), (dataset, 1))
+        self.assertEqual(unpack(self.pack((1, 2))), ((1, 2), 2))
+
+        # the blob is now in the handler's cache
+        self.assertEqual(os.listdir(self.cache_dir), os.listdir(self.store.directory))
+
+    def test_cache_eviction(self):
+
+        blobs = [os.urandom(100) for _ in range(4)]
+        keys = [self.store.put(blob) for blob in blobs]
+        read = lambda key: server_read_cached_blob(key, self.store.read, self.cache_dir, 250)
+
+        for key, blob in zip(keys[:2], blobs):
+            self.assertEqual(read(key), blob)
+        # reading the first blob again makes it the most recently used
+        time.sleep(0.01)
+        read(keys[0])
+        time.sleep(0.01)
+        read(keys[2])
+
+        self.assertEqual(set(os.listdir(self.cache_dir)), {keys[0], keys[2]})
+
+        # blobs larger than the cache are not cached
+        self.assertEqual(server_read_cached_blob(keys[3], self.store.read, self.cache_dir, 50), blobs[3])
+        self.assertNotIn(keys[3], os.listdir(self.cache_dir))
+
+    def test_corrupted_blob(self):
+
+        key = sha256(b'expected').hexdigest()
+        self.assertRaises(ValueError, server_read_cached_blob, key, lambda key: b'corrupted', self.cache_dir, 1024)
+
+    def test_incomplete_store(self):
+
+        class WriteOnlyStore(blobstore.BlobStore):
+            def exists(self, key):
+                return False
+            def write(self, key, data):
+                pass
+
+        self.assertRaises(TypeError, WriteOnlyStore)
+
+    def test_local_store(self):
+
+        store = LocalBlobStore(threshold=16)
+        self.assertTrue(os.path.isdir(store.directory))
+        key = store.put(b'some bytes to keep')
+        self.assertEqual(store.read(key), b'some bytes to keep')
+        os.remove(os.path.join(store.directory, key))
+
+    def test_handler(self):
+
+        with FakeGateway() as gateway:
+            faas = FaasConnection(provider='127.0.0.1', port=gateway.port, user=None, ensure_available=False)
+            gateway.deploy('count-above', classic_function(build_handler_template(count_above, safe_server_unpack_args, safe_server_pack_args, hash(faas), blob_store=self.store)))
+            bodies = Bodies(gateway.functions['count-above'])
+            gateway.deploy('count-above', bodies)
+
+            count_above_in_faas = builder.sync_from_name_with_protocol('count_above', faas, protocol=1, blob_store=self.store)
+
+            values = list(range(5000))
+            for limit in [10, 100, 1000]:
+                self.assertEqual(count_above_in_faas(values, limit), count_above(values, limit))
+            # small calls are still sent as they are
+            self.assertEqual(count_above_in_faas([1, 2, 3], 1), 2)
+
+            self.assertEqual(self.store.writes, 1)
+            self.assertTrue(all(len(body) < 200 for body in bodies.bodies))
+            faas.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+from away.builder import __build_handler_template as build_handler_template
+from away.__fn_utils import __get_external_dependencies as get_external_dependencies
+from away.__fn_utils import __get_fn_source as get_fn_source
+from away.protocol import __safe_server_unpack_args as safe_server_unpack_args
+from away.protocol import __safe_server_pack_args as safe_server_pack_args
+from away.build_report import BuildReport, SizeLimits
+from away.exceptions import HandlerTooLargeError
+import warnings
+
+UNITS = {f'unit{i}': 10 ** (i % 7) for i in range(5000)}
+NAMES = [f'name{i}' for i in range(500)]
+ALSO_NAMES = NAMES
+GREETING = 'hello ' * 20
+SAME_GREETING = ''.join(['hello '] * 20)
+
+def to_grams(kilos):
+    return kilos * UNITS['unit3']
+
+def to_units(value, unit):
+    return value * UNITS[unit]
+
+def greet(i):
+    return GREETING + NAMES[i] + SAME_GREETING + ALSO_NAMES[i]
+
+def convert(kilos):
+    return to_grams(kilos) + len(UNITS)
+
+def run(fn, dependencies):
+    namespace = {}
+    exec('import yaml\n' + dependencies + '\n' + get_fn_source(fn), namespace)
+    return namespace[fn.__name__]
+
+import unittest
+class TestBuildReport(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore', SyntaxWarning)
+
+    def tearDown(self):
+        warnings.resetwarnings()
+
+    def test_report(self):
+
+        report = BuildReport()
+        sidecar = {}
+        handler = build_handler_template(greet, safe_server_unpack_args, safe_server_pack_args, 0, sidecar=sidecar, report=report)
+
+        self.assertEqual(report.fn_name, 'greet')
+        self.assertEqual(report.handler_size, len(handler.encode('utf-8')))
+        self.assertGreater(report.sidecar_size, 0)
+        self.assertEqual(report.total_size, report.handler_size + report.sidecar_size)
+
+        dependencies = {dependency.name: dependency for dependency in report.dependencies}
+        self.assertEqual(set(dependencies), {'GREETING', 'NAMES', 'SAME_GREETING', 'ALSO_NAMES'})
+        self.assertTrue(all(dependency.referenced_by == 'greet' for dependency in report.dependencies))
+        self.assertEqual(dependencies['NAMES'].storage, 'sidecar')
+        self.assertEqual(dependencies['GREETING'].storage, 'inline')
+        # values in the sidecar are not defined in the handler, they are loaded when they are first used
+        self.assertEqual(dependencies['NAMES'].size, len(sidecar['NAMES']))
+        self.assertIn('NAMES', str(report))
+
+    def test_duplicates(self):
+
+        report = BuildReport()
+        sidecar = {}
+        dependencies = get_external_dependencies(greet, 0, sidecar=sidecar, report=report)
+
+        # the same list and equal strings are defined once
+        self.assertIn('ALSO_NAMES = NAMES\n', dependencies)
+        self.assertIn('SAME_GREETING = GREETING\n', dependencies)
+        self.assertEqual(set(sidecar), {'NAMES'})
+        self.assertEqual([dependency.alias_of for dependency in report.dependencies if dependency.storage == 'alias'], ['GREETING', 'NAMES'])
+        self.assertEqual(run(greet, get_external_dependencies(greet, 0))(3), greet(3))
+
+    def test_constant_keys(self):
+
+        report = BuildReport()
+        dependencies = get_external_dependencies(to_grams, 0, report=report)
+
+        # only the keys the function reads are kept
+        self.assertIn("UNITS = {'unit3': 1000}", dependencies)
+        self.assertEqual(report.dependencies[0].kept_keys, (1, len(UNITS)))
+        self.assertEqual(run(to_grams, dependencies)(2), 2000)
+
+        # any other use keeps the whole dictionary, including in the functions it captures
+        for fn in [to_units, convert]:
+            report = BuildReport()
+            get_external_dependencies(fn, 0, report=report)
+            self.assertEqual([dependency.kept_keys for dependency in report.dependencies if dependency.name == 'UNITS'], [None])
+
+        # unless disabled
+        report = BuildReport()
+        dependencies = get_external_dependencies(to_grams, 0, report=report, prune_keys=False)
+        self.assertEqual(report.dependencies[0].kept_keys, None)
+        self.assertEqual(len(run(to_grams, dependencies).__globals__['UNITS']), len(UNITS))
+
+    def test_size_limits(self):
+
+        build = lambda size_limits: build_handler_template(greet, safe_server_unpack_args, safe_server_pack_args, 0, size_limits=size_limits)
+
+        self.assertRaises(HandlerTooLargeError, build, SizeLimits(fail_dependency_size=128))
+        self.assertRaises(HandlerTooLargeError, build, SizeLimits(fail_handler_size=1024))
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            build(SizeLimits(warn_dependency_size=128, warn_handler_size=None))
+        self.assertTrue(any('NAMES' in str(warning.message) for warning in caught))
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            build(SizeLimits())
+        self.assertFalse(any('above' in str(warning.message) for warning in caught))
+
+if __name__ == '__main__':
+    unittest.main()
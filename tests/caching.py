@@ -0,0 +1,235 @@
+from away import FaasConnection, builder
+from away.cache import ResultCache, SQLiteResultCache, DeploymentFingerprint
+from fake_gateway import FakeGateway, DescribingGateway
+from time import sleep
+from multiprocessing import Pool
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import tempfile
+import os
+import yaml
+
+def fill_cache(path, worker):
+    cache = SQLiteResultCache(path)
+    for i in range(50):
+        cache.put(f'{worker}-{i}', str(i))
+    return [cache.get(f'{other}-{i}') for other in range(4) for i in range(50)].count(None)
+
+import unittest
+class TestResultCache(unittest.TestCase):
+
+    def test_lru_bounded_by_bytes(self):
+
+        cache = ResultCache(max_bytes=25)
+        cache.put('a', '1' * 9)
+        cache.put('b', '2' * 9)
+        cache.get('a')
+        cache.put('c', '3' * 9)
+
+        self.assertEqual(cache.get('a'), '1' * 9)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), '3' * 9)
+        self.assertLessEqual(cache.size, 25)
+
+    def test_ttl(self):
+
+        cache = ResultCache(ttl=0.05)
+        cache.put('a', '1')
+        cache.put('b', '2', ttl=10)
+        sleep(0.1)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), '2')
+
+    def test_counters_and_invalidation(self):
+
+        cache = ResultCache()
+        cache.put('a', '1')
+        cache.put('b', '2')
+        cache.get('a')
+        cache.get('c')
+
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'entries': 2, 'size': 4})
+
+        cache.invalidate('a')
+        self.assertIsNone(cache.get('a'))
+        cache.invalidate()
+        self.assertEqual(len(cache), 0)
+
+class TestSQLiteResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'results.db')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_persists(self):
+
+        cache = SQLiteResultCache(self.path)
+        cache.put('a', '1')
+        cache.close()
+
+        self.assertEqual(SQLiteResultCache(self.path).get('a'), '1')
+
+    def test_evicts_by_size_and_age(self):
+
+        cache = SQLiteResultCache(self.path, max_bytes=25)
+        cache.put('a', '1' * 9)
+        sleep(0.01)
+        cache.put('b', '2' * 9)
+        cache.get('a')
+        sleep(0.01)
+        cache.put('c', '3' * 9)
+
+        self.assertEqual(cache.get('a'), '1' * 9)
+        self.assertIsNone(cache.get('b'))
+        self.assertLessEqual(cache.stats()['size'], 25)
+
+        cache.put('d', '4', ttl=0.01)
+        sleep(0.05)
+        self.assertIsNone(cache.get('d'))
+
+    def test_shared_between_processes(self):
+
+        with Pool(4) as pool:
+            pool.starmap(fill_cache, [(self.path, worker) for worker in range(4)])
+
+        cache = SQLiteResultCache(self.path)
+        self.assertEqual(cache.stats()['entries'], 200)
+        self.assertEqual(cache.get('3-49'), '49')
+
+class TestCachedProxies(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.gateway = DescribingGateway().__enter__()
+        self.gateway.deploy('square', lambda body, headers: (200, yaml.safe_dump(yaml.safe_load(body)[0] ** 2)))
+        self.faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False)
+
+    async def asyncTearDown(self):
+        await self.faas.aclose()
+
+    def tearDown(self):
+        self.gateway.__exit__()
+
+    async def test_sync_hits(self):
+
+        square = builder.sync_from_name_with_protocol('square', self.faas, cache=True)
+
+        self.assertEqual([square(2), square(2), square(3)], [4, 4, 9])
+        self.assertEqual(self.gateway.requests, 2)
+        self.assertEqual(square.cache.stats()['hits'], 1)
+
+        square.invalidate(2)
+        square(2)
+        self.assertEqual(self.gateway.requests, 3)
+
+    async def test_async_hits(self):
+
+        @builder.faas_function_with_protocol(self.faas, cache=True)
+        async def square(n):
+            pass
+
+        self.assertEqual([await square(2), await square(2)], [4, 4])
+        self.assertEqual(self.gateway.requests, 1)
+
+    async def test_shared_cache(self):
+
+        cache = ResultCache()
+        square = builder.sync_from_name_with_protocol('square', self.faas, cache=cache)
+        square_async = builder.async_from_name_with_protocol('square', self.faas, cache=cache)
+
+        square(5)
+        self.assertEqual(await square_async(5), 25)
+        self.assertEqual(self.gateway.requests, 1)
+
+    async def test_redeploy_invalidates(self):
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = SQLiteResultCache(os.path.join(cache_dir, 'results.db'))
+            self.faas.auth_address = f'admin:1234@{self.faas.address}'
+            self.gateway.descriptions['square'] = {'image': 'square:1', 'annotations': {'built-with': 'away'}}
+
+            square = builder.sync_from_name_with_protocol('square', self.faas, cache=cache)
+            square_async = builder.async_from_name_with_protocol('square', self.faas, cache=cache)
+            square(2)
+            self.assertEqual(await square_async(2), 4)
+            self.assertEqual(self.gateway.requests - self.gateway.fingerprint_requests, 1)
+
+            # a worker process starting after a redeploy
+            self.gateway.descriptions['square'] = {'image': 'square:2', 'annotations': {'built-with': 'away'}}
+            builder.sync_from_name_with_protocol('square', self.faas, cache=cache)(2)
+            self.assertEqual(self.gateway.requests - self.gateway.fingerprint_requests, 2)
+
+    async def test_async_invalidate(self):
+
+        square = builder.async_from_name_with_protocol('square', self.faas, cache=True)
+        await square(2)
+        await square.invalidate(2)
+        await square(2)
+
+        self.assertEqual(self.gateway.requests, 2)
+
+    async def test_unauthenticated_fingerprint(self):
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = SQLiteResultCache(os.path.join(cache_dir, 'results.db'))
+            square = builder.sync_from_name_with_protocol('square', self.faas, cache=cache)
+
+            with self.assertWarns(RuntimeWarning):
+                square(2)
+            self.assertEqual(square(2), 4)
+            self.assertEqual(cache.stats()['hits'], 1)
+            cache.close()
+
+    async def test_concurrent_fingerprints(self):
+
+        self.faas.auth_address = f'admin:1234@{self.faas.address}'
+        fetches = []
+
+        def get_function_fingerprint(name):
+            fetches.append(name)
+            sleep(0.1)
+            return 'square:1'
+
+        async def aget_function_fingerprint(name):
+            fetches.append(name)
+            await asyncio.sleep(0.1)
+            return 'square:1'
+
+        self.faas.get_function_fingerprint = get_function_fingerprint
+        self.faas.aget_function_fingerprint = aget_function_fingerprint
+
+        fingerprint = DeploymentFingerprint(self.faas, 'square')
+        with ThreadPoolExecutor(8) as pool:
+            self.assertEqual(set(pool.map(lambda _: fingerprint.get(), range(8))), {'square:1'})
+        self.assertEqual(len(fetches), 1)
+
+        fingerprint = DeploymentFingerprint(self.faas, 'square')
+        self.assertEqual(set(await asyncio.gather(*(fingerprint.aget() for _ in range(8)))), {'square:1'})
+        self.assertEqual(len(fetches), 2)
+
+    async def test_keyed_by_gateway(self):
+
+        with FakeGateway() as other_gateway:
+            other_gateway.deploy('square', lambda body, headers: (200, yaml.safe_dump(-yaml.safe_load(body)[0] ** 2)))
+            other_faas = FaasConnection(provider='127.0.0.1', port=other_gateway.port, user=None, ensure_available=False)
+
+            cache = ResultCache()
+            square = builder.sync_from_name_with_protocol('square', self.faas, cache=cache)
+            other_square = builder.sync_from_name_with_protocol('square', other_faas, cache=cache)
+
+            self.assertEqual([square(3), other_square(3)], [9, -9])
+
+    async def test_no_cache_by_default(self):
+
+        square = builder.sync_from_name_with_protocol('square', self.faas)
+        square(2)
+        square(2)
+
+        self.assertEqual(self.gateway.requests, 2)
+        self.assertFalse(hasattr(square, 'cache'))
+
+if __name__ == '__main__':
+    unittest.main()
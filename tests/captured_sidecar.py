@@ -0,0 +1,123 @@
+from away import FaasConnection, builder
+from away.builder import __build_handler_template as build_handler_template
+from away.protocol import CAPTURED_SIDECAR, CAPTURED_PICKLE_PROTOCOL
+from away.protocol import __safe_server_unpack_args as safe_server_unpack_args
+from away.protocol import __safe_server_pack_args as safe_server_pack_args
+from fake_templates import classic_function
+from fake_gateway import FakeGateway
+from collections import Counter
+import tempfile
+import warnings
+import pickle
+import shutil
+import os
+import re
+import yaml
+
+VOCABULARY = {f'word{i}': i for i in range(20000)}
+STOPWORDS = Counter({'the': 3, 'a': 2})
+LIMIT = 10
+
+ALSO_VOCABULARY = VOCABULARY
+
+def word_count(word):
+    return STOPWORDS[word]
+
+def lookup(kind, word):
+    if kind == 'count':
+        return word_count(word)
+    return ALSO_VOCABULARY[word] if VOCABULARY is ALSO_VOCABULARY else None
+
+def word_ids(text):
+    ids = []
+    vocabulary, stopwords = VOCABULARY, STOPWORDS
+    for word in re.split(' ', text):
+        if stopwords[word] < LIMIT:
+            ids.append(vocabulary[word])
+    return ids
+
+import unittest
+class TestCapturedSidecar(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        warnings.simplefilter('ignore', SyntaxWarning)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        warnings.resetwarnings()
+
+    def build(self, sidecar):
+        handler_source = build_handler_template(word_ids, safe_server_unpack_args, safe_server_pack_args, 0, sidecar=sidecar)
+        if sidecar is not None and len(sidecar) > 0:
+            with open(os.path.join(self.directory, CAPTURED_SIDECAR), 'wb') as captured:
+                pickle.dump(sidecar, captured, protocol=CAPTURED_PICKLE_PROTOCOL)
+        return handler_source
+
+    def test_sidecar(self):
+
+        sidecar = {}
+        handler_source = self.build(sidecar)
+
+        # non-literal values and large literals are in the sidecar, small literals and modules stay in the handler
+        self.assertEqual(set(sidecar), {'VOCABULARY', 'STOPWORDS'})
+        self.assertNotIn("STOPWORDS = ", handler_source)
+        self.assertIn("__server_load_lazily({'word_ids': {'VOCABULARY': 'VOCABULARY', 'STOPWORDS': 'STOPWORDS'}})", handler_source)
+        self.assertIn("re = __import__('importlib').import_module('re')", handler_source)
+        self.assertIn('LIMIT = 10', handler_source)
+        self.assertNotIn('Loader=yaml.Loader)', handler_source)
+
+    def test_handler(self):
+
+        inline_source = self.build(None)
+        sidecar_source = self.build({})
+        self.assertLess(len(sidecar_source), len(inline_source) / 10)
+
+        with FakeGateway() as gateway:
+            faas = FaasConnection(provider='127.0.0.1', port=gateway.port, user=None, ensure_available=False)
+            gateway.deploy('word-ids', classic_function(sidecar_source, directory=self.directory))
+            gateway.deploy('word-ids-inline', classic_function(inline_source))
+
+            for name in ['word_ids', 'word_ids_inline']:
+                word_ids_in_faas = builder.sync_from_name_with_protocol(name, faas)
+                self.assertEqual(word_ids_in_faas('word1 word3 word7'), [1, 3, 7])
+            faas.close()
+
+    def test_lazy(self):
+
+        sidecar = {}
+        handler_source = build_handler_template(lookup, safe_server_unpack_args, safe_server_pack_args, 0, sidecar=sidecar)
+        with open(os.path.join(self.directory, CAPTURED_SIDECAR), 'wb') as captured:
+            pickle.dump(sidecar, captured, protocol=CAPTURED_PICKLE_PROTOCOL)
+
+        # the values in the sidecar are defined by the first call of a function that uses them
+        handler = {'__file__': os.path.join(self.directory, 'handler.py'), '__name__': 'handler'}
+        exec(handler_source, handler)
+        self.assertFalse({'VOCABULARY', 'ALSO_VOCABULARY', 'STOPWORDS'} & set(handler))
+
+        # aliases are the same object in the handler
+        self.assertEqual(yaml.safe_load(handler['handle'](yaml.safe_dump(['id', 'word3']))), 3)
+        self.assertIs(handler['VOCABULARY'], handler['ALSO_VOCABULARY'])
+        self.assertNotIn('STOPWORDS', handler)
+
+        self.assertEqual(yaml.safe_load(handler['handle'](yaml.safe_dump(['count', 'the']))), 3)
+        self.assertIn('STOPWORDS', handler)
+        # the functions are put back after their first call
+        self.assertEqual(handler['word_count'].__code__.co_name, 'word_count')
+
+    def test_unpicklable(self):
+
+        lock = __import__('threading').Lock()
+        def uses_lock():
+            return lock.locked()
+
+        # values that cannot be pickled are written inline, as before
+        sidecar = {}
+        try:
+            build_handler_template(uses_lock, safe_server_unpack_args, safe_server_pack_args, 0, sidecar=sidecar)
+        except Exception:
+            pass
+        self.assertEqual(sidecar, {})
+
+if __name__ == '__main__':
+    unittest.main()
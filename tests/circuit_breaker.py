@@ -0,0 +1,194 @@
+from away import FaasConnection, builder
+from away.circuit_breaker import CircuitBreaker
+from away.exceptions import FaasCircuitOpenError, FaasReturnedError, FaasFunctionTimedOutError
+from fake_gateway import FakeGateway
+from time import sleep
+import asyncio
+
+class Switch():
+
+    def __init__(self):
+        self.healthy = False
+        self.calls = 0
+
+    def __call__(self, body, headers):
+        self.calls += 1
+        if self.healthy:
+            return 200, body
+        return 503, 'unavailable'
+
+import unittest
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_opens_on_error_rate(self):
+
+        breaker = CircuitBreaker(error_rate_threshold=0.5, min_calls=4)
+        for success in (True, False, True):
+            self.assertTrue(breaker.allow())
+            breaker.record(success, 0.01)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+        breaker.record(False, 0.01)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_opens_on_slow_calls(self):
+
+        breaker = CircuitBreaker(slow_call_duration=0.1, slow_call_rate_threshold=0.5, min_calls=2)
+        breaker.record(True, 0.5)
+        breaker.record(True, 0.5)
+
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_half_open(self):
+
+        breaker = CircuitBreaker(min_calls=1, open_duration=0.05)
+        breaker.record(False, 0.01)
+        self.assertFalse(breaker.allow())
+
+        sleep(0.06)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow()) # a single probe at a time
+
+        breaker.record(False, 0.01)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record(True, 0.01)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_release(self):
+
+        breaker = CircuitBreaker(min_calls=1, open_duration=0.01)
+        breaker.record(False, 0.01)
+        sleep(0.02)
+
+        # a probe released without an outcome lets the next one through
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.release()
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+
+    def test_window(self):
+
+        breaker = CircuitBreaker(min_calls=2, window=0.05)
+        breaker.record(False, 0.01)
+        sleep(0.06)
+        breaker.record(True, 0.01)
+        breaker.record(True, 0.01)
+
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+class TestProxyCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.gateway = FakeGateway().__enter__()
+        self.switch = Switch()
+        self.gateway.deploy('flaky', self.switch)
+        self.faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False)
+
+    def tearDown(self):
+        self.faas.close()
+        self.gateway.__exit__()
+
+    def test_fails_fast(self):
+
+        flaky = builder.sync_from_name('flaky', self.faas, circuit_breaker={'min_calls': 3})
+        for _ in range(3):
+            with self.assertRaises(FaasReturnedError):
+                flaky(1)
+
+        with self.assertRaises(FaasCircuitOpenError):
+            flaky(1)
+        self.assertEqual(self.switch.calls, 3)
+
+    def test_fallback_and_recovery(self):
+
+        flaky = builder.sync_from_name('flaky', self.faas,
+            circuit_breaker={'min_calls': 2, 'open_duration': 0.05},
+            fallback=lambda n: 'fallback'
+        )
+        for _ in range(2):
+            with self.assertRaises(FaasReturnedError):
+                flaky(1)
+
+        self.assertEqual(flaky(1), 'fallback')
+        self.assertEqual(self.switch.calls, 2)
+
+        self.switch.healthy = True
+        sleep(0.06)
+        self.assertEqual(flaky(1), '1')
+        self.assertEqual(flaky.circuit_breaker.state, CircuitBreaker.CLOSED)
+
+    def test_shared_between_proxies(self):
+
+        first = builder.sync_from_name('flaky', self.faas, circuit_breaker={'min_calls': 1})
+        second = builder.sync_from_name('flaky', self.faas, circuit_breaker=True)
+
+        self.assertIs(first.circuit_breaker, second.circuit_breaker)
+        with self.assertRaises(FaasReturnedError):
+            first(1)
+        with self.assertRaises(FaasCircuitOpenError):
+            second(1)
+
+    def test_timeouts(self):
+
+        self.gateway.deploy('slow', lambda body, headers: (sleep(0.2), (200, body))[1])
+
+        # the end of the caller's deadline is not a failure of the function
+        slow = builder.sync_from_name('slow', self.faas, circuit_breaker={'min_calls': 1}, deadline=0.05)
+        self.assertRaises(FaasFunctionTimedOutError, slow, 1)
+        self.assertEqual(slow.circuit_breaker.state, CircuitBreaker.CLOSED)
+
+        # the request's own timeout is
+        slow = builder.sync_from_name('slow', self.faas, circuit_breaker={'min_calls': 1}, timeout=0.05)
+        self.assertRaises(FaasFunctionTimedOutError, slow, 1)
+        self.assertEqual(slow.circuit_breaker.state, CircuitBreaker.OPEN)
+
+class TestAsyncCircuitBreaker(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.gateway = FakeGateway().__enter__()
+        self.switch = Switch()
+        self.gateway.deploy('flaky', self.switch)
+        self.faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False)
+
+    async def asyncTearDown(self):
+        await self.faas.aclose()
+
+    def tearDown(self):
+        self.gateway.__exit__()
+
+    async def test_fallback(self):
+
+        async def fallback(n):
+            return 'fallback'
+
+        @builder.faas_function(self.faas, circuit_breaker={'min_calls': 1}, fallback=fallback)
+        async def flaky(n):
+            pass
+
+        with self.assertRaises(FaasReturnedError):
+            await flaky(1)
+
+        self.assertEqual(await flaky(1), 'fallback')
+        self.assertEqual(self.switch.calls, 1)
+
+    async def test_cancelled(self):
+
+        self.gateway.deploy('slow', lambda body, headers: (sleep(0.2), (200, body))[1])
+        slow = builder.async_from_name('slow', self.faas, circuit_breaker={'min_calls': 1})
+
+        call = asyncio.ensure_future(slow(1))
+        await asyncio.sleep(0.05)
+        call.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await call
+
+        self.assertEqual(slow.circuit_breaker.state, CircuitBreaker.CLOSED)
+
+if __name__ == '__main__':
+    unittest.main()
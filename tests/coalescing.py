@@ -0,0 +1,79 @@
+from away import FaasConnection, builder
+from fake_gateway import FakeGateway
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+import asyncio
+import yaml
+
+def slow_square(body, headers):
+    sleep(0.2)
+    return 200, yaml.safe_dump(yaml.safe_load(body)[0] ** 2)
+
+import unittest
+class TestCoalescing(unittest.TestCase):
+
+    def setUp(self):
+        self.gateway = FakeGateway().__enter__()
+        self.gateway.deploy('square', slow_square)
+        self.faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False)
+
+    def tearDown(self):
+        self.gateway.__exit__()
+
+    def test_coalesces(self):
+
+        square = builder.sync_from_name_with_protocol('square', self.faas, coalesce=True)
+
+        with ThreadPoolExecutor(16) as pool:
+            res = list(pool.map(square, [3] * 16 + [4] * 16))
+
+        self.assertEqual(res, [9] * 16 + [16] * 16)
+        self.assertLessEqual(self.gateway.requests, 4)
+
+        # once finished, calls go to the gateway again
+        requests_before = self.gateway.requests
+        square(3)
+        self.assertEqual(self.gateway.requests, requests_before + 1)
+
+class TestAsyncCoalescing(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.gateway = FakeGateway().__enter__()
+        self.gateway.deploy('square', slow_square)
+        self.faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False)
+
+    async def asyncTearDown(self):
+        await self.faas.aclose()
+
+    def tearDown(self):
+        self.gateway.__exit__()
+
+    async def test_async_coalesces(self):
+
+        square = builder.async_from_name_with_protocol('square', self.faas, coalesce=True)
+
+        res = await asyncio.gather(*[square(3) for _ in range(50)], *[square(4) for _ in range(50)])
+
+        self.assertEqual(res, [9] * 50 + [16] * 50)
+        self.assertEqual(self.gateway.requests, 2)
+
+    async def test_cancelled_caller_does_not_cancel_others(self):
+
+        square = builder.async_from_name_with_protocol('square', self.faas, coalesce=True)
+
+        first = asyncio.ensure_future(square(5))
+        second = asyncio.ensure_future(square(5))
+        await asyncio.sleep(0.05)
+        first.cancel()
+
+        self.assertEqual(await second, 25)
+
+    async def test_not_coalesced_by_default(self):
+
+        square = builder.async_from_name_with_protocol('square', self.faas)
+
+        await asyncio.gather(*[square(3) for _ in range(5)])
+        self.assertEqual(self.gateway.requests, 5)
+
+if __name__ == '__main__':
+    unittest.main()
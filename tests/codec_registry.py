@@ -0,0 +1,120 @@
+from away import FaasConnection, builder, protocol
+from away.builder import __build_handler_template as build_handler_template
+from away.protocol import Codec, register_codec, get_codec, get_protocol_codec, CODECS, YAML_CODEC, MSGPACK_CODEC
+from away.protocol import make_client_pack_args_fn, make_client_unpack_args_fn
+from away.protocol import __safe_server_unpack_args as safe_server_unpack_args
+from away.protocol import __safe_server_pack_args as safe_server_pack_args
+from fake_templates import classic_function
+from fake_gateway import DescribingGateway
+import yaml
+import json
+
+def echo(value):
+    return value
+
+ARGS = (1, 'ñé', [1.5, None, True], {'a': {'b': [1, 2]}}, b'\x00\xff', 2**70, 'x' * 200 + ' y' * 100)
+
+import unittest
+class TestYamlCodec(unittest.TestCase):
+
+    @unittest.skipIf(not yaml.__with_libyaml__, 'pyyaml was built without libyaml')
+    def test_uses_libyaml(self):
+
+        self.assertIs(protocol.YAML_SAFE_DUMPER, yaml.CSafeDumper)
+        self.assertIs(protocol.YAML_DUMPER, yaml.CDumper)
+
+    def test_same_wire_format(self):
+
+        # payloads are read the same by libyaml and by the pure python parser, in both directions
+        for safe_args in [True, False]:
+            pack = make_client_pack_args_fn(safe_args)
+            unpack = make_client_unpack_args_fn(safe_args)
+
+            self.assertEqual(yaml.load(pack(list(ARGS)), Loader=yaml.SafeLoader if safe_args else yaml.Loader), list(ARGS))
+            self.assertEqual(unpack(yaml.safe_dump(list(ARGS))), list(ARGS))
+
+        server_side_args, _ = safe_server_unpack_args(yaml.safe_dump(list(ARGS)))
+        self.assertEqual(yaml.safe_load(safe_server_pack_args(server_side_args)), list(ARGS))
+
+class TestCodecRegistry(unittest.TestCase):
+
+    def tearDown(self):
+        CODECS.pop('json/1', None)
+        CODECS.pop('json/2', None)
+
+    def test_get_codec(self):
+
+        self.assertIs(get_codec('yaml'), YAML_CODEC)
+        self.assertIs(get_codec('msgpack', 1), MSGPACK_CODEC)
+        self.assertIs(get_codec('msgpack/1'), MSGPACK_CODEC)
+
+        self.assertIs(get_protocol_codec(1), YAML_CODEC)
+        self.assertIs(get_protocol_codec(2), MSGPACK_CODEC)
+        self.assertIs(get_protocol_codec('yaml/1'), YAML_CODEC)
+
+        self.assertRaises(AssertionError, get_codec, 'json')
+        self.assertRaises(AssertionError, get_codec, 'yaml', 2)
+        self.assertRaises(AssertionError, get_protocol_codec, 3)
+
+    def test_register(self):
+
+        json_v1 = register_codec(Codec('json', 1, lambda safe_args: json.dumps, lambda safe_args: json.loads))
+        json_v2 = register_codec(Codec('json', 2, lambda safe_args: json.dumps, lambda safe_args: json.loads))
+
+        # the latest version, unless given
+        self.assertIs(get_codec('json'), json_v2)
+        self.assertIs(get_codec('json/1'), json_v1)
+
+        self.assertRaises(AssertionError, register_codec, Codec('json', 1, None, None))
+        self.assertRaises(AssertionError, Codec, 'json/1', 1, None, None)
+
+class TestCodecResolution(unittest.TestCase):
+
+    def setUp(self):
+        self.gateway = DescribingGateway().__enter__()
+        self.faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False)
+        self.faas.auth_address = self.faas.address
+
+    def tearDown(self):
+        CODECS.pop('json/1', None)
+        self.faas.close()
+        self.gateway.__exit__()
+
+    def test_from_annotations(self):
+
+        register_codec(Codec('json', 1, lambda safe_args: json.dumps, lambda safe_args: json.loads))
+
+        bodies = []
+        def json_echo(body, headers):
+            bodies.append(body)
+            return 200, json.dumps(json.loads(body)[0])
+
+        self.gateway.deploy('json-echo', json_echo)
+        self.gateway.descriptions['json-echo'] = {'annotations': {'away-codec': 'json/1'}}
+
+        json_echo_in_faas = builder.sync_from_name_with_protocol('json_echo', self.faas)
+        self.assertEqual(json_echo_in_faas({'a': [1, 2]}), {'a': [1, 2]})
+        self.assertEqual(json_echo_in_faas('b'), 'b')
+        self.assertEqual(bodies, ['[{"a": [1, 2]}]', '["b"]'])
+        # the annotations are only read once, for both packing and unpacking
+        self.assertEqual(self.gateway.fingerprint_requests, 1)
+
+    def test_protocol_annotation(self):
+
+        # functions built before codecs were recorded use the codec of their protocol version
+        self.gateway.deploy('echo', classic_function(build_handler_template(echo, safe_server_unpack_args, safe_server_pack_args, hash(self.faas))))
+        self.gateway.descriptions['echo'] = {'annotations': {'built-with': 'away', 'away-protocol': '1'}}
+
+        self.assertEqual(self.faas.get_function_codec('echo'), 'yaml/1')
+        self.assertEqual(builder.sync_from_name_with_protocol('echo', self.faas)([1, 2]), [1, 2])
+
+    def test_given_codec(self):
+
+        self.gateway.deploy('echo', classic_function(build_handler_template(echo, safe_server_unpack_args, safe_server_pack_args, hash(self.faas))))
+
+        echo_in_faas = builder.sync_from_name_with_protocol('echo', self.faas, protocol='yaml/1')
+        self.assertEqual(echo_in_faas((1, 2)), [1, 2])
+        self.assertEqual(self.gateway.fingerprint_requests, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+from away import FaasConnection, builder
+from away.builder import __build_handler_template as build_handler_template
+from away.protocol import __safe_server_unpack_args as safe_server_unpack_args
+from away.protocol import __safe_server_pack_args as safe_server_pack_args
+from away.protocol import __safe_server_unpack_batch_args as safe_server_unpack_batch_args
+from away.compression import CompressionPolicy, CODECS, CONTENT_ENCODING_HEADER
+from away.protocol import make_client_pack_args_fn
+from away.compression import __server_decode_payload as server_decode_payload
+from away.compression import __server_encode_payload as server_encode_payload
+from fake_templates import classic_function
+from fake_gateway import FakeGateway
+import os
+from base64 import b85encode
+
+def echo(values):
+    return values
+
+def add_one(n):
+    return n + 1
+
+class Sizes():
+    """
+    Records the size of the requests and responses of a function
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.requests = []
+        self.responses = []
+
+    def __call__(self, body, headers):
+        status, res = self.fn(body, headers)
+        self.requests.append((len(body), headers.get(CONTENT_ENCODING_HEADER)))
+        self.responses.append(len(res))
+        return status, res
+
+import unittest
+class TestCompressionPolicy(unittest.TestCase):
+
+    def tearDown(self):
+        for k in ['Http_X_Away_Content_Encoding', 'Http_X_Away_Accept_Encoding', 'Http_X_Away_Compression_Threshold']:
+            os.environ.pop(k, None)
+
+    def test_round_trip(self):
+
+        payload = '- ' + '\n- '.join(str(i % 10) for i in range(10000)) + '\n'
+        for encoding in CODECS:
+            policy = CompressionPolicy(encoding=encoding)
+            body, headers = policy.encode_request(payload)
+
+            self.assertEqual(headers[CONTENT_ENCODING_HEADER], encoding)
+            self.assertLess(len(body), len(payload) / 10)
+
+            os.environ['Http_X_Away_Content_Encoding'] = encoding
+            self.assertEqual(server_decode_payload(body), payload)
+
+    def test_below_threshold(self):
+
+        policy = CompressionPolicy(threshold=1024)
+        body, headers = policy.encode_request('- 1\n- 2\n')
+
+        self.assertEqual(body, '- 1\n- 2\n')
+        self.assertNotIn(CONTENT_ENCODING_HEADER, headers)
+
+    def test_incompressible(self):
+
+        payload = b85encode(os.urandom(4096)).decode()
+        body, headers = CompressionPolicy().encode_request(payload)
+
+        self.assertEqual(body, payload)
+        self.assertNotIn(CONTENT_ENCODING_HEADER, headers)
+
+    def test_server_negotiation(self):
+
+        payload = 'a' * 4096
+
+        # callers that do not accept compressed responses get them as-is
+        self.assertEqual(server_encode_payload(payload), payload)
+
+        os.environ['Http_X_Away_Accept_Encoding'] = 'brotli, gzip'
+        encoded = server_encode_payload(payload)
+        self.assertTrue(encoded.startswith('%away-encoding gzip\n'))
+        self.assertEqual(CompressionPolicy.decode_response(encoded + '\n'), payload)
+
+        os.environ['Http_X_Away_Compression_Threshold'] = '8192'
+        self.assertEqual(server_encode_payload(payload), payload)
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.gateway = FakeGateway().__enter__()
+        self.faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False)
+
+        self.gateway.deploy('echo', classic_function(build_handler_template(echo, safe_server_unpack_args, safe_server_pack_args, hash(self.faas))))
+        self.gateway.deploy('add-one', classic_function(build_handler_template(add_one, safe_server_unpack_batch_args, safe_server_pack_args, hash(self.faas), batch=True)))
+        self.echo = Sizes(self.gateway.functions['echo'])
+        self.gateway.deploy('echo', self.echo)
+
+    def tearDown(self):
+        self.faas.close()
+        self.gateway.__exit__()
+
+    def test_large_payloads(self):
+
+        echo_in_faas = builder.sync_from_name_with_protocol('echo', self.faas, compression=True)
+
+        values = [i % 100 for i in range(20000)]
+        self.assertEqual(echo_in_faas(values), values)
+
+        uncompressed = len(make_client_pack_args_fn()([values]))
+        (request_size, encoding), = self.echo.requests
+        self.assertEqual(encoding, 'gzip')
+        self.assertLess(request_size, uncompressed / 5)
+        self.assertLess(self.echo.responses[0], uncompressed / 5)
+
+    def test_small_payloads(self):
+
+        echo_in_faas = builder.sync_from_name_with_protocol('echo', self.faas, compression=True)
+
+        self.assertEqual(echo_in_faas([1, 2, 3]), [1, 2, 3])
+        self.assertEqual(self.echo.requests, [(len('- - 1\n  - 2\n  - 3\n'), None)])
+
+    def test_without_compression(self):
+
+        echo_in_faas = builder.sync_from_name_with_protocol('echo', self.faas)
+
+        values = list(range(5000))
+        self.assertEqual(echo_in_faas(values), values)
+        self.assertIsNone(self.echo.requests[0][1])
+        self.assertGreater(self.echo.responses[0], 5000)
+
+    def test_batch(self):
+
+        add_one_in_faas = builder.sync_from_name_with_protocol('add_one', self.faas, batch=True, compression=CompressionPolicy(threshold=64))
+
+        self.assertEqual(add_one_in_faas.batch([(i,) for i in range(1000)]), list(range(1, 1001)))
+
+    def test_async(self):
+
+        import asyncio
+        echo_in_faas = builder.async_from_name_with_protocol('echo', self.faas, compression='gzip')
+
+        async def call(values):
+            try:
+                return await echo_in_faas(values)
+            finally:
+                await self.faas.aclose()
+
+        values = [{'key': i % 7} for i in range(5000)]
+        self.assertEqual(asyncio.run(call(values)), values)
+        self.assertEqual(self.echo.requests[0][1], 'gzip')
+
+if __name__ == '__main__':
+    unittest.main()
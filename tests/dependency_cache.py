@@ -0,0 +1,129 @@
+from away.__fn_utils import __get_external_dependencies as get_external_dependencies
+from away.__fn_utils import __clear_code_cache as clear_code_cache
+from away.__fn_utils import __get_closure_vars as get_closure_vars
+from away.protocol import __is_repr_literal as is_repr_literal
+from collections import Counter
+from unittest import mock
+import datetime
+import inspect
+import math
+
+SCALE = 2
+OFFSETS = [1, 2, 3]
+
+def offset(x):
+    return x + OFFSETS[0]
+
+def scaled(values):
+    return [offset(v) * SCALE for v in values]
+
+def scaled_sum(values):
+    return sum(scaled(values))
+
+def offset_twice(x):
+    return offset(offset(x))
+
+def first_offset(values):
+    # captures `OFFSETS` before `scaled` does
+    return [OFFSETS[0]] + scaled(values)
+
+import unittest
+class TestDependencyCache(unittest.TestCase):
+
+    def setUp(self):
+        clear_code_cache()
+
+    def test_literal_classifier(self):
+
+        for literal in [1, -0.5, 'text', b'bytes', None, True, [1, (2, {'a': {3}})], set(), frozenset({1}), 2 + 1j]:
+            self.assertTrue(is_repr_literal(literal), literal)
+
+        recursive = []
+        recursive.append(recursive)
+        for not_literal in [math.inf, [math.nan], Counter(a=1), datetime.date(2024, 1, 1), [datetime.date(2024, 1, 1)], recursive, print]:
+            self.assertFalse(is_repr_literal(not_literal), not_literal)
+
+    def test_nested_code(self):
+
+        # names only used in comprehensions are dependencies too
+        dependencies = get_external_dependencies(scaled, 0)
+        self.assertIn('SCALE = 2', dependencies)
+        self.assertIn('def offset(x):', dependencies)
+        self.assertIn('OFFSETS = [1, 2, 3]', dependencies)
+
+    def test_reused_across_functions(self):
+
+        with mock.patch('inspect.getsource', wraps=inspect.getsource) as getsource:
+            first = get_external_dependencies(scaled_sum, 0)
+            calls = getsource.call_count
+            self.assertEqual(get_external_dependencies(scaled_sum, 0), first)
+            # functions that share helpers do not read their source again
+            get_external_dependencies(scaled, 0)
+            self.assertEqual(getsource.call_count, calls)
+
+    def test_rebound_globals(self):
+
+        global SCALE
+        get_external_dependencies(scaled, 0)
+        try:
+            SCALE = 3
+            OFFSETS.append(4)
+            dependencies = get_external_dependencies(scaled, 0)
+        finally:
+            SCALE = 2
+            OFFSETS.pop()
+
+        self.assertIn('SCALE = 3', dependencies)
+        self.assertIn('OFFSETS = [1, 2, 3, 4]', dependencies)
+
+    def test_reused_walks(self):
+
+        get_external_dependencies(scaled_sum, 0)
+        with mock.patch('away.__fn_utils.__get_closure_vars', wraps=get_closure_vars) as closure_vars:
+            # the walks from the helpers are reused, only the functions published are walked again
+            dependencies = get_external_dependencies(offset_twice, 0)
+            self.assertEqual([call.args[0] for call in closure_vars.call_args_list], [offset_twice])
+
+        clear_code_cache()
+        self.assertEqual(get_external_dependencies(offset_twice, 0), dependencies)
+
+    def test_walks_in_context(self):
+
+        # each function is expanded as it is without cached walks, whatever was published before it
+        functions = [scaled_sum, first_offset, offset_twice, scaled, offset]
+        expected = []
+        for fn in functions:
+            clear_code_cache()
+            expected.append(get_external_dependencies(fn, 0))
+
+        clear_code_cache()
+        for _ in range(2):
+            self.assertEqual([get_external_dependencies(fn, 0) for fn in functions], expected)
+
+    def test_rebound_functions(self):
+
+        global offset
+        get_external_dependencies(scaled_sum, 0)
+        original = offset
+        try:
+            offset = lambda x: x - SCALE
+            dependencies = get_external_dependencies(scaled_sum, 0)
+        finally:
+            offset = original
+
+        self.assertIn('offset = lambda x: x - SCALE', dependencies)
+        self.assertNotIn('OFFSETS', dependencies)
+
+    def test_empty_cell(self):
+
+        def expand(fn):
+            self.assertRaises(Exception, get_external_dependencies, fn, 0, from_deco=True)
+            return fn
+
+        # decorated recursive functions are expanded before their own cell is set
+        @expand
+        def fibb(n):
+            return n if n < 2 else fibb(n - 1) + fibb(n - 2)
+
+if __name__ == '__main__':
+    unittest.main()
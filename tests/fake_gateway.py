@@ -0,0 +1,138 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import threading
+import json
+
+class FakeGateway():
+    """
+    A minimal, local stand-in for an OpenFaaS gateway. Functions are plain python callables
+    taking the request body and headers and returning `(status_code, body)`. Bodies that are not
+    strings or bytes are iterables, streamed one chunk per item
+
+    Fakes of specific gateway features extend it, overriding `on_request`, `route` or `after_response`
+    """
+
+    def __init__(self):
+        self.functions = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                gateway.on_request(self)
+                status, res = gateway.route(self.path, gateway.read_body(self), self.headers)
+
+                try:
+                    if isinstance(res, (str, bytes)):
+                        res = res.encode() if isinstance(res, str) else res
+                        self.send_response(status)
+                        self.send_header('Content-Length', str(len(res)))
+                        self.end_headers()
+                        self.wfile.write(res)
+                    else:
+                        self.send_response(status)
+                        self.send_header('Transfer-Encoding', 'chunked')
+                        self.end_headers()
+                        for chunk in res:
+                            chunk = chunk.encode() if isinstance(chunk, str) else chunk
+                            self.wfile.write(f'{len(chunk):x}\r\n'.encode() + chunk + b'\r\n')
+                            self.wfile.flush()
+                        self.wfile.write(b'0\r\n\r\n')
+                except (BrokenPipeError, ConnectionResetError):
+                    # the client gave up on the request, e.g. a cancelled hedge
+                    self.close_connection = True
+                    return
+
+                gateway.after_response(self)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def deploy(self, name: str, fn):
+        self.functions[name] = fn
+
+    def on_request(self, request: BaseHTTPRequestHandler):
+        with self.lock:
+            self.requests += 1
+
+    @staticmethod
+    def read_body(request: BaseHTTPRequestHandler) -> str:
+        if request.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(request.rfile.readline().strip(), 16)
+                if size == 0:
+                    request.rfile.readline()
+                    break
+                chunks.append(request.rfile.read(size))
+                request.rfile.readline()
+            return b''.join(chunks).decode()
+
+        length = int(request.headers.get('Content-Length', 0))
+        return request.rfile.read(length).decode() if length > 0 else ''
+
+    def route(self, path: str, body: str, headers) -> tuple:
+        if path == '/healthz':
+            return 200, 'OK'
+        if path.startswith('/function/') and path[len('/function/'):] in self.functions:
+            return self.functions[path[len('/function/'):]](body, headers)
+        return 404, 'Not found'
+
+    def after_response(self, request: BaseHTTPRequestHandler):
+        pass
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+class TrackingGateway(FakeGateway):
+    """
+    A `FakeGateway` that keeps track of the client connections it has accepted, to check pooling behaviour.
+    Without `keep_alive`, it drops every connection after answering, without announcing it, like an idle timeout would
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.connections = set()
+        self.keep_alive = True
+
+    def on_request(self, request: BaseHTTPRequestHandler):
+        super().on_request(request)
+        with self.lock:
+            self.connections.add(request.client_address)
+
+    def after_response(self, request: BaseHTTPRequestHandler):
+        if not self.keep_alive: request.close_connection = True
+
+class DescribingGateway(FakeGateway):
+    """
+    A `FakeGateway` that describes functions at `/system/function/<name>`, with their entry in `descriptions`,
+    and counts the requests for descriptions in `fingerprint_requests`
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.descriptions = {}
+        self.fingerprint_requests = 0
+
+    def route(self, path: str, body: str, headers) -> tuple:
+        if not path.startswith('/system/function/'):
+            return super().route(path, body, headers)
+
+        name = path[len('/system/function/'):].split('?')[0]
+        with self.lock:
+            self.fingerprint_requests += 1
+        return 200, json.dumps({'name': name, **self.descriptions.get(name, {})})
@@ -0,0 +1,52 @@
+import os
+
+class HttpEvent():
+    """
+    The request, as the `python3-http` templates pass it to the handler
+    """
+
+    def __init__(self, body: bytes, headers: dict[str, str]):
+        self.body = body
+        self.headers = headers
+        self.method = 'GET'
+        self.query = {}
+        self.path = '/'
+
+def classic_function(handler_source: str, directory: str | None = None):
+    """
+    Runs a handler built by away the way the classic `python3` template does, as a function of a `FakeGateway`:
+    the printed return value is the response, and an exception is a 500. The handler is loaded from `directory`, if given
+    """
+    handler = {} if directory is None else {'__file__': os.path.join(directory, 'handler.py')}
+    exec(handler_source, handler)
+
+    def run(body, headers):
+        # the watchdog passes the request headers as environment variables
+        env = {'Http_' + k.replace('-', '_'): v for k, v in headers.items()}
+        os.environ.update(env)
+        try:
+            res = handler['handle'](body)
+        except Exception as e:
+            return 500, f'{type(e).__name__}: {e}'
+        finally:
+            for k in env: os.environ.pop(k, None)
+        return 200, '' if res is None else f'{res}\n'
+
+    return run
+
+def http_function(handler_source: str):
+    """
+    Runs a handler built by away for the `python3-http` templates the way the of-watchdog does, as a function
+    of a `FakeGateway`: the handler is loaded once and called with an event for each request. As in the template,
+    bodies sent as `application/octet-stream` are passed as they are, so generators are streamed, and others as text
+    """
+    handler = {}
+    exec(handler_source, handler)
+
+    def run(body, headers):
+        res = handler['handle'](HttpEvent(body.encode(), dict(headers.items())), None)
+        if res.get('headers', {}).get('Content-type') == 'application/octet-stream':
+            return res['statusCode'], res['body']
+        return res['statusCode'], str(res['body'])
+
+    return run
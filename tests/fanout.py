@@ -0,0 +1,131 @@
+from away import FaasConnection, builder
+from away.exceptions import FaasReturnedError
+from fake_gateway import FakeGateway
+from time import sleep
+import threading
+
+class ConcurrencyTracker():
+
+    def __init__(self):
+        self.current = 0
+        self.max = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, body, headers):
+        with self.lock:
+            self.current += 1
+            self.max = max(self.max, self.current)
+
+        # later items finish first
+        sleep(0.05 - int(body) * 0.001 if body.isdigit() else 0)
+
+        with self.lock:
+            self.current -= 1
+
+        if body == 'fail':
+            return 500, 'failed'
+        return 200, body
+
+import unittest
+class TestFanout(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.gateway = FakeGateway().__enter__()
+        cls.faas = FaasConnection(provider='127.0.0.1', port=cls.gateway.port, user=None, ensure_available=False)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.gateway.__exit__()
+
+    def setUp(self):
+        self.tracker = ConcurrencyTracker()
+        self.gateway.deploy('track', self.tracker)
+        self.track = builder.sync_from_name('track', self.faas)
+
+    def test_map_ordered(self):
+
+        res = list(self.track.map(range(20), concurrency=4))
+
+        self.assertEqual(res, [str(i) for i in range(20)])
+        self.assertLessEqual(self.tracker.max, 4)
+
+    def test_starmap_as_completed(self):
+
+        res = list(self.track.starmap([(i,) for i in range(20)], concurrency=5, ordered=False))
+
+        self.assertEqual(sorted(res, key=int), [str(i) for i in range(20)])
+        self.assertNotEqual(res, [str(i) for i in range(20)])
+        self.assertLessEqual(self.tracker.max, 5)
+
+    def test_lazy_consumption(self):
+
+        consumed = []
+        def args():
+            for i in range(100):
+                consumed.append(i)
+                yield (i,)
+
+        it = self.track.starmap(args(), concurrency=3)
+        next(it)
+        self.assertLessEqual(len(consumed), 4)
+        it.close()
+
+    def test_raises(self):
+
+        with self.assertRaises(FaasReturnedError):
+            list(self.track.map([1, 'fail', 3]))
+
+    def test_return_exceptions(self):
+
+        res = list(self.track.map([1, 'fail', 3], return_exceptions=True))
+
+        self.assertEqual(res[0], '1')
+        self.assertIsInstance(res[1], FaasReturnedError)
+        self.assertEqual(res[2], '3')
+
+class TestAsyncFanout(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.gateway = FakeGateway().__enter__()
+        self.tracker = ConcurrencyTracker()
+        self.gateway.deploy('track', self.tracker)
+        self.faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False)
+
+        @builder.faas_function(self.faas)
+        async def track(n):
+            pass
+
+        self.track = track
+
+    async def asyncTearDown(self):
+        await self.faas.aclose()
+
+    def tearDown(self):
+        self.gateway.__exit__()
+
+    async def test_map_ordered(self):
+
+        res = [r async for r in self.track.map(range(30), concurrency=6)]
+
+        self.assertEqual(res, [str(i) for i in range(30)])
+        self.assertLessEqual(self.tracker.max, 6)
+
+    async def test_starmap_as_completed(self):
+
+        res = [r async for r in self.track.starmap([(i,) for i in range(20)], concurrency=10, ordered=False)]
+
+        self.assertEqual(sorted(res, key=int), [str(i) for i in range(20)])
+        self.assertLessEqual(self.tracker.max, 10)
+
+    async def test_return_exceptions(self):
+
+        res = [r async for r in self.track.map([1, 'fail'], return_exceptions=True)]
+        self.assertEqual(res[0], '1')
+        self.assertIsInstance(res[1], FaasReturnedError)
+
+        with self.assertRaises(FaasReturnedError):
+            [r async for r in self.track.map([1, 'fail'])]
+
+if __name__ == '__main__':
+    unittest.main()
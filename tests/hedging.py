@@ -0,0 +1,138 @@
+from away import FaasConnection, builder
+from away.hedging import HedgePolicy, LatencyHistogram
+from fake_gateway import FakeGateway
+from time import sleep, monotonic
+import threading
+
+class SlowFirst():
+
+    def __init__(self, slow: float = 0.5):
+        self.slow = slow
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, body, headers):
+        with self.lock:
+            self.calls += 1
+            calls = self.calls
+
+        if calls == 1:
+            sleep(self.slow)
+            return 200, 'slow'
+        return 200, body
+
+import unittest
+class TestLatencyHistogram(unittest.TestCase):
+
+    def test_percentile(self):
+
+        latency = LatencyHistogram()
+        self.assertIsNone(latency.percentile(50))
+
+        for _ in range(90): latency.record(0.01)
+        for _ in range(10): latency.record(1)
+
+        self.assertAlmostEqual(latency.percentile(50), 0.01, delta=0.002)
+        self.assertAlmostEqual(latency.percentile(95), 1, delta=0.1)
+
+    def test_rolling(self):
+
+        latency = LatencyHistogram(size=10)
+        for _ in range(10): latency.record(1)
+        for _ in range(10): latency.record(0.01)
+
+        self.assertEqual(len(latency), 10)
+        self.assertAlmostEqual(latency.percentile(99), 0.01, delta=0.002)
+
+    def test_policy_delay(self):
+
+        latency = LatencyHistogram()
+        self.assertEqual(HedgePolicy(delay=0.2).hedge_delay(latency), 0.2)
+        self.assertIsNone(HedgePolicy(min_samples=5).hedge_delay(latency))
+
+        for _ in range(5): latency.record(0.1)
+        self.assertAlmostEqual(HedgePolicy(min_samples=5).hedge_delay(latency), 0.1, delta=0.01)
+
+class TestHedging(unittest.TestCase):
+
+    def setUp(self):
+        self.gateway = FakeGateway().__enter__()
+        self.fn = SlowFirst()
+        self.gateway.deploy('lookup', self.fn)
+        self.faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False)
+
+    def tearDown(self):
+        self.faas.close()
+        self.gateway.__exit__()
+
+    def test_hedge_wins(self):
+
+        lookup = builder.sync_from_name('lookup', self.faas, hedge=0.05)
+
+        start = monotonic()
+        self.assertEqual(lookup(1), '1')
+        self.assertLess(monotonic() - start, 0.4)
+        self.assertEqual(self.fn.calls, 2)
+        self.assertEqual((lookup.hedger.hedged, lookup.hedger.hedge_wins), (1, 1))
+
+    def test_no_hedge_when_fast(self):
+
+        self.fn.calls = 1 # no slow call
+        lookup = builder.sync_from_name('lookup', self.faas, hedge=0.2)
+
+        for i in range(5):
+            self.assertEqual(lookup(i), str(i))
+        self.assertEqual(self.fn.calls, 6)
+        self.assertEqual(lookup.hedger.hedged, 0)
+
+    def test_learned_delay(self):
+
+        self.fn.calls = 1
+        lookup = builder.sync_from_name('lookup', self.faas, hedge=HedgePolicy(percentile=90, min_samples=5))
+
+        for i in range(5): lookup(i)
+        self.assertEqual(lookup.hedger.hedged, 0)
+        self.assertEqual(len(lookup.hedger.latency), 5)
+        self.assertIsNotNone(lookup.hedger.policy.hedge_delay(lookup.hedger.latency))
+
+    def test_close(self):
+
+        lookup = builder.sync_from_name('lookup', self.faas, hedge=0.05)
+        before = set(threading.enumerate())
+        lookup(1)
+        threads = [thread for thread in set(threading.enumerate()) - before if thread.name.startswith('away-hedge')]
+        self.assertEqual(len(threads), 2)
+
+        self.faas.close()
+        for thread in threads: thread.join(1) # once the slow request ends
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+        # and the proxy can still hedge
+        self.assertEqual(lookup(2), '2')
+
+class TestAsyncHedging(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.gateway = FakeGateway().__enter__()
+        self.fn = SlowFirst()
+        self.gateway.deploy('lookup', self.fn)
+        self.faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False)
+
+    async def asyncTearDown(self):
+        await self.faas.aclose()
+
+    def tearDown(self):
+        self.gateway.__exit__()
+
+    async def test_hedge_wins(self):
+
+        @builder.faas_function(self.faas, hedge=0.05)
+        async def lookup(key):
+            pass
+
+        start = monotonic()
+        self.assertEqual(await lookup(1), '1')
+        self.assertLess(monotonic() - start, 0.4)
+        self.assertEqual((lookup.hedger.hedged, lookup.hedger.hedge_wins), (1, 1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+from away import FaasConnection, builder
+from away.builder import __build_handler_template as build_handler_template
+from away.protocol import make_client_pack_args_fn, make_client_unpack_args_fn
+from away.protocol import __safe_server_unpack_args as safe_server_unpack_args
+from away.protocol import __safe_server_pack_args as safe_server_pack_args
+from away.protocol import __safe_server_unpack_batch_args as safe_server_unpack_batch_args
+from fake_templates import HttpEvent, http_function
+from fake_gateway import FakeGateway
+from concurrent.futures import ThreadPoolExecutor
+import os
+import signal
+import time
+
+LOOKUP = {'a': 1, 'b': 2}
+
+def lookup(key):
+    return LOOKUP[key]
+
+def add_one(n):
+    return n + 1
+
+def slow_lookup(key):
+    time.sleep(0.2)
+    return LOOKUP[key]
+
+def count_up_to(n):
+    for i in range(n):
+        yield i
+
+import unittest
+class TestHttpHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = {}
+        exec(build_handler_template(lookup, safe_server_unpack_args, safe_server_pack_args, 0, http=True), self.handler)
+        self.pack = make_client_pack_args_fn()
+        self.unpack = make_client_unpack_args_fn()
+
+    def call(self, args, headers={}):
+        return self.handler['handle'](HttpEvent(self.pack(args).encode(), headers), None)
+
+    def test_call(self):
+
+        res = self.call(('a',))
+        self.assertEqual(res['statusCode'], 200)
+        self.assertEqual(self.unpack(res['body']), 1)
+
+        # the captured dependencies are only loaded once, with the handler
+        self.handler['LOOKUP']['c'] = 3
+        self.assertEqual(self.unpack(self.call(('c',))['body']), 3)
+
+    def test_errors(self):
+
+        res = self.call(('z',))
+        self.assertEqual(res['statusCode'], 500)
+        self.assertEqual(res['body'], "KeyError: 'z'")
+
+        res = self.call(('a', 'b'))
+        self.assertEqual(res['statusCode'], 500)
+        self.assertTrue(res['body'].startswith('AssertionError: The function takes 1 arguments'))
+
+    def test_headers(self):
+
+        res = self.call(('a',), headers={'X-Away-Time-Remaining': '0'})
+        self.assertEqual(res['statusCode'], 500)
+        self.assertTrue(res['body'].startswith('TimeoutError'))
+
+        # the headers of a request are not seen by the next ones
+        self.assertIsNone(os.getenv('Http_X_Away_Time_Remaining'))
+        self.assertEqual(self.call(('a',))['statusCode'], 200)
+
+    def test_deadline_disarmed(self):
+
+        # the process outlives the request, and must not be interrupted once it returns
+        res = self.call(('a',), headers={'X-Away-Time-Remaining': '60'})
+        self.assertEqual(res['statusCode'], 200)
+        self.assertEqual(signal.getitimer(signal.ITIMER_REAL), (0.0, 0.0))
+
+    def test_concurrent_requests(self):
+
+        handler = {}
+        exec(build_handler_template(slow_lookup, safe_server_unpack_args, safe_server_pack_args, 0, http=True), handler)
+        pack_v2 = make_client_pack_args_fn(protocol=2)
+
+        # each request is answered in its own protocol, without waiting for the others
+        bodies = [self.pack(('a',)), pack_v2(('b',))] * 2
+        start = time.time()
+        with ThreadPoolExecutor(len(bodies)) as pool:
+            res = list(pool.map(lambda body: handler['handle'](HttpEvent(body.encode(), {}), None), bodies))
+        self.assertLess(time.time() - start, 0.6)
+
+        unpack_v2 = make_client_unpack_args_fn(protocol=2)
+        self.assertEqual([(unpack_v2 if r['body'].startswith('%away-v2') else self.unpack)(r['body']) for r in res], [1, 2] * 2)
+        self.assertEqual([r['body'].startswith('%away-v2') for r in res], [False, True] * 2)
+
+    def test_stream(self):
+
+        handler = {}
+        exec(build_handler_template(count_up_to, safe_server_unpack_args, safe_server_pack_args, 0, stream=True, http=True), handler)
+
+        # the records are produced as the body is sent, not before handle returns
+        res = handler['handle'](HttpEvent(self.pack((10 ** 9,)).encode(), {}), None)
+        self.assertEqual(res['statusCode'], 200)
+        self.assertEqual(res['headers']['Content-type'], 'application/octet-stream')
+        self.assertEqual([next(res['body']) for _ in range(2)], ['=2\n0\n', '=2\n1\n'])
+        res['body'].close()
+
+        res = handler['handle'](HttpEvent(self.pack((1, 2)).encode(), {}), None)
+        self.assertEqual(res['statusCode'], 500)
+        self.assertTrue(res['body'].startswith('AssertionError'))
+
+class TestHttpTemplate(unittest.TestCase):
+
+    def setUp(self):
+        self.gateway = FakeGateway().__enter__()
+        self.faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False)
+
+    def tearDown(self):
+        self.faas.close()
+        self.gateway.__exit__()
+
+    def test_protocols(self):
+
+        self.gateway.deploy('lookup', http_function(build_handler_template(lookup, safe_server_unpack_args, safe_server_pack_args, hash(self.faas), http=True)))
+
+        for protocol in [1, 2]:
+            lookup_in_faas = builder.sync_from_name_with_protocol('lookup', self.faas, protocol=protocol, compression=True)
+            self.assertEqual([lookup_in_faas(key) for key in 'ab'], [1, 2])
+
+    def test_batch(self):
+
+        self.gateway.deploy('add-one', http_function(build_handler_template(add_one, safe_server_unpack_batch_args, safe_server_pack_args, hash(self.faas), batch=True, http=True)))
+        add_one_in_faas = builder.sync_from_name_with_protocol('add_one', self.faas, batch=True, protocol=2)
+
+        self.assertEqual(add_one_in_faas.batch([(i,) for i in range(10)]), list(range(1, 11)))
+
+    def test_stream(self):
+
+        self.gateway.deploy('count-up-to', http_function(build_handler_template(count_up_to, safe_server_unpack_args, safe_server_pack_args, hash(self.faas), stream=True, http=True)))
+        count_up_to_in_faas = builder.sync_from_name_with_protocol('count_up_to', self.faas, stream=True)
+
+        self.assertEqual(list(count_up_to_in_faas(5)), [0, 1, 2, 3, 4])
+
+    def test_unsupported_template(self):
+
+        self.assertRaises(AssertionError, builder.mirror_in_faas, lookup, self.faas, template='python27')
+
+if __name__ == '__main__':
+    unittest.main()
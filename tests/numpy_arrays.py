@@ -0,0 +1,85 @@
+from away import FaasConnection, builder
+from away.builder import __build_handler_template as build_handler_template
+from away.protocol import make_client_pack_args_fn, make_client_unpack_args_fn, V2_MARKER
+from away.protocol import __safe_server_unpack_args as safe_server_unpack_args
+from away.protocol import __safe_server_pack_args as safe_server_pack_args
+from fake_templates import classic_function
+from fake_gateway import FakeGateway
+from base64 import b64decode
+
+try:
+    import msgpack
+    import numpy as np
+except ImportError:
+    msgpack = np = None
+
+def scale(matrix, factor):
+    return matrix * factor
+
+import unittest
+@unittest.skipIf(msgpack is None or np is None, 'msgpack or numpy are not installed')
+class TestNumpyArrays(unittest.TestCase):
+
+    def setUp(self):
+        self.pack = make_client_pack_args_fn(safe_args=True, protocol=2)
+        self.unpack = make_client_unpack_args_fn(safe_args=True, protocol=2)
+
+    def assertArraysEqual(self, a, b):
+        self.assertEqual(a.dtype, b.dtype)
+        self.assertEqual(a.shape, b.shape)
+        self.assertTrue(np.array_equal(a, b))
+
+    def test_round_trip(self):
+
+        arrays = [
+            np.arange(12, dtype='<f8').reshape(3, 4),
+            np.arange(12, dtype='>i4').reshape(2, 3, 2),
+            np.asfortranarray(np.arange(6, dtype=np.uint8).reshape(2, 3)),
+            np.arange(10)[::3],
+            np.array(3.5),
+            np.zeros((0, 3), dtype=np.float32),
+            np.array([True, False]),
+            np.array(['a', 'bc']),
+        ]
+        for array in arrays:
+            (server_side_array, _) = safe_server_unpack_args(self.pack((array,)))
+            self.assertArraysEqual(server_side_array, array)
+            self.assertArraysEqual(self.unpack(safe_server_pack_args(server_side_array)), array)
+
+    def test_raw_buffer(self):
+
+        array = np.random.rand(100, 100)
+        packed = self.pack((array,))
+
+        # the payload is the buffer of the array and a small header, not a per-element representation
+        self.assertLess(len(b64decode(packed[len(V2_MARKER):])), array.nbytes + 64)
+
+        server_side_array, _ = safe_server_unpack_args(packed)
+        self.assertFalse(server_side_array.flags.writeable)
+
+    def test_scalars(self):
+
+        args = (np.int64(7), np.float32(0.5), np.bool_(True))
+        server_side_args, _ = safe_server_unpack_args(self.pack(args))
+
+        self.assertEqual(server_side_args, (7, 0.5, True))
+
+    def test_object_arrays(self):
+
+        # arrays without a raw buffer fall back to YAML
+        packed = make_client_pack_args_fn(safe_args=False, protocol=2)((np.array([{'a': 1}], dtype=object),))
+        self.assertFalse(packed.startswith(V2_MARKER))
+
+    def test_handler(self):
+
+        with FakeGateway() as gateway:
+            faas = FaasConnection(provider='127.0.0.1', port=gateway.port, user=None, ensure_available=False)
+            gateway.deploy('scale', classic_function(build_handler_template(scale, safe_server_unpack_args, safe_server_pack_args, hash(faas))))
+            scale_in_faas = builder.sync_from_name_with_protocol('scale', faas, protocol=2)
+
+            matrix = np.random.rand(50, 20).astype(np.float32)
+            self.assertArraysEqual(scale_in_faas(matrix, 2), matrix * 2)
+            faas.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+from away import FaasConnection, builder
+from fake_gateway import TrackingGateway
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+
+import unittest
+class TestPooling(unittest.TestCase):
+
+    def setUp(self):
+        self.gateway = TrackingGateway().__enter__()
+        self.gateway.deploy('echo', lambda body, headers: (200, body))
+        self.faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False)
+
+    def tearDown(self):
+        self.faas.close()
+        self.gateway.__exit__()
+
+    def test_reuses_connections(self):
+
+        echo = builder.sync_from_name('echo', self.faas)
+        for i in range(20):
+            self.assertEqual(echo(i), str(i))
+
+        self.assertEqual(self.gateway.requests, 20)
+        self.assertEqual(len(self.gateway.connections), 1)
+
+    def test_shared_between_proxies(self):
+
+        @builder.faas_function(self.faas)
+        def echo(n):
+            pass
+
+        echo_from_name = builder.sync_from_name('echo', self.faas)
+
+        echo(1)
+        echo_from_name(2)
+        self.faas.ensure_available()
+
+        self.assertEqual(len(self.gateway.connections), 1)
+
+    def test_pool_bounded_under_threads(self):
+
+        faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False, pool_maxsize=4, pool_block=True)
+        echo = builder.sync_from_name('echo', faas)
+
+        with ThreadPoolExecutor(16) as pool:
+            res = list(pool.map(echo, range(200)))
+
+        self.assertEqual(res, [str(i) for i in range(200)])
+        self.assertLessEqual(len(self.gateway.connections), 4)
+        faas.close()
+
+    def test_keepalive_timeout(self):
+
+        faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False, keepalive_timeout=0.05)
+        echo = builder.sync_from_name('echo', faas)
+
+        echo(1)
+        sleep(0.1)
+        echo(2)
+
+        self.assertEqual(len(self.gateway.connections), 2)
+        faas.close()
+
+    def test_keepalive_timeout_per_connection(self):
+
+        def slow(body, headers):
+            sleep(0.1)
+            return 200, body
+        self.gateway.deploy('slow', slow)
+        faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False, keepalive_timeout=0.2)
+        slow = builder.sync_from_name('slow', faas)
+        echo = builder.sync_from_name('echo', faas)
+
+        with ThreadPoolExecutor(2) as pool:
+            list(pool.map(slow, range(2)))
+        # one connection stays in use, the other one idles past the timeout
+        for i in range(8):
+            echo(i)
+            sleep(0.05)
+        with ThreadPoolExecutor(2) as pool:
+            list(pool.map(slow, range(2)))
+
+        self.assertEqual(len(self.gateway.connections), 3)
+        faas.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+from away import FaasConnection, builder
+from away.retry import RetryPolicy
+from away.exceptions import FaasReturnedError, FaasFunctionTimedOutError
+from fake_gateway import TrackingGateway
+from requests.exceptions import ConnectionError
+from time import monotonic
+import socket
+
+class Flaky():
+
+    def __init__(self, failures: int, status: int = 503):
+        self.failures = failures
+        self.status = status
+        self.calls = 0
+
+    def __call__(self, body, headers):
+        self.calls += 1
+        if self.calls <= self.failures:
+            return self.status, 'scaling up'
+        return 200, body
+
+def unused_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+import unittest
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_backoff(self):
+
+        policy = RetryPolicy(max_attempts=4, backoff=1, multiplier=2, max_backoff=3, jitter=False)
+        now = monotonic()
+
+        self.assertEqual(policy.next_delay(1, now, status_code=503), 1)
+        self.assertEqual(policy.next_delay(2, now, status_code=503), 2)
+        self.assertEqual(policy.next_delay(3, now, status_code=503), 3)
+        self.assertIsNone(policy.next_delay(4, now, status_code=503))
+
+    def test_what_is_retried(self):
+
+        policy = RetryPolicy(retry_connection_errors=False)
+        now = monotonic()
+
+        self.assertIsNone(policy.next_delay(1, now, status_code=500))
+        self.assertIsNone(policy.next_delay(1, now, error=ConnectionError()))
+        self.assertIsNotNone(policy.next_delay(1, now, status_code=429))
+
+    def test_jitter_and_retry_after(self):
+
+        policy = RetryPolicy(backoff=1)
+        now = monotonic()
+
+        self.assertTrue(all(0 <= policy.next_delay(1, now, status_code=503) <= 1 for _ in range(100)))
+        self.assertEqual(policy.next_delay(1, now, status_code=429, retry_after='7'), 7)
+
+    def test_deadline(self):
+
+        policy = RetryPolicy(max_attempts=10, backoff=1, jitter=False, deadline=1.5)
+        now = monotonic()
+
+        self.assertEqual(policy.next_delay(1, now, status_code=503), 1)
+        self.assertIsNone(policy.next_delay(2, now, status_code=503))
+
+class TestRetries(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.gateway = TrackingGateway().__enter__()
+        self.faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False)
+        self.policy = RetryPolicy(max_attempts=4, backoff=0.001)
+
+    async def asyncTearDown(self):
+        await self.faas.aclose()
+
+    def tearDown(self):
+        self.gateway.__exit__()
+
+    async def test_retries_transient_errors(self):
+
+        self.gateway.deploy('flaky', Flaky(2))
+        flaky = builder.sync_from_name('flaky', self.faas, retry=self.policy)
+
+        self.assertEqual(flaky('hi'), 'hi')
+        self.assertEqual(flaky.retry_stats.last_retries, 2)
+
+        flaky('hi')
+        self.assertEqual(flaky.retry_stats.last_retries, 0)
+        self.assertEqual(flaky.retry_stats.histogram, {2: 1, 0: 1})
+
+    def test_retried_streams_release_connections(self):
+
+        self.gateway.deploy('flaky', Flaky(3))
+        flaky = builder.sync_from_name('flaky', self.faas, retry=self.policy, stream=True, unpack_args=lambda e: e)
+
+        # the discarded responses give their connection back, and every attempt reuses the same one
+        self.assertRaises(Exception, list, flaky('hi'))
+        self.assertEqual(self.gateway.requests, 4)
+        self.assertEqual(len(self.gateway.connections), 1)
+
+    async def test_async_retries_transient_errors(self):
+
+        self.gateway.deploy('flaky', Flaky(3, status=502))
+        flaky = builder.async_from_name('flaky', self.faas, retry=self.policy)
+
+        self.assertEqual(await flaky('hi'), 'hi')
+        self.assertEqual(flaky.retry_stats.last_retries, 3)
+
+    async def test_gives_up(self):
+
+        self.gateway.deploy('flaky', Flaky(10, status=502))
+        flaky = builder.sync_from_name('flaky', self.faas, retry=self.policy)
+
+        self.assertRaises(FaasFunctionTimedOutError, flaky, 'hi')
+        self.assertEqual(self.gateway.requests, 4)
+
+    async def test_does_not_retry_errors(self):
+
+        self.gateway.deploy('flaky', Flaky(1, status=500))
+        flaky = builder.async_from_name('flaky', self.faas, retry=self.policy)
+
+        with self.assertRaises(FaasReturnedError):
+            await flaky('hi')
+        self.assertEqual(self.gateway.requests, 1)
+
+    async def test_connection_errors(self):
+
+        faas = FaasConnection(provider='127.0.0.1', port=unused_port(), user=None, ensure_available=False, retry=self.policy)
+        fn = builder.sync_from_name('fn', faas)
+        fn_async = builder.async_from_name('fn', faas)
+
+        self.assertRaises(ConnectionError, fn)
+        self.assertEqual(fn.retry_stats.last_retries, 3)
+        with self.assertRaises(OSError):
+            await fn_async()
+        self.assertEqual(fn_async.retry_stats.last_retries, 3)
+
+    async def test_default_from_connection(self):
+
+        self.gateway.deploy('flaky', Flaky(1))
+        faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False, retry=self.policy)
+
+        self.assertEqual(builder.sync_from_name('flaky', faas)('hi'), 'hi')
+        self.assertFalse(hasattr(builder.sync_from_name('flaky', faas, retry=False), 'retry_stats'))
+
+if __name__ == '__main__':
+    unittest.main()
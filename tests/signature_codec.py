@@ -0,0 +1,186 @@
+from away import FaasConnection, builder
+from away.builder import __build_handler_template as build_handler_template
+from away.protocol import make_client_pack_args_fn, make_client_unpack_args_fn, SignatureCodec, SIGNATURE_MARKER
+from away.protocol import __safe_server_unpack_args as safe_server_unpack_args
+from away.protocol import __safe_server_pack_args as safe_server_pack_args
+from away.__server_context import __server_request_state as server_request_state
+from fake_templates import classic_function
+from fake_gateway import FakeGateway, DescribingGateway
+import asyncio
+
+def sum_some_numbers(one: int, another: int) -> int:
+    return one + another
+
+def scale(x: float, by: int, negate: bool) -> float:
+    return -x * by if negate else x * by
+
+def first(values: list, n: int) -> list:
+    return values[:n]
+
+def describe(n: int):
+    return f'{n} items'
+
+def pi() -> float:
+    return 3.14159
+
+class Bodies():
+    """
+    Records the bodies of the requests and responses of a function
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.requests = []
+        self.responses = []
+
+    def __call__(self, body, headers):
+        status, res = self.fn(body, headers)
+        self.requests.append(body)
+        self.responses.append(res)
+        return status, res
+
+def server_namespace(codec):
+    """
+    Runs the server functions of a codec as they would be defined in a handler
+    """
+    namespace = {
+        safe_server_unpack_args.__name__: safe_server_unpack_args,
+        safe_server_pack_args.__name__: safe_server_pack_args,
+        '__server_request_state': server_request_state
+    }
+    exec(codec.server_source(safe_server_unpack_args.__name__, safe_server_pack_args.__name__), namespace)
+    return namespace['__away_signature_unpack_args'], namespace['__away_signature_pack_args']
+
+import unittest
+class TestSignatureCodec(unittest.TestCase):
+
+    def test_from_annotations(self):
+
+        self.assertEqual(SignatureCodec.from_annotations(sum_some_numbers).describe(), '<qq:<q')
+        self.assertEqual(SignatureCodec.from_annotations(scale).describe(), '<dq?:<d')
+        self.assertEqual(SignatureCodec.from_annotations(describe).describe(), '<q:-')
+        self.assertEqual(SignatureCodec.from_annotations(pi).describe(), '<:<d')
+
+        # arguments that are not scalars, or not annotated, cannot be specialized
+        self.assertIsNone(SignatureCodec.from_annotations(first))
+        self.assertIsNone(SignatureCodec.from_annotations(lambda a, b: a + b))
+        self.assertIsNone(SignatureCodec.from_annotations(lambda: None))
+
+        def with_strings(a: 'int', b: 'float') -> 'bool':
+            pass
+        self.assertEqual(SignatureCodec.from_annotations(with_strings).describe(), '<qd:<?')
+
+    def test_round_trip(self):
+
+        codec = SignatureCodec.from_annotations(scale)
+        pack = codec.make_client_pack_args_fn(make_client_pack_args_fn())
+        unpack = codec.make_client_unpack_args_fn(make_client_unpack_args_fn())
+        server_unpack_args, server_pack_args = server_namespace(codec)
+
+        packed = pack((1.5, 3, True))
+        self.assertTrue(packed.startswith(SIGNATURE_MARKER))
+        self.assertEqual(server_unpack_args(packed), ((1.5, 3, True), 3))
+
+        res = server_pack_args(scale(1.5, 3, True))
+        self.assertTrue(res.startswith(SIGNATURE_MARKER))
+        self.assertEqual(unpack(res + '\n'), -4.5)
+
+    def test_single_argument(self):
+
+        codec = SignatureCodec.from_annotations(describe)
+        server_unpack_args, server_pack_args = server_namespace(codec)
+
+        self.assertEqual(server_unpack_args(codec.make_client_pack_args_fn(make_client_pack_args_fn())((7,))), (7, 1))
+        # the result is not annotated: it uses the generic protocol
+        self.assertEqual(make_client_unpack_args_fn()(server_pack_args(describe(7))), '7 items')
+
+    def test_fallback(self):
+
+        codec = SignatureCodec.from_annotations(sum_some_numbers)
+        pack = codec.make_client_pack_args_fn(make_client_pack_args_fn())
+        server_unpack_args, server_pack_args = server_namespace(codec)
+
+        # values of other types than the annotated ones, including bool for int, and ints above 64 bits
+        for args in [(1, 2.0), (True, 2), (2**64, 1), ('1', 2), (1,)]:
+            packed = pack(args)
+            self.assertFalse(packed.startswith(SIGNATURE_MARKER))
+            self.assertEqual(server_unpack_args(packed), (list(args) if len(args) > 1 else args[0], len(args)))
+
+            # generic requests get generic responses, whatever the type of the result
+            self.assertFalse(server_pack_args(3).startswith(SIGNATURE_MARKER))
+
+        # results of other types than the annotated one
+        server_unpack_args(pack((1, 2)))
+        self.assertEqual(make_client_unpack_args_fn()(server_pack_args(1.5)), 1.5)
+
+    def test_handler(self):
+
+        with FakeGateway() as gateway:
+            faas = FaasConnection(provider='127.0.0.1', port=gateway.port, user=None, ensure_available=False)
+
+            for fn in [sum_some_numbers, pi]:
+                codec = SignatureCodec.from_annotations(fn)
+                gateway.deploy(fn.__name__.replace('_', '-'), classic_function(build_handler_template(fn, safe_server_unpack_args, safe_server_pack_args, hash(faas), signature_codec=codec)))
+
+            bodies = Bodies(gateway.functions['sum-some-numbers'])
+            gateway.deploy('sum-some-numbers', bodies)
+
+            codec = SignatureCodec.from_annotations(sum_some_numbers)
+            sum_in_faas = builder.sync_from_name(
+                'sum-some-numbers', faas,
+                pack_args=codec.make_client_pack_args_fn(make_client_pack_args_fn()),
+                unpack_args=codec.make_client_unpack_args_fn(make_client_unpack_args_fn())
+            )
+
+            self.assertEqual(sum_in_faas(2, 3), 5)
+            self.assertEqual(sum_in_faas(2**62, 2**62), 2**63)
+            self.assertEqual(sum_in_faas([1], [2]), [1, 2])
+
+            self.assertTrue(bodies.requests[0].startswith(SIGNATURE_MARKER))
+            self.assertTrue(bodies.responses[0].startswith(SIGNATURE_MARKER))
+            # results that overflow the fixed layout use the generic protocol
+            self.assertFalse(bodies.responses[1].startswith(SIGNATURE_MARKER))
+            self.assertFalse(bodies.requests[2].startswith(SIGNATURE_MARKER))
+
+            # proxies without the codec use the generic protocol
+            self.assertEqual(builder.sync_from_name_with_protocol('sum_some_numbers', faas)(4, 5), 9)
+            self.assertFalse(bodies.requests[-1].startswith(SIGNATURE_MARKER))
+
+            codec = SignatureCodec.from_annotations(pi)
+            pi_in_faas = builder.sync_from_name('pi', faas,
+                pack_args=codec.make_client_pack_args_fn(make_client_pack_args_fn()),
+                unpack_args=codec.make_client_unpack_args_fn(make_client_unpack_args_fn())
+            )
+            self.assertEqual(pi_in_faas(), 3.14159)
+            faas.close()
+
+    def test_from_annotation(self):
+
+        with DescribingGateway() as gateway:
+            faas = FaasConnection(provider='127.0.0.1', port=gateway.port, user=None, ensure_available=False)
+            faas.auth_address = faas.address
+
+            codec = SignatureCodec.from_annotations(sum_some_numbers)
+            gateway.deploy('sum-some-numbers', classic_function(build_handler_template(sum_some_numbers, safe_server_unpack_args, safe_server_pack_args, hash(faas), signature_codec=codec)))
+            gateway.descriptions['sum-some-numbers'] = {'annotations': {'built-with': 'away', 'away-protocol': '1', 'away-signature': codec.describe()}}
+            bodies = Bodies(gateway.functions['sum-some-numbers'])
+            gateway.deploy('sum-some-numbers', bodies)
+
+            # the layout is read from the annotations, along with the codec
+            self.assertEqual(builder.sync_from_name_with_protocol('sum_some_numbers', faas)(4, 5), 9)
+            self.assertTrue(bodies.requests[-1].startswith(SIGNATURE_MARKER))
+            self.assertTrue(bodies.responses[-1].startswith(SIGNATURE_MARKER))
+            self.assertEqual(gateway.fingerprint_requests, 1)
+
+            # values that do not fit the layout use the generic protocol
+            self.assertEqual(builder.sync_from_name_with_protocol('sum_some_numbers', faas)([1], [2]), [1, 2])
+            self.assertFalse(bodies.requests[-1].startswith(SIGNATURE_MARKER))
+
+            # async proxies read it when they are built
+            sum_in_faas = builder.async_from_name_with_protocol('sum_some_numbers', faas)
+            self.assertEqual(asyncio.run(sum_in_faas(6, 7)), 13)
+            self.assertTrue(bodies.requests[-1].startswith(SIGNATURE_MARKER))
+            faas.close()
+
+if __name__ == '__main__':
+    unittest.main()
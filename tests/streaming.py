@@ -0,0 +1,159 @@
+from away import FaasConnection, builder
+from away.builder import __build_handler_template as build_handler_template
+from away.protocol import __safe_server_unpack_args as safe_server_unpack_args
+from away.protocol import __safe_server_pack_args as safe_server_pack_args
+from away.__streaming import RecordDecoder
+from away.exceptions import FaasReturnedError
+from fake_templates import classic_function, http_function
+from fake_gateway import FakeGateway
+import threading
+
+def count_up(n):
+    for i in range(n):
+        yield {'i': i}
+
+def fail_after(n):
+    for i in range(n):
+        yield i
+    raise ValueError('no more')
+
+import unittest
+class TestRecordDecoder(unittest.TestCase):
+
+    def test_split_anywhere(self):
+
+        data = '=5\nhello\n=4\nñé\n!4\nfail\n'.encode()
+        for split in range(len(data)):
+            decoder = RecordDecoder()
+            records = decoder.feed(data[:split]) + decoder.feed(data[split:])
+            decoder.close()
+
+            self.assertEqual(records, [(True, 'hello'), (True, 'ñé'), (False, 'fail')])
+
+    def test_truncated(self):
+
+        decoder = RecordDecoder()
+        decoder.feed(b'=10\nhel')
+
+        with self.assertRaises(FaasReturnedError):
+            decoder.close()
+
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.gateway = FakeGateway().__enter__()
+        self.faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False)
+        for fn in [count_up, fail_after]:
+            handler = build_handler_template(fn, safe_server_unpack_args, safe_server_pack_args, hash(self.faas), stream=True)
+            self.gateway.deploy(fn.__name__.replace('_', '-'), classic_function(handler))
+            handler = build_handler_template(fn, safe_server_unpack_args, safe_server_pack_args, hash(self.faas), stream=True, http=True)
+            self.gateway.deploy(fn.__name__.replace('_', '-') + '-chunked', http_function(handler))
+
+    def tearDown(self):
+        self.faas.close()
+        self.gateway.__exit__()
+
+    def test_classic_handler(self):
+
+        count_up_in_faas = builder.sync_from_name_with_protocol('count_up', self.faas, stream=True)
+
+        self.assertEqual(list(count_up_in_faas(3)), [{'i': 0}, {'i': 1}, {'i': 2}])
+        self.assertEqual(list(count_up_in_faas(0)), [])
+
+    def test_generator_stub(self):
+
+        @builder.faas_function_with_protocol(self.faas)
+        def count_up_chunked(n):
+            yield
+
+        self.assertEqual(list(count_up_chunked(100)), [{'i': i} for i in range(100)])
+
+    def test_items_arrive_before_the_end(self):
+
+        produced = threading.Event()
+        consumed = threading.Event()
+        def slow_stream(body, headers):
+            def records():
+                yield '=1\na'
+                produced.set()
+                consumed.wait(5)
+                yield '=1\nb'
+            return 200, records()
+        self.gateway.deploy('slow-stream', slow_stream)
+
+        items = builder.sync_from_name('slow_stream', self.faas, stream=True)(1)
+        self.assertEqual(next(items), 'a')
+        self.assertTrue(produced.is_set())
+        consumed.set()
+        self.assertEqual(list(items), ['b'])
+
+    def test_error_ends_stream(self):
+
+        fail_after_in_faas = builder.sync_from_name_with_protocol('fail_after_chunked', self.faas, stream=True)
+
+        res = []
+        with self.assertRaises(FaasReturnedError):
+            for item in fail_after_in_faas(2):
+                res.append(item)
+        self.assertEqual(res, [0, 1])
+
+    def test_stop_early(self):
+
+        count_up_in_faas = builder.sync_from_name_with_protocol('count_up_chunked', self.faas, stream=True)
+
+        for _ in range(3):
+            items = count_up_in_faas(1000)
+            self.assertEqual(next(items), {'i': 0})
+            items.close()
+
+        self.assertEqual(len(list(count_up_in_faas(10))), 10)
+
+class TestAsyncStreaming(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.gateway = FakeGateway().__enter__()
+        self.faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False, async_pool_maxsize=1)
+        for fn in [count_up, fail_after]:
+            handler = build_handler_template(fn, safe_server_unpack_args, safe_server_pack_args, hash(self.faas), stream=True, http=True)
+            self.gateway.deploy(fn.__name__.replace('_', '-'), http_function(handler))
+
+    async def asyncTearDown(self):
+        await self.faas.aclose()
+
+    def tearDown(self):
+        self.gateway.__exit__()
+
+    async def test_async_generator_stub(self):
+
+        @builder.faas_function_with_protocol(self.faas)
+        async def count_up(n):
+            yield
+
+        self.assertEqual([item async for item in count_up(50)], [{'i': i} for i in range(50)])
+
+    async def test_stop_early(self):
+
+        @builder.faas_function_with_protocol(self.faas)
+        async def count_up(n):
+            yield
+
+        # a single pooled connection: a stream closed early must give it back
+        for _ in range(3):
+            items = count_up(1000)
+            self.assertEqual(await items.__anext__(), {'i': 0})
+            await items.aclose()
+
+        self.assertEqual(len([item async for item in count_up(10)]), 10)
+
+    async def test_error_ends_stream(self):
+
+        fail_after_in_faas = builder.async_from_name_with_protocol('fail_after', self.faas, stream=True)
+
+        res = []
+        with self.assertRaises(FaasReturnedError):
+            async for item in fail_after_in_faas(2):
+                res.append(item)
+        self.assertEqual(res, [0, 1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+from away import FaasConnection, builder, timeouts
+from away.builder import __build_handler_template as build_handler_template
+from away.protocol import __safe_server_unpack_args as safe_server_unpack_args
+from away.protocol import __safe_server_pack_args as safe_server_pack_args
+from away.protocol import __safe_server_unpack_batch_args as safe_server_unpack_batch_args
+from away.protocol import make_client_pack_args_fn
+from away.retry import RetryPolicy
+from away.exceptions import FaasFunctionTimedOutError, FaasReturnedError
+from fake_gateway import FakeGateway
+from time import sleep, monotonic
+import signal
+import requests
+import yaml
+import os
+
+pack_args = make_client_pack_args_fn()
+
+class Slow():
+
+    def __init__(self, duration: float = 0.5, status: int = 200):
+        self.duration = duration
+        self.status = status
+        self.headers = []
+
+    def __call__(self, body, headers):
+        self.headers.append(dict(headers))
+        sleep(self.duration)
+        return self.status, body
+
+def busy(seconds):
+    import time as clock
+    started = clock.time()
+    while clock.time() - started < seconds:
+        pass
+    return 'done'
+
+import unittest
+class TestTimeouts(unittest.TestCase):
+
+    def setUp(self):
+        self.gateway = FakeGateway().__enter__()
+        self.slow = Slow()
+        self.gateway.deploy('slow', self.slow)
+        self.faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False)
+
+    def tearDown(self):
+        self.faas.close()
+        self.gateway.__exit__()
+
+    def test_timeout(self):
+
+        slow = builder.sync_from_name('slow', self.faas, timeout=0.1)
+
+        start = monotonic()
+        with self.assertRaises(FaasFunctionTimedOutError):
+            slow(1)
+        self.assertLess(monotonic() - start, 0.4)
+
+    def test_slow_body(self):
+
+        def trickle(body, headers):
+            # every chunk comes well within the timeout, the whole body does not
+            def chunks():
+                for _ in range(6):
+                    sleep(0.05)
+                    yield '- 1\n'
+            return 200, chunks()
+        self.gateway.deploy('trickle', trickle)
+        trickle = builder.sync_from_name('trickle', self.faas, timeout=0.15)
+
+        start = monotonic()
+        with self.assertRaises(FaasFunctionTimedOutError):
+            trickle(1)
+        self.assertLess(monotonic() - start, 0.3)
+
+    def test_connect_timeout(self):
+
+        slow = builder.sync_from_name('slow', self.faas, timeout=0.1)
+
+        def connect_timeout(*args, **kwargs):
+            raise requests.exceptions.ConnectTimeout('the gateway did not accept the connection')
+        self.faas.get_session().get = connect_timeout
+
+        with self.assertRaises(FaasFunctionTimedOutError):
+            slow(1)
+
+    def test_deadline_block(self):
+
+        slow = builder.sync_from_name('slow', self.faas)
+
+        with timeouts.deadline(0.1):
+            with self.assertRaises(FaasFunctionTimedOutError):
+                slow(1)
+
+        self.slow.duration = 0
+        self.assertEqual(slow(1), '1') # no limits outside of the block
+
+    def test_deadline_header(self):
+
+        self.slow.duration = 0
+        slow = builder.sync_from_name('slow', self.faas, deadline=5)
+
+        slow(1)
+        # the time left, not a timestamp: the clocks of the client and of the cluster may disagree
+        self.assertAlmostEqual(float(self.slow.headers[0][timeouts.DEADLINE_HEADER]), 5, delta=0.5)
+
+    def test_nested_deadlines(self):
+
+        self.slow.duration = 0
+        slow = builder.sync_from_name('slow', self.faas)
+
+        with timeouts.deadline(5):
+            with timeouts.deadline(10):
+                slow(1)
+        self.assertAlmostEqual(float(self.slow.headers[0][timeouts.DEADLINE_HEADER]), 5, delta=0.5)
+
+    def test_no_retry_past_deadline(self):
+
+        self.slow.duration, self.slow.status = 0, 503
+        slow = builder.sync_from_name('slow', self.faas, deadline=0.2,
+            retry=RetryPolicy(max_attempts=10, backoff=0.5, jitter=False))
+
+        with self.assertRaises(FaasReturnedError):
+            slow(1)
+        self.assertEqual(len(self.slow.headers), 1)
+
+class TestHandlerDeadline(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = {}
+        exec(build_handler_template(busy, safe_server_unpack_args, safe_server_pack_args, 0), self.handler)
+
+    def tearDown(self):
+        os.environ.pop('Http_X_Away_Time_Remaining', None)
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+    def test_passed_deadline(self):
+
+        os.environ['Http_X_Away_Time_Remaining'] = '0'
+        with self.assertRaises(TimeoutError):
+            self.handler['handle']('- 0\n')
+
+    def test_abandons_work(self):
+
+        os.environ['Http_X_Away_Time_Remaining'] = '0.1'
+
+        start = monotonic()
+        with self.assertRaises(TimeoutError):
+            self.handler['handle']('- 10\n')
+        self.assertLess(monotonic() - start, 1)
+
+    def test_batch_deadline(self):
+
+        handler = {}
+        exec(build_handler_template(busy, safe_server_unpack_batch_args, safe_server_pack_args, 0, batch=True), handler)
+        os.environ['Http_X_Away_Time_Remaining'] = '0.3'
+
+        # the deadline is counted from the arrival of the request: the bundles left once it passes fail
+        results = yaml.safe_load(handler['handle'](pack_args([(0.2,), (0.2,), (0.2,)])))
+        self.assertEqual([ok for ok, _ in results], [True, False, False])
+        self.assertTrue(all(error.startswith('TimeoutError') for _, error in results[1:]))
+
+    def test_no_deadline(self):
+
+        self.assertIn('done', self.handler['handle']('- 0\n'))
+
+class TestAsyncTimeouts(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.gateway = FakeGateway().__enter__()
+        self.gateway.deploy('slow', Slow())
+        self.faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False)
+
+    async def asyncTearDown(self):
+        await self.faas.aclose()
+
+    def tearDown(self):
+        self.gateway.__exit__()
+
+    async def test_timeout(self):
+
+        @builder.faas_function(self.faas, timeout=0.1)
+        async def slow(n):
+            pass
+
+        start = monotonic()
+        with self.assertRaises(FaasFunctionTimedOutError):
+            await slow(1)
+        self.assertLess(monotonic() - start, 0.4)
+
+    async def test_deadline_block(self):
+
+        @builder.faas_function(self.faas)
+        async def slow(n):
+            pass
+
+        with timeouts.deadline(0.1):
+            with self.assertRaises(FaasFunctionTimedOutError):
+                await slow(1)
+
+if __name__ == '__main__':
+    unittest.main()
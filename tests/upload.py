@@ -0,0 +1,175 @@
+from away import FaasConnection, builder
+from away.builder import __build_handler_template as build_handler_template
+from away.protocol import __safe_server_unpack_args as safe_server_unpack_args
+from away.protocol import __safe_server_pack_args as safe_server_pack_args
+from away.protocol import make_client_stream_pack_args_fn, make_client_pack_args_fn, make_client_unpack_args_fn
+from away.retry import RetryPolicy
+from fake_templates import classic_function
+from fake_gateway import FakeGateway
+import yaml
+import io
+
+def summarize(data, items, label):
+    return [len(data), sum(item['n'] for item in items), label]
+
+class ChunkCountingGateway(FakeGateway):
+    """
+    A `FakeGateway` that counts the requests with a chunked body
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunked_requests = 0
+
+    def on_request(self, request):
+        super().on_request(request)
+        if request.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            with self.lock:
+                self.chunked_requests += 1
+
+import unittest
+class TestStreamedArgs(unittest.TestCase):
+
+    def setUp(self):
+        self.pack = make_client_stream_pack_args_fn(safe_args=True)
+
+    def unpack(self, streamed):
+        return yaml.safe_load(b''.join(streamed))
+
+    def test_round_trip(self):
+
+        args = (1, 'a\n\nb', {'k': [1, 2]}, b'\x00\x01\x02\x03', [], list(range(3000)))
+        self.assertEqual(self.unpack(self.pack(args)), list(args))
+        self.assertEqual(self.unpack(self.pack(())), [])
+
+    def test_files_and_iterators(self):
+
+        args = (io.BytesIO(b'abcd' * 10000), io.StringIO('héllo'), iter({'n': i} for i in range(2500)), iter([]))
+
+        self.assertEqual(self.unpack(self.pack(args)), [b'abcd' * 10000, 'héllo'.encode(), [{'n': i} for i in range(2500)], []])
+
+    def test_chunks(self):
+
+        chunks = list(self.pack((b'x' * 2**20,)))
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) < 2**17 for chunk in chunks))
+
+    def test_iterate_again(self):
+
+        data = io.BytesIO(b'0123456789')
+        data.read(4)
+        streamed = self.pack((data,))
+
+        self.assertEqual(self.unpack(streamed), [b'456789'])
+        self.assertEqual(self.unpack(streamed), [b'456789'])
+
+        streamed = self.pack((iter([1, 2]),))
+        self.unpack(streamed)
+        with self.assertRaises(AssertionError):
+            self.unpack(streamed)
+
+class RecordedReads(io.BytesIO):
+
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.sizes = []
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.sizes.append(len(data))
+        return data
+
+class TestFileLikeRequests(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = {}
+        exec(build_handler_template(summarize, safe_server_unpack_args, safe_server_pack_args, 0), self.handler)
+        self.args = (io.BytesIO(b'a' * 2**20), ({'n': 1} for _ in range(5000)), 'x')
+
+    def test_binary(self):
+
+        body = RecordedReads(b''.join(make_client_stream_pack_args_fn(safe_args=True)(self.args)))
+
+        self.assertEqual(yaml.safe_load(self.handler['handle'](body)), [2**20, 5000, 'x'])
+        # YAML is parsed as it is read
+        self.assertLess(max(body.sizes), 2**20)
+
+    def test_text(self):
+
+        body = io.StringIO(b''.join(make_client_stream_pack_args_fn(safe_args=True)(self.args)).decode())
+
+        self.assertEqual(yaml.safe_load(self.handler['handle'](body)), [2**20, 5000, 'x'])
+
+    def test_v2(self):
+
+        body = io.BytesIO(make_client_pack_args_fn(protocol=2)((b'ab', [{'n': 3}], 'y')).encode())
+
+        self.assertEqual(make_client_unpack_args_fn(protocol=2)(self.handler['handle'](body)), [2, 3, 'y'])
+
+class TestUpload(unittest.TestCase):
+
+    def setUp(self):
+        self.gateway = ChunkCountingGateway().__enter__()
+        self.faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False)
+        handler = build_handler_template(summarize, safe_server_unpack_args, safe_server_pack_args, hash(self.faas))
+        self.gateway.deploy('summarize', classic_function(handler))
+
+    def tearDown(self):
+        self.faas.close()
+        self.gateway.__exit__()
+
+    def test_sync(self):
+
+        summarize_in_faas = builder.sync_from_name_with_protocol('summarize', self.faas, stream_args=True)
+
+        res = summarize_in_faas(io.BytesIO(b'a' * 3 * 2**20), ({'n': 1} for _ in range(5000)), 'x')
+        self.assertEqual(res, [3 * 2**20, 5000, 'x'])
+        self.assertEqual(self.gateway.chunked_requests, 1)
+
+    def test_retried(self):
+
+        flaky = {'calls': 0}
+        run = self.gateway.functions['summarize']
+        def summarize_flaky(body, headers):
+            flaky['calls'] += 1
+            return (503, 'scaling up') if flaky['calls'] == 1 else run(body, headers)
+        self.gateway.deploy('summarize', summarize_flaky)
+
+        summarize_in_faas = builder.sync_from_name_with_protocol('summarize', self.faas, stream_args=True,
+            retry=RetryPolicy(backoff=0.01))
+
+        self.assertEqual(summarize_in_faas(io.BytesIO(b'abc'), [{'n': 2}], 'y'), [3, 2, 'y'])
+        self.assertEqual(flaky['calls'], 2)
+
+    def test_incompatible_options(self):
+
+        with self.assertRaises(AssertionError):
+            builder.sync_from_name_with_protocol('summarize', self.faas, stream_args=True, cache=True)
+
+class TestAsyncUpload(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.gateway = ChunkCountingGateway().__enter__()
+        self.faas = FaasConnection(provider='127.0.0.1', port=self.gateway.port, user=None, ensure_available=False)
+        handler = build_handler_template(summarize, safe_server_unpack_args, safe_server_pack_args, hash(self.faas))
+        self.gateway.deploy('summarize', classic_function(handler))
+
+    async def asyncTearDown(self):
+        await self.faas.aclose()
+
+    def tearDown(self):
+        self.gateway.__exit__()
+
+    async def test_async(self):
+
+        @builder.faas_function_with_protocol(self.faas, stream_args=True)
+        async def summarize(data, items, label):
+            pass
+
+        res = await summarize(io.BytesIO(b'a' * 2**20), ({'n': 2} for _ in range(100)), 'z')
+        self.assertEqual(res, [2**20, 200, 'z'])
+        self.assertEqual(self.gateway.chunked_requests, 1)
+
+if __name__ == '__main__':
+    unittest.main()